@@ -0,0 +1,8 @@
+# Loaded by gunicorn from the working directory
+
+
+def post_worker_init(worker):
+    # Each worker opens its own MongoDB pool; the (preload) master never does
+    from mongo_credit.connection import warm_up_worker
+
+    warm_up_worker()
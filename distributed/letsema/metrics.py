@@ -0,0 +1,294 @@
+"""
+Per-request instrumentation of SQL, FDW and MongoDB time.
+
+RequestMetricsMiddleware opens a RequestStats for every request. Each
+database connection gets record_query as an execute wrapper when it is
+created, and the MongoDB client a MongoCommandListener (see
+mongo_credit.connection); both add to the stats of the request they run
+for, including queries run on MFI cluster workers, which MFICluster.submit
+runs in the submitting request's context. SQL is split by database alias
+and by the FDW cluster schema (or snapshot schema) it reads.
+
+Responses get a Server-Timing header, the figures feed the histograms
+served in Prometheus text format by metrics_view, and any query or command
+slower than SLOW_QUERY_THRESHOLD_MS is logged to letsema.slow_queries,
+inside a request or not. Metrics are kept per process.
+"""
+import contextvars
+import functools
+import hmac
+import logging
+import re
+import threading
+import time
+from collections import defaultdict
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse, HttpResponseForbidden
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+slow_logger = logging.getLogger('letsema.slow_queries')
+
+METRICS_PATH = '/metrics'
+
+# Upper bounds in seconds of the latency histogram buckets
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+METRICS = {
+    'letsema_http_request_duration_seconds': ('histogram', 'Request latency by endpoint'),
+    'letsema_sql_queries_total': ('counter', 'SQL queries by endpoint, alias and FDW schema'),
+    'letsema_sql_request_duration_seconds': ('histogram', 'SQL time per request by endpoint, alias and FDW schema'),
+    'letsema_mongo_commands_total': ('counter', 'MongoDB commands by endpoint'),
+    'letsema_mongo_request_duration_seconds': ('histogram', 'MongoDB time per request by endpoint'),
+}
+
+_current = contextvars.ContextVar('letsema_request_stats', default=None)
+
+
+class RequestStats:
+    """Query and command totals of one request; shared with its worker threads"""
+
+    def __init__(self):
+        self.endpoint = None
+        self.sql = defaultdict(lambda: [0, 0.0])  # (alias, schema): [count, seconds]
+        self.mongo = [0, 0.0]
+        self._lock = threading.Lock()
+
+    def add_query(self, alias, schema, seconds):
+        with self._lock:
+            totals = self.sql[(alias, schema)]
+            totals[0] += 1
+            totals[1] += seconds
+
+    def add_command(self, seconds):
+        with self._lock:
+            self.mongo[0] += 1
+            self.mongo[1] += seconds
+
+
+def current_stats():
+    """Stats of the request being served, None outside a request"""
+    return _current.get()
+
+
+def _slow_threshold():
+    return getattr(settings, 'SLOW_QUERY_THRESHOLD_MS', 500) / 1000
+
+
+def _endpoint():
+    stats = _current.get()
+    return (stats.endpoint or 'unmatched') if stats else '-'
+
+
+@functools.lru_cache(maxsize=8)
+def _schema_pattern(clusters):
+    names = '|'.join(re.escape(cluster) for cluster in sorted(clusters, key=len, reverse=True))
+    return re.compile(rf'\b((?:{names})(?:_snapshot)?)\.')
+
+
+def query_schema(sql):
+    """FDW cluster or snapshot schema a statement reads, '' for none"""
+    clusters = tuple(getattr(settings, 'MFI_CLUSTER_SETTINGS', {}))
+    if not clusters or not isinstance(sql, str):
+        return ''
+    match = _schema_pattern(clusters).search(sql)
+    return match.group(1) if match else ''
+
+
+def record_query(execute, sql, params, many, context):
+    """Execute wrapper timing every statement run on a connection"""
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        seconds = time.perf_counter() - started
+        alias = context['connection'].alias
+        schema = query_schema(sql)
+        stats = _current.get()
+        if stats is not None:
+            stats.add_query(alias, schema, seconds)
+        if seconds >= _slow_threshold():
+            slow_logger.warning(
+                f"Slow query on {alias}{'/' + schema if schema else ''} for {_endpoint()} "
+                f"took {seconds * 1000:.1f} ms: {str(sql)[:1000]}"
+            )
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    # Outermost, so execute_wrapper() blocks entered before the connection
+    # was opened still pop their own wrapper
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_query)
+
+
+connection_created.connect(install_query_recorder, dispatch_uid='letsema.metrics.install_query_recorder')
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    """Add MongoDB command latency to the current request's stats"""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self._record(event)
+
+    def failed(self, event):
+        self._record(event)
+
+    def _record(self, event):
+        seconds = event.duration_micros / 1_000_000
+        stats = _current.get()
+        if stats is not None:
+            stats.add_command(seconds)
+        if seconds >= _slow_threshold():
+            slow_logger.warning(
+                f"Slow MongoDB {event.command_name} on {event.database_name} for {_endpoint()} "
+                f"took {seconds * 1000:.1f} ms"
+            )
+
+
+class _Histogram:
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.sum += value
+
+
+def _labels(labels, **extra):
+    pairs = [*labels, *extra.items()]
+    if not pairs:
+        return ''
+    escaped = (
+        f'{name}="' + str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+        for name, value in pairs
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+class MetricsRegistry:
+    """In-process counters and histograms rendered in Prometheus text format"""
+
+    def __init__(self):
+        self._values = defaultdict(dict)  # metric: {labels: value or _Histogram}
+        self._lock = threading.Lock()
+
+    def inc(self, metric, labels, value=1):
+        labels = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[metric][labels] = self._values[metric].get(labels, 0) + value
+
+    def observe(self, metric, labels, value):
+        labels = tuple(sorted(labels.items()))
+        with self._lock:
+            histogram = self._values[metric].get(labels)
+            if histogram is None:
+                histogram = self._values[metric][labels] = _Histogram()
+            histogram.observe(value)
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for metric, (kind, description) in METRICS.items():
+                lines.append(f"# HELP {metric} {description}")
+                lines.append(f"# TYPE {metric} {kind}")
+                for labels, value in sorted(self._values.get(metric, {}).items()):
+                    if kind == 'counter':
+                        lines.append(f"{metric}{_labels(labels)} {value}")
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(BUCKETS, value.counts):
+                        cumulative += count
+                        lines.append(f"{metric}_bucket{_labels(labels, le=bound)} {cumulative}")
+                    lines.append(f"{metric}_bucket{_labels(labels, le='+Inf')} {value.count}")
+                    lines.append(f"{metric}_sum{_labels(labels)} {value.sum}")
+                    lines.append(f"{metric}_count{_labels(labels)} {value.count}")
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+
+registry = MetricsRegistry()
+
+
+def record_request(stats, method, seconds):
+    endpoint = stats.endpoint or 'unmatched'
+    registry.observe('letsema_http_request_duration_seconds', {'endpoint': endpoint, 'method': method}, seconds)
+    for (alias, schema), (count, sql_seconds) in list(stats.sql.items()):
+        labels = {'endpoint': endpoint, 'alias': alias, 'schema': schema}
+        registry.inc('letsema_sql_queries_total', labels, count)
+        registry.observe('letsema_sql_request_duration_seconds', labels, sql_seconds)
+    if stats.mongo[0]:
+        registry.inc('letsema_mongo_commands_total', {'endpoint': endpoint}, stats.mongo[0])
+        registry.observe('letsema_mongo_request_duration_seconds', {'endpoint': endpoint}, stats.mongo[1])
+
+
+def server_timing(stats, seconds):
+    """Server-Timing header value for a request's stats"""
+    entries = []
+    for (alias, schema), (count, sql_seconds) in sorted(stats.sql.items()):
+        name = f"sql-{alias}-{schema}" if schema else f"sql-{alias}"
+        entries.append(f'{name};dur={sql_seconds * 1000:.1f};desc="{count} queries"')
+    if stats.mongo[0]:
+        entries.append(f'mongo;dur={stats.mongo[1] * 1000:.1f};desc="{stats.mongo[0]} commands"')
+    entries.append(f'total;dur={seconds * 1000:.1f}')
+    return ', '.join(entries)
+
+
+class RequestMetricsMiddleware:
+    """Collect per-request stats, add Server-Timing and feed the metrics registry"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.path == METRICS_PATH:
+            return self.get_response(request)
+
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        seconds = time.perf_counter() - started
+
+        try:
+            record_request(stats, request.method, seconds)
+            response['Server-Timing'] = server_timing(stats, seconds)
+        except Exception as e:
+            logger.error(f"Could not record request metrics: {str(e)}")
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        stats = _current.get()
+        if stats is not None and request.resolver_match is not None:
+            # The route pattern, not the path, keeps label cardinality bounded
+            stats.endpoint = request.resolver_match.route or request.resolver_match.view_name
+        return None
+
+
+def metrics_view(request):
+    """
+    Prometheus scrape endpoint; requires 'Bearer <METRICS_TOKEN>'. Without a
+    token configured it is only served under DEBUG or with METRICS_PUBLIC.
+    """
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if not token:
+        if not (settings.DEBUG or getattr(settings, 'METRICS_PUBLIC', False)):
+            return HttpResponseForbidden()
+    elif not hmac.compare_digest(request.headers.get('Authorization', ''), f"Bearer {token}"):
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
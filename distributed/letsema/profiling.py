@@ -0,0 +1,248 @@
+"""
+On-demand sampling profiler for live requests.
+
+ProfilingMiddleware profiles a request when an admin sends the
+PROFILE_HEADER header, or at random at the endpoint's rate in
+PROFILE_SAMPLE_RATES (keyed by URL name, e.g. {'credit-history': 0.01}).
+A profiled request's view runs while a StackSampler thread reads the
+request thread's Python stack every PROFILE_INTERVAL_MS; nothing is traced
+or hooked in the profiled thread itself, so the overhead is the sampler's
+wake-ups. Only the request thread is sampled, not MFI cluster workers.
+
+Samples are stored as collapsed stacks (the flamegraph.pl / speedscope
+input format), merged into one RequestProfile document per endpoint and
+PROFILE_WINDOW_SECONDS window. Admins list and download them through
+ProfileListView and ProfileDownloadView. Documents expire after
+PROFILE_RETENTION_DAYS.
+"""
+import hashlib
+import logging
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone as dt_timezone
+import mongoengine
+from bson import ObjectId
+from bson.errors import InvalidId
+from django.conf import settings
+from django.http import HttpResponse
+from rest_framework.exceptions import NotFound
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from mongo_credit.connection import get_mongo_client
+from mongo_credit.permissions import IsAdmin
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = 'X-Letsema-Profile'
+
+PROFILE_RETENTION_DAYS = 7
+
+
+class RequestProfile(mongoengine.Document):
+    """Collapsed stacks sampled from one endpoint's requests in one time window"""
+    endpoint = mongoengine.StringField(required=True)
+    window_start = mongoengine.DateTimeField(required=True)
+    window_seconds = mongoengine.IntField()
+    requests = mongoengine.IntField(default=0)
+    samples = mongoengine.IntField(default=0)
+    seconds = mongoengine.FloatField(default=0)
+    # {stack hash: {'stack': 'a;b;c', 'count': n}}
+    stacks = mongoengine.DictField()
+
+    meta = {
+        'collection': 'request_profiles',
+        'indexes': [
+            {'fields': ['endpoint', 'window_start'], 'unique': True},
+            {'fields': ['window_start'], 'expireAfterSeconds': PROFILE_RETENTION_DAYS * 86400},
+        ]
+    }
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    name = f"{frame.f_globals.get('__name__', '?')}.{getattr(code, 'co_qualname', code.co_name)}"
+    # ';' separates frames and ' ' the count in the collapsed format
+    return name.replace(';', ':').replace(' ', '_')
+
+
+def collapse(frame):
+    """A frame's stack as 'outermost;...;innermost'"""
+    names = []
+    while frame is not None:
+        names.append(_frame_name(frame))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class StackSampler:
+    """Sample one thread's Python stack every interval seconds from a background thread"""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+        self._started = None
+        self.elapsed = 0.0
+
+    def start(self):
+        self._started = time.monotonic()
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop sampling and return the {collapsed stack: samples} counter"""
+        self._stop.set()
+        self._thread.join()
+        self.elapsed = time.monotonic() - self._started
+        return self.stacks
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[collapse(frame)] += 1
+            del frame
+
+
+def _window_seconds():
+    return getattr(settings, 'PROFILE_WINDOW_SECONDS', 300)
+
+
+def window_start(now=None):
+    """Start of the profile window now falls in"""
+    seconds = _window_seconds()
+    timestamp = (now or time.time()) // seconds * seconds
+    return datetime.fromtimestamp(timestamp, dt_timezone.utc).replace(tzinfo=None)
+
+
+def save_profile(endpoint, stacks, elapsed):
+    """Merge one request's samples into its endpoint's current window"""
+    get_mongo_client()
+    increments = {'requests': 1, 'samples': sum(stacks.values()), 'seconds': elapsed}
+    stack_names = {}
+    for stack, count in stacks.items():
+        key = hashlib.sha1(stack.encode()).hexdigest()[:16]
+        increments[f'stacks.{key}.count'] = count
+        stack_names[f'stacks.{key}.stack'] = stack
+
+    update = {'$inc': increments, '$setOnInsert': {'window_seconds': _window_seconds()}}
+    if stack_names:
+        update['$set'] = stack_names
+    RequestProfile._get_collection().update_one(
+        {'endpoint': endpoint, 'window_start': window_start()}, update, upsert=True
+    )
+
+
+def collapsed_stacks(profile):
+    """A profile document's stacks in collapsed format, most sampled first"""
+    stacks = sorted(profile.get('stacks', {}).values(), key=lambda entry: -entry['count'])
+    return ''.join(f"{entry['stack']} {entry['count']}\n" for entry in stacks)
+
+
+def _is_admin(request):
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        # API clients authenticate with JWT, which only DRF views resolve
+        try:
+            authenticated = JWTAuthentication().authenticate(request)
+        except Exception:
+            return False
+        user = authenticated[0] if authenticated else None
+    return user is not None and hasattr(user, 'is_admin') and user.is_admin()
+
+
+def should_profile(request, endpoint):
+    """Whether to profile this request: admin header, or the endpoint's sample rate"""
+    if PROFILE_HEADER in request.headers:
+        if _is_admin(request):
+            return True
+        logger.warning(f"Ignoring {PROFILE_HEADER} from a non-admin request to {endpoint}")
+    rate = getattr(settings, 'PROFILE_SAMPLE_RATES', {}).get(endpoint, 0)
+    return rate > 0 and random.random() < rate
+
+
+class ProfilingMiddleware:
+    """Profile selected requests' views with a StackSampler"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+
+        sampler = getattr(request, '_profile_sampler', None)
+        if sampler is not None:
+            stacks = sampler.stop()
+            try:
+                save_profile(request._profile_endpoint, stacks, sampler.elapsed)
+                response['X-Letsema-Profiled'] = f"{sum(stacks.values())} samples"
+            except Exception as e:
+                logger.error(f"Could not save profile of {request._profile_endpoint}: {str(e)}")
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        match = request.resolver_match
+        endpoint = match.url_name or match.route
+        if endpoint and should_profile(request, endpoint):
+            interval = getattr(settings, 'PROFILE_INTERVAL_MS', 5) / 1000
+            request._profile_endpoint = endpoint
+            request._profile_sampler = StackSampler(threading.get_ident(), interval).start()
+        return None
+
+
+class ProfileListView(APIView):
+    """Stored request profiles, newest window first; ?endpoint= filters"""
+    permission_classes = [IsAuthenticated, IsAdmin]
+
+    def get(self, request):
+        get_mongo_client()
+        query = {}
+        if request.query_params.get('endpoint'):
+            query['endpoint'] = request.query_params['endpoint']
+        profiles = (
+            RequestProfile._get_collection()
+            .find(query, {'stacks': 0})
+            .sort([('window_start', -1), ('endpoint', 1)])
+            .limit(200)
+        )
+        return Response([
+            {
+                'id': str(profile['_id']),
+                'endpoint': profile['endpoint'],
+                'window_start': profile['window_start'].replace(tzinfo=dt_timezone.utc),
+                'window_end': (
+                    profile['window_start'] + timedelta(seconds=profile.get('window_seconds') or _window_seconds())
+                ).replace(tzinfo=dt_timezone.utc),
+                'requests': profile.get('requests', 0),
+                'samples': profile.get('samples', 0),
+                'seconds': round(profile.get('seconds', 0), 3),
+            }
+            for profile in profiles
+        ])
+
+
+class ProfileDownloadView(ProfileListView):
+    """One profile as a collapsed stacks file"""
+
+    def get(self, request, profile_id):
+        get_mongo_client()
+        try:
+            profile = RequestProfile._get_collection().find_one({'_id': ObjectId(profile_id)})
+        except InvalidId:
+            profile = None
+        if profile is None:
+            raise NotFound()
+
+        endpoint = re.sub(r'[^\w.-]+', '_', profile['endpoint'])
+        filename = f"{endpoint}-{profile['window_start']:%Y%m%dT%H%M%S}.collapsed"
+        response = HttpResponse(collapsed_stacks(profile), content_type='text/plain; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
@@ -28,11 +28,28 @@ ALLOWED_HOSTS = ['*']
 
 USE_SQLITE = False  # Toggle this to switch back to Postgres later
 
+# MFI clusters, e.g. MFI_CLUSTERS=mfi_a,mfi_b,mfi_c. Each one is configured
+# through DB_<NAME>_* variables (DB_MFI_C_HOST, ...) and gets a DATABASES
+# entry, an FDW server and a registry entry (see mfi.clusters); no code
+# changes are needed to onboard another cluster.
+MFI_CLUSTER_NAMES = [name.strip() for name in os.getenv('MFI_CLUSTERS', 'mfi_a,mfi_b').split(',') if name.strip()]
+
+
+def mfi_env(name, key, default=None):
+    return os.getenv(f'DB_{name.upper()}_{key}', default)
+
+
+# Seconds a connection is kept open for reuse. MFI cluster workers keep
+# theirs across tasks (see mfi.clusters); 0 would reconnect for every task.
+DB_CONN_MAX_AGE = int(os.getenv('DB_CONN_MAX_AGE', '300'))
+
+
 if USE_SQLITE:
     DATABASES = {
         'default': {
             'ENGINE': 'django.db.backends.sqlite3',
             'NAME': BASE_DIR / 'db.sqlite3',
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
         }
     }
 else:
@@ -44,39 +61,33 @@ else:
             'PASSWORD': os.getenv('DB_LETSEMA_PASSWORD'),
             'HOST': os.getenv('DB_LETSEMA_HOST'),
             'PORT': os.getenv('DB_LETSEMA_PORT', '5432'),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
             'OPTIONS': {
                 'options': f"-c search_path={os.getenv('DB_LETSEMA_SCHEMA', 'public')}"
             },
         },
-        'mfi_a': {
-            'ENGINE': 'django.db.backends.postgresql',
-            'NAME': os.getenv('DB_MFI_A_NAME'),
-            'USER': os.getenv('DB_MFI_A_USER'),
-            'PASSWORD': os.getenv('DB_MFI_A_PASSWORD'),
-            'HOST': os.getenv('DB_MFI_A_HOST'),
-            'PORT': os.getenv('DB_MFI_A_PORT', '5432'),
-            'OPTIONS': {
-                'sslmode': 'require',
-            },
-        },
-        'mfi_b': {
+    }
+    for name in MFI_CLUSTER_NAMES:
+        DATABASES[name] = {
             'ENGINE': 'django.db.backends.postgresql',
-            'NAME': os.getenv('DB_MFI_B_NAME'),
-            'USER': os.getenv('DB_MFI_B_USER'),
-            'PASSWORD': os.getenv('DB_MFI_B_PASSWORD'),
-            'HOST': os.getenv('DB_MFI_B_HOST'),
-            'PORT': os.getenv('DB_MFI_B_PORT', '5432'),
+            'NAME': mfi_env(name, 'NAME'),
+            'USER': mfi_env(name, 'USER'),
+            'PASSWORD': mfi_env(name, 'PASSWORD'),
+            'HOST': mfi_env(name, 'HOST'),
+            'PORT': mfi_env(name, 'PORT', '5432'),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
             'OPTIONS': {
-                'options': f"-c search_path={os.getenv('DB_MFI_B_SCHEMA', 'public')}"
+                # TLS is required unless DB_<NAME>_SSLMODE opts out
+                'sslmode': mfi_env(name, 'SSLMODE', 'require'),
+                'options': f"-c search_path={mfi_env(name, 'SCHEMA', 'public')}"
             },
         }
-    }
 
     # Optional: Enforce environment checks only if not using SQLite
-    required_db_vars = [
-        'DB_LETSEMA_NAME', 'DB_LETSEMA_USER', 'DB_LETSEMA_PASSWORD', 'DB_LETSEMA_HOST',
-        'DB_MFI_A_NAME', 'DB_MFI_A_USER', 'DB_MFI_A_PASSWORD', 'DB_MFI_A_HOST',
-        'DB_MFI_B_NAME', 'DB_MFI_B_USER', 'DB_MFI_B_PASSWORD', 'DB_MFI_B_HOST'
+    required_db_vars = ['DB_LETSEMA_NAME', 'DB_LETSEMA_USER', 'DB_LETSEMA_PASSWORD', 'DB_LETSEMA_HOST'] + [
+        f'DB_{name.upper()}_{key}' for name in MFI_CLUSTER_NAMES for key in ('NAME', 'USER', 'PASSWORD', 'HOST')
     ]
 
     missing_vars = [var for var in required_db_vars if not os.getenv(var)]
@@ -97,6 +108,16 @@ MONGO_PASS = os.getenv('MONGO_PASS')
 if not all([MONGO_DBNAME, MONGO_HOST]):
     sys.exit('MongoDB configuration incomplete in environment variables')
 
+# One client per process; these size its connection pool
+MONGO_POOL = {
+    'max_pool_size': int(os.getenv('MONGO_MAX_POOL_SIZE', '50')),
+    'min_pool_size': int(os.getenv('MONGO_MIN_POOL_SIZE', '0')),
+    'max_idle_time_ms': int(os.getenv('MONGO_MAX_IDLE_TIME_MS', '300000')),
+    'wait_queue_timeout_ms': int(os.getenv('MONGO_WAIT_QUEUE_TIMEOUT_MS', '2000')),
+}
+# Connect in the background when a gunicorn worker starts instead of on the first request
+MONGO_WARM_UP = os.getenv('MONGO_WARM_UP', 'True') == 'True'
+
 # ========================
 # APPLICATION DEFINITION
 # ========================
@@ -127,11 +148,13 @@ INSTALLED_APPS = [
 # =================
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware', 
+    'letsema.metrics.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'letsema.profiling.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     
@@ -194,6 +217,9 @@ REST_FRAMEWORK = {
     )
 }
 
+# Views with a query_budget raise instead of logging when they exceed it
+QUERY_BUDGET_STRICT = os.getenv('QUERY_BUDGET_STRICT', str(DEBUG)) == 'True'
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
@@ -201,47 +227,133 @@ SIMPLE_JWT = {
     'BLACKLIST_AFTER_ROTATION': True,
 }
 
+# ======
+# CACHES
+# ======
+# The credit_history cache is read through by the credit history views. Point
+# CREDIT_CACHE_URL at Redis (maxmemory-policy allkeys-lru) to share it across
+# gunicorn workers; without it each worker keeps its own LRU-bounded LocMem.
+CREDIT_HISTORY_CACHE_TTL = int(os.getenv('CREDIT_HISTORY_CACHE_TTL', '300'))
+CREDIT_CACHE_URL = os.getenv('CREDIT_CACHE_URL')
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'credit_history': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': CREDIT_CACHE_URL,
+        'TIMEOUT': CREDIT_HISTORY_CACHE_TTL,
+        'KEY_PREFIX': 'letsema',
+    } if CREDIT_CACHE_URL else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'credit-history',
+        'TIMEOUT': CREDIT_HISTORY_CACHE_TTL,
+        'OPTIONS': {'MAX_ENTRIES': int(os.getenv('CREDIT_HISTORY_CACHE_MAX_ENTRIES', '10000'))},
+    },
+}
+
 # =====================
 # FOREIGN DATA WRAPPERS
 # =====================
 FDW_SETTINGS = {
-    'mfi_a': {
-        'server_name': 'mfi_a_server',
-        'wrapper': 'postgres_fdw',
-        'options': {
-            'host': os.getenv('DB_MFI_A_HOST'),
-            'dbname': os.getenv('DB_MFI_A_NAME'),
-            'port': os.getenv('DB_MFI_A_PORT', '5432'),
-        },
-        'user_mapping': {
-            'local_user': 'postgres',
-            'remote_user': os.getenv('DB_MFI_A_USER'),
-            'remote_password': os.getenv('DB_MFI_A_PASSWORD')
-        }
-    },
-    'mfi_b': {
-        'server_name': 'mfi_b_server',
+    name: {
+        'server_name': f'{name}_server',
         'wrapper': 'postgres_fdw',
         'options': {
-            'host': os.getenv('DB_MFI_B_HOST'),
-            'dbname': os.getenv('DB_MFI_B_NAME'),
-            'port': os.getenv('DB_MFI_B_PORT', '5432'),
+            'host': mfi_env(name, 'HOST'),
+            'dbname': mfi_env(name, 'NAME'),
+            'port': mfi_env(name, 'PORT', '5432'),
+            # postgres_fdw tuning (see mfi.fdw_setup.tune_fdw_server and the
+            # tune_fdw_servers command); the defaults fetch 100 rows per round
+            # trip and insert row by row. batch_size and async_capable are
+            # skipped on PostgreSQL 13 and older, which do not support them.
+            'fetch_size': mfi_env(name, 'FDW_FETCH_SIZE', os.getenv('FDW_FETCH_SIZE', '1000')),
+            'batch_size': mfi_env(name, 'FDW_BATCH_SIZE', os.getenv('FDW_BATCH_SIZE', '500')),
+            'use_remote_estimate': mfi_env(name, 'FDW_USE_REMOTE_ESTIMATE', os.getenv('FDW_USE_REMOTE_ESTIMATE', 'true')),
+            'async_capable': mfi_env(name, 'FDW_ASYNC_CAPABLE', os.getenv('FDW_ASYNC_CAPABLE', 'true')),
+            'extensions': mfi_env(name, 'FDW_EXTENSIONS', os.getenv('FDW_EXTENSIONS', '')),
         },
         'user_mapping': {
             'local_user': 'postgres',
-            'remote_user': os.getenv('DB_MFI_B_USER'),
-            'remote_password': os.getenv('DB_MFI_B_PASSWORD')
+            'remote_user': mfi_env(name, 'USER'),
+            'remote_password': mfi_env(name, 'PASSWORD')
         }
     }
+    for name in MFI_CLUSTER_NAMES
+}
+
+# MFI cluster registry: worker pool (and so connection) bound per cluster,
+# how the cluster is queried ('fdw' or 'direct', see mfi.clusters) and how
+# long the set of active clusters is cached in seconds
+MFI_CLUSTER_SETTINGS = {
+    name: {
+        'pool_size': int(mfi_env(name, 'POOL_SIZE', os.getenv('MFI_CLUSTER_POOL_SIZE', '4'))),
+        'access': mfi_env(name, 'ACCESS', os.getenv('MFI_CLUSTER_ACCESS', 'fdw')),
+        'credit_source': mfi_env(name, 'CREDIT_SOURCE', os.getenv('MFI_CREDIT_SOURCE', 'live')),
+    }
+    for name in MFI_CLUSTER_NAMES
+}
+MFI_CLUSTER_REGISTRY_TTL = int(os.getenv('MFI_CLUSTER_REGISTRY_TTL', '60'))
+
+# Clusters with credit_source 'snapshot' feed credit scoring from local
+# snapshots (refresh_mfi_snapshots) while they are younger than this many
+# seconds, and from the live tables otherwise
+MFI_SNAPSHOT_MAX_AGE = int(os.getenv('MFI_SNAPSHOT_MAX_AGE', '900'))
+
+# Combined credit lookups query MFI clusters in parallel on the cluster
+# pools; each cluster gets its own deadline in seconds ('default' applies
+# to unlisted clusters)
+CREDIT_SOURCE_TIMEOUTS = {
+    'default': float(os.getenv('CREDIT_SOURCE_TIMEOUT', '5')),
+    **{
+        name: float(os.getenv(f'CREDIT_SOURCE_TIMEOUT_{name.upper()}', os.getenv('CREDIT_SOURCE_TIMEOUT', '5')))
+        for name in MFI_CLUSTER_NAMES
+    },
+}
+
+# Incremental credit sync: change timestamp columns on the MFI foreign
+# tables, and how far back each stored watermark is re-read
+MFI_CHANGE_COLUMNS = {
+    'loans': os.getenv('MFI_LOANS_CHANGE_COLUMN', 'updated_at'),
+    'repayments': os.getenv('MFI_REPAYMENTS_CHANGE_COLUMN', 'updated_at'),
+}
+CREDIT_SYNC_WATERMARK_OVERLAP = timedelta(minutes=int(os.getenv('CREDIT_SYNC_WATERMARK_OVERLAP_MINUTES', '5')))
+
+# Background credit recompute worker (process_credit_recompute_queue):
+# how long a claimed batch stays leased, and the base retry delay on failure
+CREDIT_RECOMPUTE_LEASE_SECONDS = int(os.getenv('CREDIT_RECOMPUTE_LEASE_SECONDS', '300'))
+CREDIT_RECOMPUTE_RETRY_SECONDS = int(os.getenv('CREDIT_RECOMPUTE_RETRY_SECONDS', '30'))
+
+# MFI loan outbox (dispatch_mfi_outbox): attempts before an entry is marked
+# FAILED, and the base retry delay in seconds (doubled per attempt)
+MFI_OUTBOX_MAX_ATTEMPTS = int(os.getenv('MFI_OUTBOX_MAX_ATTEMPTS', '10'))
+MFI_OUTBOX_RETRY_SECONDS = int(os.getenv('MFI_OUTBOX_RETRY_SECONDS', '30'))
+
+# Request instrumentation (letsema.metrics): SQL statements and MongoDB
+# commands slower than this are logged to letsema.slow_queries. /metrics
+# requires METRICS_TOKEN as a bearer token; without one it is refused unless
+# DEBUG or METRICS_PUBLIC is on
+SLOW_QUERY_THRESHOLD_MS = int(os.getenv('SLOW_QUERY_THRESHOLD_MS', '500'))
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+METRICS_PUBLIC = os.getenv('METRICS_PUBLIC', 'False') == 'True'
+
+# Request profiler (letsema.profiling): admins profile a request with the
+# X-Letsema-Profile header, and PROFILE_SAMPLE_RATES profiles a share of an
+# endpoint's requests by URL name, e.g. credit-history=0.01,loan-decision=0.05
+PROFILE_SAMPLE_RATES = {
+    name.strip(): float(rate)
+    for name, _, rate in (item.partition('=') for item in os.getenv('PROFILE_SAMPLE_RATES', '').split(','))
+    if name.strip() and rate
 }
+PROFILE_INTERVAL_MS = int(os.getenv('PROFILE_INTERVAL_MS', '5'))
+PROFILE_WINDOW_SECONDS = int(os.getenv('PROFILE_WINDOW_SECONDS', '300'))
 
 # =====================
 # REQUIRED ENV VARS CHECK
 # =====================
-required_db_vars = [
-    'DB_LETSEMA_NAME', 'DB_LETSEMA_USER', 'DB_LETSEMA_PASSWORD', 'DB_LETSEMA_HOST',
-    'DB_MFI_A_NAME', 'DB_MFI_A_USER', 'DB_MFI_A_PASSWORD', 'DB_MFI_A_HOST',
-    'DB_MFI_B_NAME', 'DB_MFI_B_USER', 'DB_MFI_B_PASSWORD', 'DB_MFI_B_HOST'
+required_db_vars = ['DB_LETSEMA_NAME', 'DB_LETSEMA_USER', 'DB_LETSEMA_PASSWORD', 'DB_LETSEMA_HOST'] + [
+    f'DB_{name.upper()}_{key}' for name in MFI_CLUSTER_NAMES for key in ('NAME', 'USER', 'PASSWORD', 'HOST')
 ]
 
 missing_vars = [var for var in required_db_vars if not os.getenv(var)]
@@ -279,6 +391,7 @@ CORS_ALLOW_HEADERS = [
     'user-agent',
     'x-csrftoken',
     'x-requested-with',
+    'x-letsema-profile',
 ]
 CSRF_TRUSTED_ORIGINS = [
     "http://localhost:5173",
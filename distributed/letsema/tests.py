@@ -0,0 +1,121 @@
+from django.test import SimpleTestCase, TestCase, override_settings
+
+
+class QuerySchemaTest(SimpleTestCase):
+    @override_settings(MFI_CLUSTER_SETTINGS={'mfi_a': {}, 'mfi_ab': {}})
+    def test_fdw_and_snapshot_schemas_are_recognised(self):
+        from letsema.metrics import query_schema
+
+        self.assertEqual(query_schema("SELECT * FROM mfi_a.loans"), 'mfi_a')
+        self.assertEqual(query_schema("SELECT * FROM mfi_ab.loans"), 'mfi_ab')
+        self.assertEqual(query_schema("SELECT * FROM mfi_a_snapshot.loans"), 'mfi_a_snapshot')
+        self.assertEqual(query_schema("SELECT * FROM loans_loanapplication"), '')
+
+
+class RequestMetricsTest(TestCase):
+    def setUp(self):
+        from letsema.metrics import registry
+        registry.reset()
+
+    def test_queries_are_timed_per_alias_and_schema(self):
+        from django.db import connection
+        from letsema.metrics import RequestStats, _current, install_query_recorder, server_timing
+
+        install_query_recorder(None, connection)
+        stats = RequestStats()
+        token = _current.set(stats)
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+                cursor.execute("SELECT 2")
+        finally:
+            _current.reset(token)
+
+        self.assertEqual(stats.sql[('default', '')][0], 2)
+        self.assertIn('sql-default;dur=', server_timing(stats, 0.01))
+        self.assertIn('desc="2 queries"', server_timing(stats, 0.01))
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_request_feeds_header_and_prometheus_histograms(self):
+        from letsema.metrics import registry
+
+        response = self.client.get('/api/credit/health/')
+        self.assertIn('total;dur=', response['Server-Timing'])
+
+        metrics = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(metrics.status_code, 200)
+        body = metrics.content.decode()
+        self.assertIn(
+            'letsema_http_request_duration_seconds_count{endpoint="api/credit/health/",method="GET"} 1', body
+        )
+        self.assertIn('le="+Inf"', body)
+        self.assertNotIn('endpoint="unmatched"', registry.render())
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics_token_is_required_when_set(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret').status_code, 200)
+
+    @override_settings(METRICS_TOKEN=None, METRICS_PUBLIC=False, DEBUG=False)
+    def test_metrics_are_refused_without_a_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        with self.settings(METRICS_PUBLIC=True):
+            self.assertEqual(self.client.get('/metrics').status_code, 200)
+        with self.settings(DEBUG=True):
+            self.assertEqual(self.client.get('/metrics').status_code, 200)
+
+
+class StackSamplerTest(SimpleTestCase):
+    def test_samples_are_collapsed_outermost_first(self):
+        import threading
+        import time
+        from letsema.profiling import StackSampler
+
+        def busy_work():
+            deadline = time.monotonic() + 0.1
+            while time.monotonic() < deadline:
+                pass
+
+        sampler = StackSampler(threading.get_ident(), 0.002).start()
+        busy_work()
+        stacks = sampler.stop()
+
+        self.assertGreater(sum(stacks.values()), 0)
+        hot = max(stacks, key=stacks.get)
+        self.assertTrue(hot.endswith('StackSamplerTest.test_samples_are_collapsed_outermost_first.<locals>.busy_work'))
+        self.assertNotIn(' ', hot)
+
+
+class RequestProfileTest(TestCase):
+    def setUp(self):
+        from mongo_credit.connection import get_mongo_client
+        from letsema.profiling import RequestProfile
+
+        get_mongo_client()
+        RequestProfile.objects(endpoint='test-endpoint').delete()
+
+    def test_profiles_merge_per_endpoint_and_window(self):
+        from collections import Counter
+        from letsema.profiling import RequestProfile, collapsed_stacks, save_profile
+
+        save_profile('test-endpoint', Counter({'a;b': 3, 'a;c': 1}), 0.05)
+        save_profile('test-endpoint', Counter({'a;b': 2}), 0.02)
+        save_profile('test-endpoint', Counter(), 0.001)
+
+        profiles = list(RequestProfile._get_collection().find({'endpoint': 'test-endpoint'}))
+        self.assertEqual(len(profiles), 1)
+        self.assertEqual((profiles[0]['requests'], profiles[0]['samples']), (3, 6))
+        self.assertEqual(collapsed_stacks(profiles[0]), "a;b 5\na;c 1\n")
+
+    def test_profile_header_is_ignored_for_non_admins(self):
+        from django.test import RequestFactory
+        from django.contrib.auth.models import AnonymousUser
+        from letsema.profiling import PROFILE_HEADER, should_profile
+
+        request = RequestFactory().get('/api/credit/health/', HTTP_X_LETSEMA_PROFILE='1')
+        request.user = AnonymousUser()
+        self.assertIn(PROFILE_HEADER, request.headers)
+        with override_settings(PROFILE_SAMPLE_RATES={}):
+            self.assertFalse(should_profile(request, 'mongo-health'))
+        with override_settings(PROFILE_SAMPLE_RATES={'mongo-health': 1.0}):
+            self.assertTrue(should_profile(request, 'mongo-health'))
@@ -3,6 +3,8 @@ from django.urls import path, include
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
 from django.http import HttpResponse
+from letsema.metrics import metrics_view
+from letsema.profiling import ProfileDownloadView, ProfileListView
 
 def home(request):
     return HttpResponse("Welcome to Letsema API")
@@ -18,5 +20,8 @@ urlpatterns = [
     path('api/mfi/', include('mfi.urls')),
     path('api/loans/', include('loans.urls')),
     path('api/credit/', include('mongo_credit.urls')),
+    path('api/profiles/', ProfileListView.as_view(), name='profile-list'),
+    path('api/profiles/<str:profile_id>/', ProfileDownloadView.as_view(), name='profile-download'),
+    path('metrics', metrics_view, name='metrics'),
     path('', home),
 ]
@@ -0,0 +1,104 @@
+"""
+Durable queue of credit history recomputes.
+
+Signal handlers enqueue national IDs into the CreditRecomputeJob table in
+the same transaction as the loan change. The process_credit_recompute_queue
+worker claims batches, recomputes them with the batched credit builders and
+bulk-upserts the results.
+"""
+import logging
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from .models import CreditRecomputeJob
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_credit_recompute(*national_ids):
+    """
+    Queue borrowers for recompute. A borrower already queued has its
+    enqueued_at bumped instead of getting a second job, so a worker that
+    is processing the older request will leave the job in place.
+    """
+    now = timezone.now()
+    CreditRecomputeJob.objects.bulk_create(
+        [CreditRecomputeJob(national_id=national_id, enqueued_at=now) for national_id in set(national_ids)],
+        update_conflicts=True,
+        unique_fields=['national_id'],
+        update_fields=['enqueued_at'],
+    )
+
+
+def claim_jobs(batch_size):
+    """
+    Lease up to batch_size due jobs for this worker. Rows locked by other
+    workers are skipped, and the lease lets a crashed worker's jobs be
+    picked up again once it expires.
+    """
+    now = timezone.now()
+    lease = timedelta(seconds=getattr(settings, 'CREDIT_RECOMPUTE_LEASE_SECONDS', 300))
+    with transaction.atomic():
+        jobs = list(
+            CreditRecomputeJob.objects
+            .select_for_update(skip_locked=True)
+            .filter(Q(locked_until__isnull=True) | Q(locked_until__lt=now))
+            .order_by('enqueued_at')[:batch_size]
+        )
+        if jobs:
+            CreditRecomputeJob.objects.filter(pk__in=[job.pk for job in jobs]).update(locked_until=now + lease)
+    return jobs
+
+
+def complete_jobs(jobs):
+    """Delete finished jobs unless they were re-enqueued while processing"""
+    if not jobs:
+        return
+    condition = Q()
+    for job in jobs:
+        condition |= Q(pk=job.pk, enqueued_at=job.enqueued_at)
+    CreditRecomputeJob.objects.filter(condition).delete()
+    # Re-enqueued jobs are due again right away
+    CreditRecomputeJob.objects.filter(pk__in=[job.pk for job in jobs]).update(locked_until=None)
+
+
+def fail_jobs(jobs, error):
+    """Release jobs for a retry with exponential backoff"""
+    base = getattr(settings, 'CREDIT_RECOMPUTE_RETRY_SECONDS', 30)
+    now = timezone.now()
+    for job in jobs:
+        delay = min(base * 2 ** job.attempts, 3600)
+        CreditRecomputeJob.objects.filter(pk=job.pk).update(
+            attempts=F('attempts') + 1,
+            last_error=str(error)[:2000],
+            locked_until=now + timedelta(seconds=delay),
+        )
+
+
+def process_batch(batch_size):
+    """Claim, recompute and write one batch. Returns the number of jobs claimed."""
+    from mongo_credit.credit_utils import get_combined_credit_data_many, init_mongo_connection
+    from mongo_credit.sync import bulk_upsert_credit_histories
+
+    jobs = claim_jobs(batch_size)
+    if not jobs:
+        return 0
+
+    try:
+        credit_data, failed_clusters = get_combined_credit_data_many([job.national_id for job in jobs])
+        if failed_clusters:
+            logger.warning(f"Recomputed {len(jobs)} credit histories without {', '.join(sorted(failed_clusters))}")
+        init_mongo_connection()
+        _, failed = bulk_upsert_credit_histories(list(credit_data.values()))
+        if failed:
+            raise RuntimeError(f"{failed} credit history writes failed")
+    except Exception as e:
+        logger.error(f"Credit recompute batch of {len(jobs)} failed: {str(e)}")
+        fail_jobs(jobs, e)
+    else:
+        complete_jobs(jobs)
+        logger.info(f"Recomputed credit histories for {len(jobs)} borrowers")
+
+    return len(jobs)
@@ -0,0 +1,75 @@
+"""
+Streaming NDJSON/CSV exports.
+
+Rows are produced lazily from database cursors and rendered one line at a
+time, so an export holds one cursor batch in memory whatever its size.
+"""
+import csv
+import json
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from .models import LoanApplication, LoanStatusUpdate
+
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+DEFAULT_CHUNK_SIZE = 2000
+
+LOAN_COLUMNS = [
+    'id', 'borrower_id', 'mfi_id', 'amount', 'purpose', 'term_months',
+    'interest_rate', 'status', 'application_date', 'decision_date',
+    'decision_by_id', 'notes', 'external_loan_id',
+]
+
+STATUS_UPDATE_COLUMNS = [
+    'id', 'loan_id', 'old_status', 'new_status', 'updated_by_id', 'timestamp', 'notes',
+]
+
+
+class _Echo:
+    """File-like object whose write returns the line instead of buffering it"""
+    def write(self, value):
+        return value
+
+
+def _csv_value(value):
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, cls=DjangoJSONEncoder)
+    return value
+
+
+def render_rows(rows, columns, fmt):
+    """Render dict rows as an iterator of NDJSON or CSV lines"""
+    if fmt == 'ndjson':
+        for row in rows:
+            yield json.dumps({column: row.get(column) for column in columns}, cls=DjangoJSONEncoder) + '\n'
+    elif fmt == 'csv':
+        writer = csv.writer(_Echo())
+        yield writer.writerow(columns)
+        for row in rows:
+            yield writer.writerow([_csv_value(row.get(column)) for column in columns])
+    else:
+        raise ValueError(f"Unsupported export format: {fmt}")
+
+
+def export_response(rows, columns, fmt, filename):
+    """StreamingHttpResponse rendering rows as they are read"""
+    response = StreamingHttpResponse(render_rows(rows, columns, fmt), content_type=EXPORT_FORMATS[fmt])
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{fmt}"'
+    return response
+
+
+def iter_loans(queryset=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Loan rows read through a server-side cursor"""
+    if queryset is None:
+        queryset = LoanApplication.objects.all()
+    return queryset.order_by('id').values(*LOAN_COLUMNS).iterator(chunk_size=chunk_size)
+
+
+def iter_status_updates(queryset=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Status update rows read through a server-side cursor"""
+    if queryset is None:
+        queryset = LoanStatusUpdate.objects.all()
+    return queryset.order_by('id').values(*STATUS_UPDATE_COLUMNS).iterator(chunk_size=chunk_size)
@@ -0,0 +1,25 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from loans.mfi_outbox import dispatch_pending
+
+
+class Command(BaseCommand):
+    help = 'Create approved loans in their MFI clusters from the outbox'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200, help='Outbox entries pushed per cluster batch')
+        parser.add_argument('--interval', type=float, default=2.0, help='Seconds to sleep when nothing is due')
+        parser.add_argument('--once', action='store_true', help='Drain due entries once and exit')
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('MFI outbox dispatcher started'))
+        while True:
+            close_old_connections()
+            processed = dispatch_pending(options['batch_size'])
+            if processed:
+                self.stdout.write(f"Processed {processed} outbox entries")
+                continue
+            if options['once']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,50 @@
+import sys
+from django.core.management.base import BaseCommand
+from loans.exports import (
+    DEFAULT_CHUNK_SIZE,
+    EXPORT_FORMATS,
+    LOAN_COLUMNS,
+    STATUS_UPDATE_COLUMNS,
+    iter_loans,
+    iter_status_updates,
+    render_rows,
+)
+
+
+class Command(BaseCommand):
+    help = 'Stream loans, loan status updates, credit history summaries or their entries to NDJSON or CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', choices=['loans', 'status_updates', 'credit_histories', 'credit_history_entries'])
+        parser.add_argument('--format', dest='fmt', choices=list(EXPORT_FORMATS), default='ndjson')
+        parser.add_argument('--output', help='File to write to (defaults to stdout)')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='Rows per cursor fetch')
+
+    def handle(self, *args, **options):
+        source = options['source']
+        chunk_size = options['chunk_size']
+        if source == 'loans':
+            rows, columns = iter_loans(chunk_size=chunk_size), LOAN_COLUMNS
+        elif source == 'status_updates':
+            rows, columns = iter_status_updates(chunk_size=chunk_size), STATUS_UPDATE_COLUMNS
+        elif source == 'credit_histories':
+            from mongo_credit.exports import CREDIT_HISTORY_COLUMNS, iter_credit_histories
+            rows, columns = iter_credit_histories(batch_size=chunk_size), CREDIT_HISTORY_COLUMNS
+        else:
+            from mongo_credit.exports import CREDIT_HISTORY_ENTRY_COLUMNS, iter_credit_history_entries
+            rows, columns = iter_credit_history_entries(batch_size=chunk_size), CREDIT_HISTORY_ENTRY_COLUMNS
+
+        output = open(options['output'], 'w', newline='') if options['output'] else sys.stdout
+        count = 0
+        try:
+            for line in render_rows(rows, columns, options['fmt']):
+                output.write(line)
+                count += 1
+        finally:
+            if options['output']:
+                output.close()
+
+        # CSV has a header line
+        if options['fmt'] == 'csv':
+            count -= 1
+        self.stderr.write(self.style.SUCCESS(f"Exported {count} {source}"))
@@ -0,0 +1,25 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from loans.credit_queue import process_batch
+
+
+class Command(BaseCommand):
+    help = 'Run the background worker that recomputes queued credit histories'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Jobs claimed per batch')
+        parser.add_argument('--interval', type=float, default=2.0, help='Seconds to sleep when the queue is empty')
+        parser.add_argument('--once', action='store_true', help='Drain the queue once and exit')
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('Credit recompute worker started'))
+        while True:
+            close_old_connections()
+            processed = process_batch(options['batch_size'])
+            if processed:
+                self.stdout.write(f"Processed {processed} jobs")
+                continue
+            if options['once']:
+                break
+            time.sleep(options['interval'])
@@ -1,62 +1,67 @@
 # loans/management/commands/sync_borrowers.py
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from django.core.management.base import BaseCommand
-from django.db import connection
-from users.models import User
+from django.db import connections
+from mfi.clusters import active_cluster_names, get_access
+from mfi.provisioning import letsema_borrowers_csv, provision_borrowers
 
 class Command(BaseCommand):
-    help = 'Sync borrowers with MFI clusters'
+    help = 'Create Letsema borrowers that are missing from the MFI clusters'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--cluster',
+            action='append',
+            help='Only sync this cluster (repeatable); defaults to every active cluster',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report how many borrowers each cluster is missing without creating them',
+        )
 
     def handle(self, *args, **options):
-        # Get all borrowers (users with role='borrower')
-        borrowers = User.objects.filter(role='borrower')
-        
-        for borrower in borrowers:
+        clusters = options['cluster'] or active_cluster_names()
+        if not clusters:
+            self.stdout.write('No active MFI clusters')
+            return
+
+        borrowers_csv, count = letsema_borrowers_csv()
+        self.stdout.write(f"Checking {count} Letsema borrowers against {', '.join(clusters)}")
+
+        lock = threading.Lock()
+
+        def report(cluster, message):
+            with lock:
+                self.stdout.write(f"{cluster}: {message}")
+
+        def sync(cluster):
+            report(cluster, 'started')
             try:
-                if not hasattr(borrower, 'borrower_profile'):
-                    self.stdout.write(f"Skipping borrower {borrower.email} - no profile")
-                    continue
-                    
-                with connection.cursor() as cursor:
-                    # Check if borrower exists in MFI A
-                    cursor.execute("""
-                        SELECT id FROM mfi_a.borrowers 
-                        WHERE email = %s OR national_id = %s
-                        LIMIT 1
-                    """, [
-                        borrower.email, 
-                        borrower.borrower_profile.national_id
-                    ])
-                    
-                    if not cursor.fetchone():
-                        # Create borrower in MFI A
-                        cursor.execute("""
-                            INSERT INTO mfi_a.borrowers (
-                                name, email, phone, 
-                                national_id, credit_score,
-                                created_at, updated_at
-                            )
-                            VALUES (%s, %s, %s, %s, %s, NOW(), NOW())
-                            RETURNING id
-                        """, [
-                            borrower.get_full_name(),
-                            borrower.email,
-                            borrower.phone or '',
-                            borrower.borrower_profile.national_id,
-                            getattr(borrower.borrower_profile, 'credit_score', 650)
-                        ])
-                        mfi_borrower_id = cursor.fetchone()[0]
-                        self.stdout.write(
-                            self.style.SUCCESS(
-                                f"Created borrower {borrower.email} in mfi_a (ID: {mfi_borrower_id})"
-                            )
-                        )
-                    else:
-                        self.stdout.write(
-                            f"Borrower {borrower.email} already exists in mfi_a"
-                        )
+                progress = lambda message: report(cluster, message)
+                return cluster, provision_borrowers(cluster, borrowers_csv, options['dry_run'], progress), None
             except Exception as e:
-                self.stderr.write(
-                    self.style.ERROR(
-                        f"Error syncing borrower {borrower.email}: {str(e)}"
-                    )
-                )
+                return cluster, None, e
+            finally:
+                connections[get_access(cluster).alias].close()
+
+        # Clusters are provisioned in parallel, each on its own connection,
+        # and reported as they finish
+        failed = 0
+        with ThreadPoolExecutor(max_workers=len(clusters)) as executor:
+            futures = [executor.submit(sync, cluster) for cluster in clusters]
+            for future in as_completed(futures):
+                cluster, result, error = future.result()
+                if error:
+                    failed += 1
+                    self.stderr.write(self.style.ERROR(f"Error syncing borrowers to {cluster}: {str(error)}"))
+                elif options['dry_run']:
+                    report(cluster, f"{result['missing']} borrowers would be created")
+                else:
+                    report(cluster, self.style.SUCCESS(
+                        f"created {result['created']} borrowers in {result['elapsed']:.1f}s"
+                    ))
+
+        if failed:
+            self.stderr.write(self.style.ERROR(f"{failed} of {len(clusters)} clusters failed"))
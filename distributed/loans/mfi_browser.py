@@ -0,0 +1,131 @@
+"""
+Federated browsing of the loan books held in the MFI clusters.
+
+Every cluster is read newest first on (application_date, id) with the
+keyset condition and LIMIT in the remote query, so the ordering and limit
+run on the MFI server whether the cluster is reached over postgres_fdw or
+directly. The per-cluster streams are then
+k-way merged on (application_date, cluster, id), which gives one total
+order across clusters that the page cursor can resume from.
+
+application_date is nullable in the MFI schemas: loans without one sort
+after every dated loan (NULLS LAST), and the cursor stores null for them.
+"""
+import base64
+import heapq
+import json
+from django.utils.dateparse import parse_datetime
+from mfi.clusters import get_access
+
+COLUMNS = ('id', 'name', 'amount', 'status', 'application_date')
+
+
+def encode_cursor(row):
+    application_date = row['application_date']
+    payload = json.dumps([
+        application_date.isoformat() if application_date is not None else None, row['cluster'], row['id']
+    ])
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Return (application_date, cluster, id) or raise ValueError"""
+    try:
+        application_date, cluster, loan_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception:
+        raise ValueError('Invalid cursor')
+    if application_date is not None:
+        application_date = parse_datetime(application_date)
+        if application_date is None:
+            raise ValueError('Invalid cursor')
+    return application_date, cluster, int(loan_id)
+
+
+def _keyset_condition(cluster, position):
+    """
+    SQL condition selecting the cluster's rows that come after position in
+    the merged (application_date DESC NULLS LAST, cluster, id) DESC order.
+    """
+    if position is None:
+        return '', []
+    application_date, cursor_cluster, loan_id = position
+    if application_date is None:
+        # Already among the undated loans, which are ordered by (cluster, id)
+        if cluster < cursor_cluster:
+            return 'WHERE l.application_date IS NULL', []
+        if cluster > cursor_cluster:
+            return 'WHERE FALSE', []
+        return 'WHERE l.application_date IS NULL AND l.id < %s', [loan_id]
+    if cluster < cursor_cluster:
+        return 'WHERE (l.application_date <= %s OR l.application_date IS NULL)', [application_date]
+    if cluster > cursor_cluster:
+        return 'WHERE (l.application_date < %s OR l.application_date IS NULL)', [application_date]
+    return (
+        'WHERE (l.application_date < %s OR (l.application_date = %s AND l.id < %s)'
+        ' OR l.application_date IS NULL)',
+        [application_date, application_date, loan_id]
+    )
+
+
+def page_query(access, cluster, position, limit):
+    """(sql, params) reading one cluster's page of loans after position"""
+    condition, params = _keyset_condition(cluster, position)
+    return f"""
+        SELECT l.id, b.name, l.amount, l.status, l.application_date
+        FROM {access.table('loans')} l
+        JOIN {access.table('borrowers')} b ON l.borrower_id = b.id
+        {condition}
+        ORDER BY l.application_date DESC NULLS LAST, l.id DESC
+        LIMIT %s
+    """, params + [limit]
+
+
+def open_cluster_stream(cluster, position, limit, fetch_size=500, access=None):
+    """
+    Run one cluster's page query and return an iterator of loan dicts,
+    newest first, after position. The query runs immediately so an
+    unreachable cluster raises here rather than halfway through a response.
+    The cluster's configured access backend is used unless access is given.
+    """
+    access = access or get_access(cluster)
+    cursor = access.cursor()
+    try:
+        cursor.execute(*page_query(access, cluster, position, limit))
+    except Exception:
+        cursor.close()
+        raise
+
+    def rows():
+        try:
+            while True:
+                batch = cursor.fetchmany(fetch_size)
+                if not batch:
+                    break
+                for row in batch:
+                    loan = dict(zip(COLUMNS, row))
+                    loan['cluster'] = cluster
+                    yield loan
+        finally:
+            cursor.close()
+
+    return rows()
+
+
+def merge_streams(streams, limit):
+    """
+    k-way merge of ordered cluster streams, limited to limit rows. Each
+    stream holds at most limit rows, so memory stays bounded by the page
+    size rather than the size of the loan books.
+    """
+    # Undated loans come last; dates are only compared when both are set
+    merged = heapq.merge(
+        *streams,
+        key=lambda loan: (
+            loan['application_date'] is not None, loan['application_date'], loan['cluster'], loan['id']
+        ),
+        reverse=True
+    )
+    for count, loan in enumerate(merged):
+        if count >= limit:
+            break
+        yield loan
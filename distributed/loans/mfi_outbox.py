@@ -0,0 +1,171 @@
+"""
+Transactional outbox for creating approved loans in MFI clusters.
+
+LoanDecisionView writes an MFILoanOutbox row in the approval transaction;
+dispatch_pending drains the outbox per cluster in batches. The
+LETSEMA-{id} external_reference makes pushes idempotent, so an entry that
+is retried after the remote insert already happened only picks up the
+existing MFI loan id.
+
+Over FDW the remote insert commits with the local outbox transaction. With
+direct access it commits on the cluster first, and the reference lookup
+covers a local commit that is lost after it.
+"""
+import logging
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from mfi.clusters import get_access
+from .models import LoanApplication, MFILoanOutbox
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_mfi_loan(loan):
+    """Record an approved loan for creation in its MFI cluster"""
+    MFILoanOutbox.objects.get_or_create(loan=loan, defaults={'cluster': loan.mfi.cluster_name})
+
+
+def _schedule_retry(entries, error):
+    max_attempts = getattr(settings, 'MFI_OUTBOX_MAX_ATTEMPTS', 10)
+    base = getattr(settings, 'MFI_OUTBOX_RETRY_SECONDS', 30)
+    now = timezone.now()
+    for entry in entries:
+        entry.attempts += 1
+        entry.last_error = str(error)[:2000]
+        entry.next_attempt_at = now + timedelta(seconds=min(base * 2 ** (entry.attempts - 1), 3600))
+        if entry.attempts >= max_attempts:
+            entry.status = MFILoanOutbox.Status.FAILED
+            logger.error(f"Giving up on creating loan {entry.loan_id} in {entry.cluster}: {entry.last_error}")
+    MFILoanOutbox.objects.bulk_update(entries, ['attempts', 'last_error', 'next_attempt_at', 'status'])
+
+
+def _national_id(entry):
+    profile = getattr(entry.loan.borrower, 'borrower_profile', None)
+    return profile.national_id if profile else None
+
+
+def _push_loans(access, entries):
+    """
+    Create the entries' loans in the cluster with one lookup of existing
+    references, one borrower lookup and one multi-row INSERT.
+
+    Returns ({loan_id: mfi_loan_id}, entries whose borrower is missing).
+    """
+    by_reference = {entry.external_reference: entry for entry in entries}
+    created = {}
+
+    with access.cursor() as cursor:
+        cursor.execute(f"""
+            SELECT external_reference, id FROM {access.table('loans')}
+            WHERE external_reference = ANY(%s)
+        """, [list(by_reference)])
+        for reference, mfi_loan_id in cursor.fetchall():
+            created[by_reference[reference].loan_id] = mfi_loan_id
+
+        pending = [entry for entry in entries if entry.loan_id not in created]
+        if not pending:
+            return created, []
+
+        national_ids = {_national_id(entry) for entry in pending} - {None}
+        cursor.execute(f"""
+            SELECT national_id, id FROM {access.table('borrowers')}
+            WHERE national_id = ANY(%s)
+            ORDER BY id
+        """, [list(national_ids)])
+        borrower_ids = {}
+        for national_id, borrower_id in cursor.fetchall():
+            borrower_ids.setdefault(national_id, borrower_id)
+
+        missing = []
+        rows = []
+        approval_date = timezone.now()
+        for entry in pending:
+            loan = entry.loan
+            borrower_id = borrower_ids.get(_national_id(entry))
+            if borrower_id is None:
+                missing.append(entry)
+                continue
+            rows.append([
+                borrower_id,
+                float(loan.amount),
+                float(loan.interest_rate),
+                'approved',
+                loan.purpose,
+                loan.application_date,
+                approval_date,
+                loan.term_months,
+                entry.external_reference
+            ])
+
+        if rows:
+            placeholders = ', '.join(['(%s, %s, %s, %s, %s, %s, %s, %s, %s)'] * len(rows))
+            cursor.execute(f"""
+                INSERT INTO {access.table('loans')} (
+                    borrower_id, amount, interest_rate, status,
+                    purpose, application_date, approval_date,
+                    term_months, external_reference
+                ) VALUES {placeholders}
+                RETURNING id, external_reference
+            """, [value for row in rows for value in row])
+            for mfi_loan_id, reference in cursor.fetchall():
+                created[by_reference[reference].loan_id] = mfi_loan_id
+
+    return created, missing
+
+
+def dispatch_cluster(cluster, batch_size):
+    """Push one batch of due outbox entries for a cluster. Returns the batch size."""
+    with transaction.atomic():
+        entries = list(
+            MFILoanOutbox.objects
+            .select_for_update(skip_locked=True, of=('self',))
+            .select_related('loan__borrower__borrower_profile')
+            .filter(
+                cluster=cluster,
+                status=MFILoanOutbox.Status.PENDING,
+                next_attempt_at__lte=timezone.now()
+            )
+            .order_by('next_attempt_at')[:batch_size]
+        )
+        if not entries:
+            return 0
+
+        access = get_access(cluster)
+        try:
+            # A savepoint over FDW, its own transaction on the cluster with
+            # direct access; either way a remote failure lets us record the retry
+            with transaction.atomic(using=access.alias):
+                created, missing = _push_loans(access, entries)
+        except Exception as e:
+            logger.error(f"Failed to create {len(entries)} loans in {cluster}: {str(e)}")
+            _schedule_retry(entries, e)
+            return len(entries)
+
+        now = timezone.now()
+        sent = [entry for entry in entries if entry.loan_id in created]
+        for entry in sent:
+            entry.status = MFILoanOutbox.Status.SENT
+            entry.sent_at = now
+            entry.loan.external_loan_id = created[entry.loan_id]
+        MFILoanOutbox.objects.bulk_update(sent, ['status', 'sent_at'])
+        # bulk_update skips post_save, so filling the id does not requeue a credit recompute
+        LoanApplication.objects.bulk_update([entry.loan for entry in sent], ['external_loan_id'])
+
+        if missing:
+            _schedule_retry(missing, f"Borrower not found in {cluster} system")
+
+        logger.info(f"Created {len(sent)} loans in {cluster}, {len(missing)} waiting for borrowers")
+        return len(entries)
+
+
+def dispatch_pending(batch_size):
+    """Push one batch per cluster with due entries. Returns the number processed."""
+    clusters = (
+        MFILoanOutbox.objects
+        .filter(status=MFILoanOutbox.Status.PENDING, next_attempt_at__lte=timezone.now())
+        .values_list('cluster', flat=True)
+        .distinct()
+    )
+    return sum(dispatch_cluster(cluster, batch_size) for cluster in list(clusters))
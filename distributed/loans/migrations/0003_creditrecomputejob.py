@@ -0,0 +1,29 @@
+# Generated by Django 5.2 on 2026-10-18 09:12
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loans', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CreditRecomputeJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('national_id', models.CharField(max_length=20, unique=True)),
+                ('enqueued_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('locked_until', models.DateTimeField(blank=True, null=True)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True)),
+            ],
+            options={
+                'ordering': ['enqueued_at'],
+                'indexes': [models.Index(fields=['enqueued_at'], name='loans_credi_enqueue_9a1fa8_idx')],
+            },
+        ),
+    ]
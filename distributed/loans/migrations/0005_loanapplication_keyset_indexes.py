@@ -0,0 +1,28 @@
+# Generated by Django 5.2 on 2026-10-18 11:20
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loans', '0004_mfiloanoutbox'),
+        ('mfi', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='loanapplication',
+            index=models.Index(fields=['-application_date', '-id'], name='loans_loana_applica_259b08_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='loanapplication',
+            index=models.Index(fields=['mfi', '-application_date', '-id'], name='loans_loana_mfi_id_dde493_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='loanapplication',
+            index=models.Index(fields=['borrower', '-application_date', '-id'], name='loans_loana_borrowe_ddaf9a_idx'),
+        ),
+    ]
@@ -0,0 +1,79 @@
+import logging
+from contextlib import ExitStack
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class QueryBudgetMixin:
+    """
+    Count the SQL queries a view runs per read request and flag requests
+    that go over query_budget. Over-budget requests are logged; with
+    QUERY_BUDGET_STRICT (defaults to DEBUG) they raise instead, so N+1
+    regressions fail in development and tests.
+    """
+    query_budget = None
+    query_budget_methods = ('GET', 'HEAD')
+
+    def dispatch(self, request, *args, **kwargs):
+        if self.query_budget is None or request.method not in self.query_budget_methods:
+            return super().dispatch(request, *args, **kwargs)
+
+        count = 0
+
+        def counter(execute, sql, params, many, context):
+            nonlocal count
+            count += 1
+            return execute(sql, params, many, context)
+
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(counter))
+            response = super().dispatch(request, *args, **kwargs)
+
+        if count > self.query_budget:
+            message = (
+                f"{type(self).__name__} ran {count} queries for {request.method} "
+                f"{request.path}, budget is {self.query_budget}"
+            )
+            if getattr(settings, 'QUERY_BUDGET_STRICT', settings.DEBUG):
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+
+        return response
+
+
+class SparseFieldsetMixin:
+    """
+    Read ?fields= and ?expand= (comma separated) and hand them to serializers
+    using ExpandableFieldsMixin. default_expand applies when ?expand= is
+    absent; get_queryset implementations use get_expand() to only join or
+    prefetch the relations that will be rendered.
+    """
+    default_expand = ()
+    
+    def _list_param(self, name):
+        value = self.request.query_params.get(name)
+        if value is None:
+            return None
+        return {item.strip() for item in value.split(',') if item.strip()}
+    
+    def get_expand(self):
+        expand = self._list_param('expand')
+        return set(self.default_expand) if expand is None else expand
+    
+    def get_requested_fields(self):
+        return self._list_param('fields')
+    
+    def get_serializer(self, *args, **kwargs):
+        from .serializers import ExpandableFieldsMixin
+        
+        if issubclass(self.get_serializer_class(), ExpandableFieldsMixin):
+            kwargs.setdefault('expand', self.get_expand())
+            kwargs.setdefault('fields', self.get_requested_fields())
+        return super().get_serializer(*args, **kwargs)
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from users.models import User
 from mfi.models import MicroFinanceInstitution
 
@@ -26,6 +27,12 @@ class LoanApplication(models.Model):
     
     class Meta:
         ordering = ['-application_date']
+        # Keyset pagination walks (application_date, id) newest first
+        indexes = [
+            models.Index(fields=['-application_date', '-id']),
+            models.Index(fields=['mfi', '-application_date', '-id']),
+            models.Index(fields=['borrower', '-application_date', '-id']),
+        ]
     
     def save(self, *args, **kwargs):
         # Ensure MFI cluster is properly set
@@ -48,4 +55,52 @@ class LoanStatusUpdate(models.Model):
         ordering = ['-timestamp']
     
     def __str__(self):
-        return f"Status update for Loan #{self.loan.id}"
\ No newline at end of file
+        return f"Status update for Loan #{self.loan.id}"
+
+class CreditRecomputeJob(models.Model):
+    """
+    Pending credit history recompute for a borrower. There is at most one
+    row per national_id, so repeated changes coalesce into a single job.
+    """
+    national_id = models.CharField(max_length=20, unique=True)
+    enqueued_at = models.DateTimeField(default=timezone.now)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    
+    class Meta:
+        ordering = ['enqueued_at']
+        indexes = [models.Index(fields=['enqueued_at'])]
+    
+    def __str__(self):
+        return f"Credit recompute for {self.national_id}"
+
+class MFILoanOutbox(models.Model):
+    """
+    Approved loan waiting to be created in its MFI cluster. Written in the
+    same transaction as the approval and drained by dispatch_mfi_outbox.
+    """
+    class Status(models.TextChoices):
+        PENDING = 'PENDING', 'Pending'
+        SENT = 'SENT', 'Sent'
+        FAILED = 'FAILED', 'Failed'
+    
+    loan = models.OneToOneField(LoanApplication, on_delete=models.CASCADE, related_name='mfi_outbox')
+    cluster = models.CharField(max_length=20)
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['next_attempt_at']
+        indexes = [models.Index(fields=['status', 'cluster', 'next_attempt_at'])]
+    
+    @property
+    def external_reference(self):
+        return f"LETSEMA-{self.loan_id}"
+    
+    def __str__(self):
+        return f"Outbox entry for Loan #{self.loan_id} ({self.cluster})"
@@ -5,24 +5,71 @@ from mfi.serializers import MicroFinanceInstitutionSerializer
 import logging
 logger = logging.getLogger(__name__)
 
-class LoanStatusUpdateSerializer(serializers.ModelSerializer):
-    updated_by = UserSerializer(read_only=True)
+def split_expand(expand):
+    """Split dotted expansions into top-level names and per-relation remainders"""
+    top = set()
+    nested = {}
+    for path in expand or ():
+        name, _, rest = path.partition('.')
+        top.add(name)
+        if rest:
+            nested.setdefault(name, set()).add(rest)
+    return top, nested
+
+class ExpandableFieldsMixin:
+    """
+    Sparse fieldsets for model serializers.
+
+    fields limits the rendered fields to the given names. expand lists
+    relations from expandable_fields to render nested instead of as primary
+    keys; dotted paths (status_updates.updated_by) expand inside nested
+    serializers. Both are passed as serializer kwargs by
+    loans.mixins.SparseFieldsetMixin from ?fields= and ?expand=.
+    """
+    # name -> (serializer class, extra kwargs)
+    expandable_fields = {}
+    
+    def __init__(self, *args, fields=None, expand=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        top, nested = split_expand(expand)
+        
+        for name in top & set(self.expandable_fields):
+            serializer_class, options = self.expandable_fields[name]
+            if issubclass(serializer_class, ExpandableFieldsMixin):
+                options = dict(options, expand=nested.get(name))
+            self.fields[name] = serializer_class(read_only=True, **options)
+        
+        if fields:
+            keep = set(fields) | top
+            for name in set(self.fields) - keep:
+                self.fields.pop(name)
+
+class LoanStatusUpdateSerializer(ExpandableFieldsMixin, serializers.ModelSerializer):
+    expandable_fields = {
+        'updated_by': (UserSerializer, {}),
+    }
     
     class Meta:
         model = LoanStatusUpdate
         fields = '__all__'
-        read_only_fields = ['timestamp']
+        read_only_fields = ['timestamp', 'updated_by']
 
-class LoanApplicationSerializer(serializers.ModelSerializer):
-    borrower = UserSerializer(read_only=True)
-    mfi = MicroFinanceInstitutionSerializer(read_only=True)
-    decision_by = UserSerializer(read_only=True)
-    status_updates = LoanStatusUpdateSerializer(many=True, read_only=True)
+class LoanApplicationSerializer(ExpandableFieldsMixin, serializers.ModelSerializer):
+    """
+    Loans render flat by default, with borrower, mfi and decision_by as ids.
+    Relations and status_updates are only nested when expanded.
+    """
+    expandable_fields = {
+        'borrower': (UserSerializer, {}),
+        'mfi': (MicroFinanceInstitutionSerializer, {}),
+        'decision_by': (UserSerializer, {}),
+        'status_updates': (LoanStatusUpdateSerializer, {'many': True}),
+    }
     
     class Meta:
         model = LoanApplication
         fields = '__all__'
-        read_only_fields = ['application_date', 'decision_date', 'decision_by', 'external_loan_id']
+        read_only_fields = ['borrower', 'mfi', 'application_date', 'decision_date', 'decision_by', 'external_loan_id']
 
 # serializers.py - Update LoanApplicationCreateSerializer
 class LoanApplicationCreateSerializer(serializers.ModelSerializer):
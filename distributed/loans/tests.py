@@ -1,5 +1,5 @@
 # loans/tests/test_cluster_integration.py
-from django.test import TransactionTestCase
+from django.test import TestCase, TransactionTestCase, override_settings
 from django.db import connection
 from django.contrib.auth import get_user_model
 from mfi.models import MicroFinanceInstitution
@@ -71,4 +71,533 @@ class ClusterIntegrationTest(TransactionTestCase):
         super().tearDownClass()
         # Force close all connections
         from django.db import connections
-        connections.close_all()
\ No newline at end of file
+        connections.close_all()
+
+class CreditRecomputeQueueTest(TestCase):
+    def test_jobs_coalesce_per_borrower(self):
+        from loans.credit_queue import claim_jobs, complete_jobs, enqueue_credit_recompute
+        from loans.models import CreditRecomputeJob
+
+        enqueue_credit_recompute("TEST123", "TEST456")
+        enqueue_credit_recompute("TEST123")
+        self.assertEqual(CreditRecomputeJob.objects.count(), 2)
+
+        jobs = claim_jobs(10)
+        self.assertEqual(len(jobs), 2)
+        self.assertEqual(claim_jobs(10), [])
+
+        # A change arriving while the batch is processed keeps its job
+        enqueue_credit_recompute("TEST123")
+        complete_jobs(jobs)
+        remaining = CreditRecomputeJob.objects.get()
+        self.assertEqual(remaining.national_id, "TEST123")
+        self.assertIsNone(remaining.locked_until)
+
+
+class LoanListQueryBudgetTest(TestCase):
+    def setUp(self):
+        from datetime import date
+        from loans.models import LoanStatusUpdate
+        from users.models import BorrowerProfile
+
+        self.mfi = MicroFinanceInstitution.objects.create(
+            name="Test MFI A", code="MFI_A", description="", cluster_name="mfi_a"
+        )
+        self.admin = User.objects.create_user(username="admin", password="testpass123", role=User.Role.ADMIN)
+        self.borrower = User.objects.create_user(username="borrower", password="testpass123")
+        BorrowerProfile.objects.create(
+            user=self.borrower, national_id="TEST123", phone_number="", address="",
+            date_of_birth=date(1990, 1, 1)
+        )
+        self.create_loans = lambda count: [
+            LoanStatusUpdate.objects.create(
+                loan=LoanApplication.objects.create(
+                    borrower=self.borrower, mfi=self.mfi, amount=1000, purpose="Test",
+                    term_months=12, interest_rate=10
+                ),
+                old_status='', new_status='PENDING', updated_by=self.borrower
+            )
+            for _ in range(count)
+        ]
+
+    def _list(self, **params):
+        from rest_framework.test import APIClient
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        return client.get('/api/loans/', params)
+
+    def test_page_cost_does_not_grow_with_portfolio(self):
+        expand = 'borrower,mfi,status_updates.updated_by'
+        self.create_loans(3)
+        with self.assertNumQueries(2):
+            self._list(page_size=2, expand=expand)
+
+        self.create_loans(30)
+        with self.assertNumQueries(2):
+            response = self._list(page_size=20, expand=expand)
+        self.assertEqual(len(response.data['results']), 20)
+        self.assertEqual(response.data['results'][0]['borrower']['username'], 'borrower')
+
+    def test_default_list_shape_is_flat(self):
+        self.create_loans(2)
+        with self.assertNumQueries(1):
+            response = self._list()
+        loan = response.data['results'][0]
+        self.assertEqual(loan['borrower'], self.borrower.id)
+        self.assertNotIn('status_updates', loan)
+
+    def test_fields_limits_output(self):
+        self.create_loans(1)
+        response = self._list(fields='amount,status')
+        self.assertEqual(set(response.data['results'][0]), {'amount', 'status'})
+
+    def test_cursor_walks_every_loan_once(self):
+        self.create_loans(7)
+        seen = []
+        response = self._list(page_size=3)
+        while True:
+            seen.extend(loan['id'] for loan in response.data['results'])
+            if not response.data['next']:
+                break
+            from urllib.parse import parse_qs, urlparse
+            cursor = parse_qs(urlparse(response.data['next']).query)['cursor'][0]
+            response = self._list(page_size=3, cursor=cursor)
+
+        self.assertEqual(sorted(seen, reverse=True), seen)
+        self.assertEqual(len(set(seen)), 7)
+
+
+class MFILoanMergeTest(TestCase):
+    def test_streams_merge_in_cursor_order(self):
+        from datetime import datetime
+        from loans.mfi_browser import decode_cursor, encode_cursor, merge_streams
+
+        def stream(cluster, rows):
+            return iter([
+                {'id': loan_id, 'cluster': cluster, 'application_date': datetime(2025, 1, day)}
+                for day, loan_id in rows
+            ])
+
+        merged = list(merge_streams([
+            stream('mfi_a', [(5, 9), (3, 4), (3, 2)]),
+            stream('mfi_b', [(4, 7), (3, 8)]),
+        ], limit=4))
+
+        self.assertEqual(
+            [(loan['cluster'], loan['id']) for loan in merged],
+            [('mfi_a', 9), ('mfi_b', 7), ('mfi_b', 8), ('mfi_a', 4)]
+        )
+        self.assertEqual(decode_cursor(encode_cursor(merged[-1])), (datetime(2025, 1, 3), 'mfi_a', 4))
+
+    def test_undated_loans_merge_last(self):
+        from datetime import datetime
+        from loans.mfi_browser import decode_cursor, encode_cursor, merge_streams
+
+        merged = list(merge_streams([
+            iter([
+                {'id': 3, 'cluster': 'mfi_a', 'application_date': datetime(2025, 1, 2)},
+                {'id': 5, 'cluster': 'mfi_a', 'application_date': None},
+                {'id': 1, 'cluster': 'mfi_a', 'application_date': None},
+            ]),
+            iter([
+                {'id': 2, 'cluster': 'mfi_b', 'application_date': datetime(2025, 1, 1)},
+                {'id': 4, 'cluster': 'mfi_b', 'application_date': None},
+            ]),
+        ], limit=5))
+
+        self.assertEqual(
+            [(loan['cluster'], loan['id']) for loan in merged],
+            [('mfi_a', 3), ('mfi_b', 2), ('mfi_b', 4), ('mfi_a', 5), ('mfi_a', 1)]
+        )
+        self.assertEqual(decode_cursor(encode_cursor(merged[2])), (None, 'mfi_b', 4))
+
+    def test_keyset_condition_reaches_undated_loans(self):
+        from datetime import datetime
+        from loans.mfi_browser import _keyset_condition
+
+        date = datetime(2025, 1, 3)
+        self.assertEqual(_keyset_condition('mfi_a', None), ('', []))
+        self.assertEqual(
+            _keyset_condition('mfi_a', (date, 'mfi_b', 7)),
+            ('WHERE (l.application_date <= %s OR l.application_date IS NULL)', [date])
+        )
+        self.assertEqual(
+            _keyset_condition('mfi_c', (date, 'mfi_b', 7)),
+            ('WHERE (l.application_date < %s OR l.application_date IS NULL)', [date])
+        )
+        condition, params = _keyset_condition('mfi_b', (date, 'mfi_b', 7))
+        self.assertIn('OR l.application_date IS NULL', condition)
+        self.assertEqual(params, [date, date, 7])
+
+        # Past the last dated loan only undated ones remain, in (cluster, id) DESC order
+        self.assertEqual(_keyset_condition('mfi_a', (None, 'mfi_b', 7)), ('WHERE l.application_date IS NULL', []))
+        self.assertEqual(_keyset_condition('mfi_c', (None, 'mfi_b', 7)), ('WHERE FALSE', []))
+        self.assertEqual(
+            _keyset_condition('mfi_b', (None, 'mfi_b', 7)),
+            ('WHERE l.application_date IS NULL AND l.id < %s', [7])
+        )
+
+
+class SyncBorrowersTest(TestCase):
+    def test_only_borrowers_with_profiles_are_staged(self):
+        import csv
+        import io
+        from datetime import date
+        from mfi.provisioning import DEFAULT_CREDIT_SCORE, letsema_borrowers_csv
+        from users.models import BorrowerProfile
+
+        borrower = User.objects.create_user(
+            username='staged', email='staged@example.com', password='x',
+            first_name='Staged', last_name='Borrower', role=User.Role.BORROWER
+        )
+        BorrowerProfile.objects.create(
+            user=borrower, national_id='NID-STAGED', phone_number='555',
+            address='', date_of_birth=date(1990, 1, 1)
+        )
+        User.objects.create_user(username='noprofile', password='x', role=User.Role.BORROWER)
+        User.objects.create_user(username='admin', password='x', role=User.Role.ADMIN)
+
+        data, count = letsema_borrowers_csv()
+        self.assertEqual(count, 1)
+        self.assertEqual(
+            list(csv.reader(io.StringIO(data))),
+            [['Staged Borrower', 'staged@example.com', '555', 'NID-STAGED', str(DEFAULT_CREDIT_SCORE)]]
+        )
+
+    def _cluster(self):
+        """Access to a temporary borrowers table standing in for a cluster's"""
+        from unittest import mock
+
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                CREATE TEMPORARY TABLE provisioning_borrowers (
+                    id serial PRIMARY KEY, name text, email text, phone text, national_id text,
+                    credit_score integer, created_at timestamp, updated_at timestamp
+                )
+            """)
+            cursor.execute("""
+                INSERT INTO provisioning_borrowers (name, email, phone, national_id, credit_score)
+                VALUES ('Known', 'known@example.com', '', 'NID-KNOWN', 700)
+            """)
+        access = mock.Mock(alias='default')
+        access.table.return_value = 'provisioning_borrowers'
+        access.cursor.side_effect = connection.cursor
+        patcher = mock.patch('mfi.provisioning.get_access', return_value=access)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _cluster_borrowers(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT national_id, email FROM provisioning_borrowers ORDER BY national_id")
+            return cursor.fetchall()
+
+    def test_missing_borrowers_are_created_once(self):
+        from mfi.provisioning import provision_borrowers
+
+        if connection.vendor != 'postgresql':
+            self.skipTest('provisioning stages borrowers with COPY')
+        self._cluster()
+        staged = '\n'.join([
+            'Known,other@example.com,,NID-KNOWN,650',   # national_id already in the cluster
+            'Known Email,known@example.com,,NID-NEW,650',  # email already in the cluster
+            'Shared One,shared@example.com,,NID-SHARED-1,650',
+            'Shared Two,shared@example.com,,NID-SHARED-2,650',
+            'No Email,,,NID-NOEMAIL-1,650',
+            'No Email,,,NID-NOEMAIL-2,650',
+            'Twice,twice@example.com,,NID-TWICE,650',
+            'Twice,twice@example.com,,NID-TWICE,650',
+        ]) + '\n'
+        messages = []
+
+        result = provision_borrowers('mfi_a', staged, progress=messages.append)
+
+        self.assertEqual(result['created'], 4)
+        self.assertEqual(messages, ['staged borrowers', 'creating missing borrowers'])
+        self.assertEqual(self._cluster_borrowers(), [
+            ('NID-KNOWN', 'known@example.com'),
+            ('NID-NOEMAIL-1', None),
+            ('NID-NOEMAIL-2', None),
+            ('NID-SHARED-1', 'shared@example.com'),
+            ('NID-TWICE', 'twice@example.com'),
+        ])
+
+    def test_dry_run_counts_without_writing(self):
+        from mfi.provisioning import provision_borrowers
+
+        if connection.vendor != 'postgresql':
+            self.skipTest('provisioning stages borrowers with COPY')
+        self._cluster()
+        result = provision_borrowers('mfi_a', 'New,new@example.com,,NID-NEW,650\n', dry_run=True)
+
+        self.assertEqual((result['missing'], result['created']), (1, 0))
+        self.assertEqual(self._cluster_borrowers(), [('NID-KNOWN', 'known@example.com')])
+
+
+class MFILoanOutboxTest(TestCase):
+    def setUp(self):
+        from datetime import date
+        from users.models import BorrowerProfile
+
+        self.mfi = MicroFinanceInstitution.objects.create(
+            name="Outbox MFI", code="OUTBOX", description="", cluster_name="mfi_a"
+        )
+        self.admin = User.objects.create_user(username="outbox-admin", password="x", role=User.Role.ADMIN)
+        self.borrower = User.objects.create_user(username="outbox-borrower", password="x", role=User.Role.BORROWER)
+        BorrowerProfile.objects.create(
+            user=self.borrower, national_id="NID-OUTBOX", phone_number="", address="",
+            date_of_birth=date(1990, 1, 1)
+        )
+        self.loan = LoanApplication.objects.create(
+            borrower=self.borrower, mfi=self.mfi, amount=1000, purpose="Test",
+            term_months=12, interest_rate=10
+        )
+
+    def _access(self, existing=(), borrowers=(("NID-OUTBOX", 5),), inserted=()):
+        from unittest import mock
+
+        cursor = mock.MagicMock()
+        cursor.__enter__.return_value = cursor
+        cursor.fetchall.side_effect = [list(existing), list(borrowers), list(inserted)]
+        access = mock.Mock(alias='default')
+        access.table.side_effect = lambda table: f"mfi_a.{table}"
+        access.cursor.return_value = cursor
+        return access, cursor
+
+    def _decide(self):
+        self.client.force_login(self.admin)
+        return self.client.patch(
+            f'/api/loans/{self.loan.pk}/decision/', {'status': 'APPROVED'}, content_type='application/json'
+        )
+
+    def test_approval_enqueues_in_the_decision_transaction(self):
+        from unittest import mock
+        from loans.models import MFILoanOutbox
+
+        self.assertEqual(self._decide().status_code, 200)
+        entry = MFILoanOutbox.objects.get(loan=self.loan)
+        self.assertEqual((entry.cluster, entry.status), ('mfi_a', MFILoanOutbox.Status.PENDING))
+        MFILoanOutbox.objects.all().delete()
+
+        # A failure later in the decision rolls the approval and the entry back together
+        self.loan.status = LoanApplication.Status.PENDING
+        self.loan.save()
+        with mock.patch('loans.views.enqueue_mfi_loan', side_effect=RuntimeError('boom')):
+            with self.assertRaises(RuntimeError):
+                self._decide()
+        self.loan.refresh_from_db()
+        self.assertEqual(self.loan.status, LoanApplication.Status.PENDING)
+        self.assertFalse(MFILoanOutbox.objects.exists())
+
+    def test_redispatch_reuses_the_existing_mfi_loan(self):
+        from unittest import mock
+        from loans import mfi_outbox
+        from loans.models import MFILoanOutbox
+
+        mfi_outbox.enqueue_mfi_loan(self.loan)
+        mfi_outbox.enqueue_mfi_loan(self.loan)
+        self.assertEqual(MFILoanOutbox.objects.count(), 1)
+
+        # The remote insert already happened under LETSEMA-{id}
+        access, cursor = self._access(existing=[(f"LETSEMA-{self.loan.pk}", 77)])
+        with mock.patch.object(mfi_outbox, 'get_access', return_value=access):
+            self.assertEqual(mfi_outbox.dispatch_cluster('mfi_a', 10), 1)
+
+        self.assertEqual(cursor.execute.call_count, 1)
+        self.assertNotIn('INSERT', cursor.execute.call_args[0][0])
+        entry = MFILoanOutbox.objects.get(loan=self.loan)
+        self.assertEqual(entry.status, MFILoanOutbox.Status.SENT)
+        self.loan.refresh_from_db()
+        self.assertEqual(self.loan.external_loan_id, '77')
+
+    def test_new_loans_are_inserted_once(self):
+        from unittest import mock
+        from loans import mfi_outbox
+        from loans.models import MFILoanOutbox
+
+        mfi_outbox.enqueue_mfi_loan(self.loan)
+        access, cursor = self._access(inserted=[(78, f"LETSEMA-{self.loan.pk}")])
+        with mock.patch.object(mfi_outbox, 'get_access', return_value=access):
+            mfi_outbox.dispatch_cluster('mfi_a', 10)
+            # Nothing is due any more
+            self.assertEqual(mfi_outbox.dispatch_cluster('mfi_a', 10), 0)
+
+        self.assertEqual(sum('INSERT' in call[0][0] for call in cursor.execute.call_args_list), 1)
+        self.assertEqual(MFILoanOutbox.objects.get(loan=self.loan).status, MFILoanOutbox.Status.SENT)
+
+    @override_settings(MFI_OUTBOX_MAX_ATTEMPTS=3, MFI_OUTBOX_RETRY_SECONDS=30)
+    def test_retries_back_off_until_failed(self):
+        from datetime import timedelta
+        from unittest import mock
+        from django.utils import timezone
+        from loans import mfi_outbox
+        from loans.models import MFILoanOutbox
+
+        mfi_outbox.enqueue_mfi_loan(self.loan)
+        delays = []
+        with mock.patch.object(mfi_outbox, 'get_access', return_value=mock.Mock(alias='default')), \
+                mock.patch.object(mfi_outbox, '_push_loans', side_effect=RuntimeError('cluster down')):
+            for attempt in range(1, 4):
+                before = timezone.now()
+                self.assertEqual(mfi_outbox.dispatch_cluster('mfi_a', 10), 1)
+                entry = MFILoanOutbox.objects.get(loan=self.loan)
+                self.assertEqual(entry.attempts, attempt)
+                self.assertEqual(entry.last_error, 'cluster down')
+                delays.append(round((entry.next_attempt_at - before).total_seconds()))
+                # Not due again until the backoff has passed
+                self.assertEqual(mfi_outbox.dispatch_cluster('mfi_a', 10), 0)
+                MFILoanOutbox.objects.filter(pk=entry.pk).update(next_attempt_at=timezone.now() - timedelta(seconds=1))
+
+        self.assertEqual(delays, [30, 60, 120])
+        self.assertEqual(MFILoanOutbox.objects.get(loan=self.loan).status, MFILoanOutbox.Status.FAILED)
+        self.assertEqual(mfi_outbox.dispatch_pending(10), 0)
+
+
+class ExportTest(TestCase):
+    def setUp(self):
+        self.mfi_a = MicroFinanceInstitution.objects.create(
+            name="Export MFI A", code="EXPORT_A", description="", cluster_name="mfi_a"
+        )
+        self.mfi_b = MicroFinanceInstitution.objects.create(
+            name="Export MFI B", code="EXPORT_B", description="", cluster_name="mfi_b"
+        )
+        self.admin = User.objects.create_user(username="export-admin", password="x", role=User.Role.ADMIN)
+        self.employee = User.objects.create_user(
+            username="export-employee", password="x", role=User.Role.MFI_EMPLOYEE, mfi=self.mfi_a
+        )
+        self.borrower = User.objects.create_user(username="export-borrower", password="x", role=User.Role.BORROWER)
+        self.other = User.objects.create_user(username="export-other", password="x", role=User.Role.BORROWER)
+        self.loans = {
+            (borrower, mfi): self._loan(borrower, mfi)
+            for borrower in (self.borrower, self.other) for mfi in (self.mfi_a, self.mfi_b)
+        }
+
+    def _loan(self, borrower, mfi):
+        from loans.models import LoanStatusUpdate
+
+        loan = LoanApplication.objects.create(
+            borrower=borrower, mfi=mfi, amount=1000, purpose="Test", term_months=12, interest_rate=10
+        )
+        LoanStatusUpdate.objects.create(loan=loan, old_status='', new_status='PENDING', updated_by=borrower)
+        return loan
+
+    def _export(self, user, path):
+        import json
+
+        self.client.force_login(user)
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        content = b''.join(response.streaming_content).decode()
+        return [json.loads(line) for line in content.splitlines()]
+
+    def test_render_rows_ndjson(self):
+        import json
+        from datetime import datetime
+        from loans.exports import render_rows
+
+        lines = list(render_rows(
+            [{'id': 1, 'when': datetime(2025, 1, 2, 3, 4), 'extra': 'dropped'}, {'id': 2}], ['id', 'when'], 'ndjson'
+        ))
+
+        self.assertTrue(all(line.endswith('\n') for line in lines))
+        self.assertEqual(
+            [json.loads(line) for line in lines],
+            [{'id': 1, 'when': '2025-01-02T03:04:00'}, {'id': 2, 'when': None}]
+        )
+
+    def test_render_rows_csv(self):
+        import csv
+        import io
+        from loans.exports import render_rows
+
+        lines = list(render_rows(
+            [{'id': 1, 'entry': {'amount': 5}, 'notes': 'a, "quoted"\nnote'}, {'id': 2}],
+            ['id', 'entry', 'notes'], 'csv'
+        ))
+
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(
+            list(csv.reader(io.StringIO(''.join(lines)))),
+            [['id', 'entry', 'notes'], ['1', '{"amount": 5}', 'a, "quoted"\nnote'], ['2', '', '']]
+        )
+        with self.assertRaises(ValueError):
+            list(render_rows([], ['id'], 'xml'))
+
+    def test_loan_export_is_scoped_to_the_user(self):
+        def exported(user):
+            return {row['id'] for row in self._export(user, '/api/loans/export/ndjson/')}
+
+        def loans(borrower=None, mfi=None):
+            return {
+                loan.id for (loan_borrower, loan_mfi), loan in self.loans.items()
+                if borrower in (None, loan_borrower) and mfi in (None, loan_mfi)
+            }
+
+        self.assertEqual(exported(self.admin), loans())
+        self.assertEqual(exported(self.employee), loans(mfi=self.mfi_a))
+        self.assertEqual(exported(self.borrower), loans(borrower=self.borrower))
+
+    def test_status_update_export_is_scoped_to_the_user(self):
+        rows = self._export(self.borrower, '/api/loans/status-updates/export/ndjson/')
+
+        self.assertEqual(
+            {row['loan_id'] for row in rows},
+            {loan.id for (borrower, mfi), loan in self.loans.items() if borrower == self.borrower}
+        )
+
+    def test_invalid_format_and_anonymous_exports_are_refused(self):
+        self.assertIn(self.client.get('/api/loans/export/csv/').status_code, (401, 403))
+        self.client.force_login(self.borrower)
+        self.assertEqual(self.client.get('/api/loans/export/xml/').status_code, 400)
+
+    def test_credit_history_export_is_admin_only(self):
+        from unittest import mock
+
+        self.client.force_login(self.borrower)
+        self.assertEqual(self.client.get('/api/credit/export/ndjson/').status_code, 403)
+
+        rows = [{'national_id': 'EXPORT1', 'credit_score': 700}]
+        with mock.patch('mongo_credit.views.iter_credit_histories', return_value=iter(rows)):
+            exported = self._export(self.admin, '/api/credit/export/ndjson/')
+        self.assertEqual(exported[0]['national_id'], 'EXPORT1')
+        self.assertEqual(exported[0]['credit_score'], 700)
+
+    def test_export_records_sources(self):
+        import csv
+        import io
+        import json
+        from unittest import mock
+        from django.core.management import call_command
+        from loans.models import LoanStatusUpdate
+
+        def export(source, fmt='ndjson'):
+            stdout, stderr = io.StringIO(), io.StringIO()
+            call_command('export_records', source, format=fmt, stdout=stdout, stderr=stderr)
+            return stdout.getvalue(), stderr.getvalue()
+
+        output, summary = export('loans', 'csv')
+        rows = list(csv.DictReader(io.StringIO(output)))
+        self.assertEqual({int(row['id']) for row in rows}, {loan.id for loan in self.loans.values()})
+        self.assertIn(f"Exported {len(self.loans)} loans", summary)
+
+        output, summary = export('status_updates')
+        self.assertEqual(len(output.splitlines()), LoanStatusUpdate.objects.count())
+        self.assertIn(f"Exported {LoanStatusUpdate.objects.count()} status_updates", summary)
+
+        histories = [{'national_id': 'EXPORT1', 'credit_score': 700}]
+        with mock.patch('mongo_credit.exports.iter_credit_histories', return_value=iter(histories)) as source:
+            output, summary = export('credit_histories')
+        source.assert_called_once_with(batch_size=2000)
+        self.assertEqual(json.loads(output)['national_id'], 'EXPORT1')
+        self.assertIn("Exported 1 credit_histories", summary)
+
+        entries = [
+            {'national_id': 'EXPORT1', 'kind': 'payment', 'entry': {'amount': 5}},
+            {'national_id': 'EXPORT1', 'kind': 'inquiry', 'entry': {'mfi': 'mfi_a'}},
+        ]
+        with mock.patch('mongo_credit.exports.iter_credit_history_entries', return_value=iter(entries)):
+            output, summary = export('credit_history_entries', 'csv')
+        self.assertEqual(
+            list(csv.reader(io.StringIO(output)))[1:],
+            [['EXPORT1', 'payment', '{"amount": 5}'], ['EXPORT1', 'inquiry', '{"mfi": "mfi_a"}']]
+        )
+        self.assertIn("Exported 2 credit_history_entries", summary)
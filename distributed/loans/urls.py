@@ -4,13 +4,18 @@ from .views import (
     LoanApplicationDetailView,
     LoanDecisionView,
     LoanStatusUpdatesView,
+    LoanExportView,
+    LoanStatusUpdateExportView,
     MFILoansView,
 )
 
 urlpatterns = [
     path('', LoanApplicationListCreateView.as_view(), name='loan-list-create'),
     path('<int:pk>/', LoanApplicationDetailView.as_view(), name='loan-detail'),
+    path('export/<str:fmt>/', LoanExportView.as_view(), name='loan-export'),
+    path('status-updates/export/<str:fmt>/', LoanStatusUpdateExportView.as_view(), name='loan-status-update-export'),
     path('<int:pk>/decision/', LoanDecisionView.as_view(), name='loan-decision'),
     path('<int:loan_id>/status-updates/', LoanStatusUpdatesView.as_view(), name='loan-status-updates'),
+    path('mfi-loans/', MFILoansView.as_view(), name='mfi-loans-all'),
     path('mfi-loans/<str:cluster>/', MFILoansView.as_view(), name='mfi-loans'),
 ]
\ No newline at end of file
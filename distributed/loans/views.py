@@ -2,6 +2,7 @@ from rest_framework import generics, permissions, status
 from rest_framework.response import Response
 from .models import LoanApplication, LoanStatusUpdate
 from .serializers import (
+    split_expand,
     LoanApplicationSerializer,
     LoanApplicationCreateSerializer,
     LoanDecisionSerializer,
@@ -13,13 +14,70 @@ from django.utils import timezone
 from django.conf import settings
 import logging
 from rest_framework.exceptions import PermissionDenied
-from django.db import connection
+from django.db import transaction
+from django.db.models import Prefetch
 from django.conf import settings
+from .mfi_outbox import enqueue_mfi_loan
+from .mixins import QueryBudgetMixin, SparseFieldsetMixin
+from .pagination import KeysetPagination
+from .exports import (
+    EXPORT_FORMATS,
+    LOAN_COLUMNS,
+    STATUS_UPDATE_COLUMNS,
+    export_response,
+    iter_loans,
+    iter_status_updates,
+)
+from .mfi_browser import decode_cursor, encode_cursor, merge_streams, open_cluster_stream
+from mfi.clusters import active_cluster_names
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from rest_framework.utils.urls import replace_query_param
+import json
 
 logger = logging.getLogger(__name__)
 
-class LoanApplicationListCreateView(generics.ListCreateAPIView):
+LOAN_RELATIONS = ('borrower', 'mfi', 'decision_by')
+
+def loan_list_queryset(user, expand=(), fields=None):
+    """
+    Loans visible to the user. Only the relations being expanded are joined
+    or prefetched, and a ?fields= subset defers the other columns, so a page
+    costs the same number of queries however many loans or status updates
+    it holds.
+    """
+    if user.is_borrower():
+        queryset = LoanApplication.objects.filter(borrower=user)
+    elif user.is_mfi_employee():
+        queryset = LoanApplication.objects.filter(mfi_id=user.mfi_id)
+    elif user.is_admin():
+        queryset = LoanApplication.objects.all()
+    else:
+        return LoanApplication.objects.none()
+    
+    top, nested = split_expand(expand)
+    related = [name for name in LOAN_RELATIONS if name in top]
+    if related:
+        queryset = queryset.select_related(*related)
+    if 'status_updates' in top:
+        updates = LoanStatusUpdate.objects.all()
+        if 'updated_by' in nested.get('status_updates', ()):
+            updates = updates.select_related('updated_by')
+        queryset = queryset.prefetch_related(Prefetch('status_updates', queryset=updates))
+    
+    if fields:
+        columns = {field.name for field in LoanApplication._meta.concrete_fields}
+        # application_date and id are the pagination cursor
+        only = {'id', 'application_date'} | (set(fields) & columns) | set(related)
+        queryset = queryset.only(*only)
+    
+    return queryset
+
+class LoanApplicationListCreateView(QueryBudgetMixin, SparseFieldsetMixin, generics.ListCreateAPIView):
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
+    # auth + loan page + status update prefetch, with headroom for session auth
+    query_budget = 5
     
     def get_serializer_class(self):
         if self.request.method == 'POST':
@@ -27,14 +85,7 @@ class LoanApplicationListCreateView(generics.ListCreateAPIView):
         return LoanApplicationSerializer
     
     def get_queryset(self):
-        user = self.request.user
-        if user.is_borrower():
-            return LoanApplication.objects.filter(borrower=user)
-        elif user.is_mfi_employee():
-            return LoanApplication.objects.filter(mfi=user.mfi)
-        elif user.is_admin():
-            return LoanApplication.objects.all()
-        return LoanApplication.objects.none()
+        return loan_list_queryset(self.request.user, self.get_expand(), self.get_requested_fields())
     
     def perform_create(self, serializer):
         loan = serializer.save(borrower=self.request.user)
@@ -47,20 +98,39 @@ class LoanApplicationListCreateView(generics.ListCreateAPIView):
             notes='Loan application submitted'
         )
 
-class LoanApplicationDetailView(generics.RetrieveAPIView):
+class LoanApplicationDetailView(QueryBudgetMixin, SparseFieldsetMixin, generics.RetrieveAPIView):
     queryset = LoanApplication.objects.all()
     serializer_class = LoanApplicationSerializer
     permission_classes = [permissions.IsAuthenticated]
+    query_budget = 5
+    # A single loan keeps its fully nested shape unless ?expand= says otherwise
+    default_expand = ('borrower', 'mfi', 'decision_by', 'status_updates', 'status_updates.updated_by')
     
     def get_queryset(self):
-        user = self.request.user
-        if user.is_borrower():
-            return LoanApplication.objects.filter(borrower=user)
-        elif user.is_mfi_employee():
-            return LoanApplication.objects.filter(mfi=user.mfi)
-        elif user.is_admin():
-            return LoanApplication.objects.all()
-        return LoanApplication.objects.none()
+        return loan_list_queryset(self.request.user, self.get_expand(), self.get_requested_fields())
+
+class LoanExportView(generics.GenericAPIView):
+    """Stream the loans visible to the user as NDJSON or CSV"""
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def get(self, request, fmt):
+        if fmt not in EXPORT_FORMATS:
+            return Response({"error": "Invalid format"}, status=400)
+        return export_response(
+            iter_loans(loan_list_queryset(request.user)), LOAN_COLUMNS, fmt, 'loans'
+        )
+
+class LoanStatusUpdateExportView(generics.GenericAPIView):
+    """Stream the status updates of loans visible to the user as NDJSON or CSV"""
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def get(self, request, fmt):
+        if fmt not in EXPORT_FORMATS:
+            return Response({"error": "Invalid format"}, status=400)
+        queryset = LoanStatusUpdate.objects.filter(loan__in=loan_list_queryset(request.user).values('id'))
+        return export_response(
+            iter_status_updates(queryset), STATUS_UPDATE_COLUMNS, fmt, 'loan_status_updates'
+        )
 
 # views.py - Update LoanDecisionView permissions and logic
 class LoanDecisionView(generics.UpdateAPIView):
@@ -92,84 +162,29 @@ class LoanDecisionView(generics.UpdateAPIView):
         serializer = self.get_serializer(loan, data=request.data, partial=True)
         serializer.is_valid(raise_exception=True)
         
-        loan = serializer.save(
-            decision_by=request.user,
-            decision_date=timezone.now()
-        )
-        
-        LoanStatusUpdate.objects.create(
-            loan=loan,
-            old_status=old_status,
-            new_status=loan.status,
-            updated_by=request.user,
-            notes=serializer.validated_data.get('notes', '')
-        )
-        
-        if loan.status == LoanApplication.Status.APPROVED:
-            self._create_loan_in_mfi_system(loan)
+        # The outbox row commits with the decision; dispatch_mfi_outbox
+        # creates the loan in the MFI cluster outside the request
+        with transaction.atomic():
+            loan = serializer.save(
+                decision_by=request.user,
+                decision_date=timezone.now()
+            )
+            
+            LoanStatusUpdate.objects.create(
+                loan=loan,
+                old_status=old_status,
+                new_status=loan.status,
+                updated_by=request.user,
+                notes=serializer.validated_data.get('notes', '')
+            )
+            
+            if loan.status == LoanApplication.Status.APPROVED:
+                enqueue_mfi_loan(loan)
         
         return Response(serializer.data)
-    
-    def _create_loan_in_mfi_system(self, loan):
-        """Cluster-specific loan creation"""
-        try:
-            logger.debug(f"Attempting to create loan in MFI system for loan ID: {loan.id}")
-            cluster = loan.mfi.cluster_name
-            if not cluster:
-                logger.error("MFI has no cluster assigned")
-                raise ValueError("MFI has no cluster assigned")
-            national_id = loan.borrower.borrower_profile.national_id
-            logger.debug(f"Looking for borrower with national_id: {national_id}")
-
 
-            with connection.cursor() as cursor:
-                # Get borrower's external ID from correct cluster
-                cursor.execute(f"""
-                    SELECT id FROM {cluster}.borrowers 
-                    WHERE national_id = %s LIMIT 1
-                """, [loan.borrower.borrower_profile.national_id])
-                
-                borrower_id = cursor.fetchone()
 
-                if not borrower_id:
-                    logger.error(f"No borrower found in {cluster} with national_id: {national_id}")
-                    raise ValueError(f"Borrower not found in {cluster} system")
-                
-                logger.debug(f"Found borrower ID: {borrower_id[0]} in {cluster}")
-                # Insert loan into correct cluster
-                cursor.execute(f"""
-                    INSERT INTO {cluster}.loans (
-                        borrower_id, amount, interest_rate, status,
-                        purpose, application_date, approval_date,
-                        term_months, external_reference
-                    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-                    RETURNING id
-                """, [
-                    borrower_id[0],
-                    float(loan.amount),
-                    float(loan.interest_rate),
-                    'approved',
-                    loan.purpose,
-                    loan.application_date,
-                    timezone.now(),
-                    loan.term_months,
-                    f"LETSEMA-{loan.id}"
-                ])
-                
-                mfi_loan_id = cursor.fetchone()[0]
-                logger.debug(f"Created loan in {cluster} with ID: {mfi_loan_id}")
-                
-                loan.external_loan_id = mfi_loan_id
-                loan.save()
-                
-                logger.info(f"Successfully created loan in {cluster} with ID {mfi_loan_id}")
-                
-        except Exception as e:
-            logger.error(f"Failed to create loan in MFI system ({cluster}): {str(e)}")
-            raise
-
-
-class LoanStatusUpdatesView(generics.ListAPIView):
+class LoanStatusUpdatesView(SparseFieldsetMixin, generics.ListAPIView):
     serializer_class = LoanStatusUpdateSerializer
     permission_classes = [permissions.IsAuthenticated]
     
@@ -184,29 +199,66 @@ class LoanStatusUpdatesView(generics.ListAPIView):
         if user.is_mfi_employee() and loan.mfi != user.mfi:
             raise PermissionDenied()
         
-        return LoanStatusUpdate.objects.filter(loan_id=loan_id)
+        queryset = LoanStatusUpdate.objects.filter(loan_id=loan_id)
+        if 'updated_by' in self.get_expand():
+            queryset = queryset.select_related('updated_by')
+        return queryset
     
-# views.py
-class MFILoansView(generics.ListAPIView):
-    """View loans in MFI systems via FDW"""
+class MFILoansView(generics.GenericAPIView):
+    """
+    Browse loans in MFI systems via FDW, for one cluster or all of them
+    (cluster 'all'). Pages are keyset-paginated newest first and streamed
+    as they are merged: {"results": [...], "next": url, "unavailable": []}.
+    """
     permission_classes = [permissions.IsAuthenticated, permissions.IsAdminUser]
+    page_size = 100
+    max_page_size = 1000
     
     def get(self, request, *args, **kwargs):
-        cluster = kwargs.get('cluster', 'mfi_a')
+        cluster = kwargs.get('cluster', 'all')
+        active = active_cluster_names()
         
-        if cluster not in ['mfi_a', 'mfi_b']:
+        if cluster == 'all':
+            clusters = active
+        elif cluster in active:
+            clusters = [cluster]
+        else:
             return Response({"error": "Invalid cluster"}, status=400)
-            
-        with connection.cursor() as cursor:
-            cursor.execute(f"""
-                SELECT l.id, b.name, l.amount, l.status, l.application_date
-                FROM {cluster}.loans l
-                JOIN {cluster}.borrowers b ON l.borrower_id = b.id
-                ORDER BY l.application_date DESC
-                LIMIT 100
-            """)
-            
-            columns = [col[0] for col in cursor.description]
-            results = [dict(zip(columns, row)) for row in cursor.fetchall()]
-            
-        return Response(results)
\ No newline at end of file
+        
+        try:
+            page_size = max(1, min(int(request.query_params.get('page_size', self.page_size)), self.max_page_size))
+        except ValueError:
+            return Response({"error": "Invalid page_size"}, status=400)
+        
+        position = None
+        if request.query_params.get('cursor'):
+            try:
+                position = decode_cursor(request.query_params['cursor'])
+            except ValueError as e:
+                return Response({"error": str(e)}, status=400)
+        
+        streams = []
+        unavailable = []
+        for name in sorted(clusters):
+            try:
+                streams.append(open_cluster_stream(name, position, page_size + 1))
+            except Exception as e:
+                logger.warning(f"Skipping unavailable cluster {name}: {str(e)}")
+                unavailable.append(name)
+        
+        def stream():
+            last = None
+            has_next = False
+            yield '{"results": ['
+            for count, loan in enumerate(merge_streams(streams, page_size + 1)):
+                if count == page_size:
+                    has_next = True
+                    break
+                yield (',' if count else '') + json.dumps(loan, cls=DjangoJSONEncoder)
+                last = loan
+            next_url = None
+            if has_next:
+                next_url = replace_query_param(request.build_absolute_uri(), 'cursor', encode_cursor(last))
+            yield '], "next": ' + json.dumps(next_url) + ', "unavailable": ' + json.dumps(unavailable) + '}'
+        
+        return StreamingHttpResponse(stream(), content_type='application/json')
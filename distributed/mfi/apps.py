@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class MfiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'mfi'
+
+    def ready(self):
+        import mfi.signals  # Keeps the cluster registry in step with MFI rows
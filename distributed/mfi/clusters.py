@@ -0,0 +1,241 @@
+"""
+Registry of the MFI clusters Letsema federates with.
+
+A cluster is configured through settings (MFI_CLUSTER_SETTINGS, generated
+from the MFI_CLUSTERS environment variable together with its DATABASES and
+FDW_SETTINGS entries) and is active while at least one active
+MicroFinanceInstitution points at it through cluster_name. Onboarding an MFI
+is configuration plus an MFI row; callers fan out over active_clusters()
+instead of naming clusters.
+
+Each cluster is reached through an access backend chosen in its settings:
+'fdw' (the default) queries the foreign tables imported into the Letsema
+database, 'direct' queries the cluster's own DATABASES alias and skips the
+second planning pass and the hop through the Letsema server. A dotted path
+to another backend class is accepted as well.
+
+Every cluster owns a bounded pool of worker threads. Each worker keeps its
+own persistent database connection, and postgres_fdw keeps one remote
+connection per local session and foreign server, so a cluster never holds
+more than pool_size connections however many requests fan out to it, and a
+slow cluster only exhausts its own workers.
+"""
+import contextvars
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POOL_SIZE = 4
+
+
+class UnknownCluster(KeyError):
+    """Raised for a cluster name that is not configured"""
+
+
+class FDWAccess:
+    """Query the cluster through its foreign tables on the Letsema database"""
+    name = 'fdw'
+
+    def __init__(self, cluster):
+        self.cluster = cluster
+        self.alias = DEFAULT_DB_ALIAS
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} {self.cluster}>"
+
+    def table(self, table):
+        """SQL name of one of the cluster's tables"""
+        return f"{self.cluster}.{table}"
+
+    @property
+    def connection(self):
+        return connections[self.alias]
+
+    def cursor(self):
+        return self.connection.cursor()
+
+
+class DirectAccess(FDWAccess):
+    """Query the cluster's own database alias without going through FDW"""
+    name = 'direct'
+
+    def __init__(self, cluster):
+        super().__init__(cluster)
+        self.alias = cluster
+
+    def table(self, table):
+        # Resolved through the alias' search_path
+        return table
+
+
+ACCESS_BACKENDS = {
+    FDWAccess.name: FDWAccess,
+    DirectAccess.name: DirectAccess,
+}
+
+
+def make_access(cluster, backend):
+    """Access backend instance for a cluster from a backend name or dotted path"""
+    backend_class = ACCESS_BACKENDS.get(backend) or import_string(backend)
+    return backend_class(cluster)
+
+
+class MFICluster:
+    """One configured MFI cluster, its access backend and its worker pool"""
+
+    def __init__(self, name, config):
+        self.name = name
+        self.pool_size = config.get('pool_size', DEFAULT_POOL_SIZE)
+        self.access = make_access(name, config.get('access', FDWAccess.name))
+        # 'live' or 'snapshot', see mfi.snapshots.credit_access
+        self.credit_source = config.get('credit_source', 'live')
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"<MFICluster {self.name}>"
+
+    @property
+    def schema(self):
+        """Local schema holding the cluster's foreign tables"""
+        return self.name
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.pool_size,
+                    thread_name_prefix=f'mfi-{self.name}'
+                )
+            return self._executor
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Run fn on one of the cluster's workers and return its future. fn runs
+        in a copy of the caller's context, so its queries count towards the
+        calling request's metrics (see letsema.metrics).
+        """
+        context = contextvars.copy_context()
+        return self._get_executor().submit(context.run, self._run, fn, *args, **kwargs)
+
+    def _run(self, fn, *args, **kwargs):
+        # Workers keep their connection between tasks, so drop it once it
+        # is broken or past CONN_MAX_AGE before reusing it.
+        self.access.connection.close_if_unusable_or_obsolete()
+        return fn(*args, **kwargs)
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+
+class ClusterRegistry:
+    """
+    Configured clusters plus the set currently active.
+
+    The active set is read from MicroFinanceInstitution at most every
+    MFI_CLUSTER_REGISTRY_TTL seconds and whenever an MFI is saved or deleted.
+    """
+
+    def __init__(self):
+        self._clusters = {}
+        self._active = None
+        self._loaded_at = 0.0
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _check_pid(self):
+        # Worker threads do not survive a fork, so a child starts over
+        pid = os.getpid()
+        if self._pid != pid:
+            self._clusters = {}
+            self._active = None
+            self._pid = pid
+
+    def configured(self):
+        """Names of all configured clusters, sorted"""
+        return sorted(getattr(settings, 'MFI_CLUSTER_SETTINGS', {}))
+
+    def get(self, name):
+        """The MFICluster called name; raises UnknownCluster if not configured"""
+        config = getattr(settings, 'MFI_CLUSTER_SETTINGS', {})
+        if name not in config:
+            raise UnknownCluster(name)
+        with self._lock:
+            self._check_pid()
+            if name not in self._clusters:
+                self._clusters[name] = MFICluster(name, config[name])
+            return self._clusters[name]
+
+    def _load_active(self):
+        from .models import MicroFinanceInstitution
+
+        configured = set(self.configured())
+        try:
+            in_use = set(
+                MicroFinanceInstitution.objects
+                .filter(is_active=True)
+                .values_list('cluster_name', flat=True)
+                .distinct()
+            )
+        except Exception as e:
+            logger.warning(f"Could not read active MFI clusters, using all configured: {str(e)}")
+            return sorted(configured)
+
+        unconfigured = in_use - configured
+        if unconfigured:
+            logger.warning(f"Active MFIs reference unconfigured clusters: {', '.join(sorted(unconfigured))}")
+        return sorted(in_use & configured)
+
+    def active(self):
+        """Active clusters as MFICluster objects, in name order"""
+        return [self.get(name) for name in self.active_names()]
+
+    def active_names(self):
+        """Names of the active clusters, sorted so merges are deterministic"""
+        ttl = getattr(settings, 'MFI_CLUSTER_REGISTRY_TTL', 60)
+        with self._lock:
+            self._check_pid()
+            active = self._active
+            if active is not None and time.monotonic() - self._loaded_at < ttl:
+                return list(active)
+
+        active = self._load_active()
+        with self._lock:
+            self._active = active
+            self._loaded_at = time.monotonic()
+        return list(active)
+
+    def invalidate(self):
+        """Re-read the active set on next use"""
+        with self._lock:
+            self._active = None
+
+
+registry = ClusterRegistry()
+
+
+def get_cluster(name):
+    return registry.get(name)
+
+
+def get_access(name):
+    """Access backend configured for the cluster called name"""
+    return registry.get(name).access
+
+
+def active_clusters():
+    return registry.active()
+
+
+def active_cluster_names():
+    return registry.active_names()
@@ -1,6 +1,72 @@
 from django.db import connection
 from django.conf import settings
-from mongo_credit.models import CreditHistory
+
+# postgres_fdw server options that only tune performance; they can be
+# changed on a live server without re-importing the foreign schema
+TUNING_OPTIONS = ('fetch_size', 'batch_size', 'use_remote_estimate', 'async_capable', 'extensions')
+
+# server_version_num from which postgres_fdw accepts an option
+OPTION_MIN_VERSION = {'batch_size': 140000, 'async_capable': 140000}
+
+def server_version_num(cursor):
+    cursor.execute("SELECT current_setting('server_version_num')::int")
+    return cursor.fetchone()[0]
+
+def supported_options(options, version):
+    """The options postgres_fdw of this server version accepts; older servers reject the rest"""
+    return {key: value for key, value in options.items() if version >= OPTION_MIN_VERSION.get(key, 0)}
+
+def _quote(value):
+    return "'" + str(value).replace("'", "''") + "'"
+
+def _server_options(options):
+    """OPTIONS clause body for the configured options, skipping unset ones"""
+    return ', '.join(f"{key} {_quote(value)}" for key, value in options.items() if value not in (None, ''))
+
+def tune_fdw_server(cursor, config, version=None):
+    """
+    Apply the tuning options from FDW_SETTINGS to an existing server.
+
+    fetch_size sets the rows fetched per round trip on scans, batch_size the
+    rows sent per remote INSERT, use_remote_estimate has the planner cost
+    remote scans with the remote statistics, async_capable lets scans of
+    different servers run concurrently (Append over clusters), and
+    extensions lists the extensions whose functions may be shipped.
+    Options the server's postgres_fdw does not support are left alone.
+    """
+    if version is None:
+        version = server_version_num(cursor)
+    options = supported_options(config['options'], version)
+
+    cursor.execute("SELECT srvoptions FROM pg_foreign_server WHERE srvname = %s", [config['server_name']])
+    row = cursor.fetchone()
+    current = dict(option.split('=', 1) for option in (row[0] or [])) if row else {}
+
+    actions = []
+    for key in TUNING_OPTIONS:
+        if key not in options:
+            continue
+        value = options[key]
+        if value in (None, ''):
+            if key in current:
+                actions.append(f"DROP {key}")
+        elif current.get(key) != str(value):
+            actions.append(f"{'SET' if key in current else 'ADD'} {key} {_quote(value)}")
+
+    if actions:
+        cursor.execute(f"ALTER SERVER {config['server_name']} OPTIONS ({', '.join(actions)})")
+    return actions
+
+def tune_fdw_servers(clusters=None):
+    """Apply FDW_SETTINGS tuning options to the given servers, or all; returns {cluster: actions}"""
+    results = {}
+    with connection.cursor() as cursor:
+        version = server_version_num(cursor)
+        for mfi_name, config in settings.FDW_SETTINGS.items():
+            if clusters and mfi_name not in clusters:
+                continue
+            results[mfi_name] = tune_fdw_server(cursor, config, version)
+    return results
 
 def setup_fdw_servers():
     """Set up foreign data wrappers for all configured MFI clusters."""
@@ -8,6 +74,7 @@ def setup_fdw_servers():
         with connection.cursor() as cursor:
             # Install the extension if not exists
             cursor.execute("CREATE EXTENSION IF NOT EXISTS postgres_fdw")
+            version = server_version_num(cursor)
             
             # Set up servers for each MFI cluster
             for mfi_name, config in settings.FDW_SETTINGS.items():
@@ -16,15 +83,11 @@ def setup_fdw_servers():
                 # Drop existing server if exists (clean setup)
                 cursor.execute(f"DROP SERVER IF EXISTS {config['server_name']} CASCADE")
                 
-                # Create server
+                # Create server with its connection and tuning options
                 cursor.execute(f"""
                     CREATE SERVER {config['server_name']}
                     FOREIGN DATA WRAPPER {config['wrapper']}
-                    OPTIONS (
-                        host '{config['options']['host']}',
-                        dbname '{config['options']['dbname']}',
-                        port '{config['options']['port']}'
-                    )
+                    OPTIONS ({_server_options(supported_options(config['options'], version))})
                 """)
                 
                 # Create user mapping
@@ -135,26 +198,12 @@ def query_mfi_data():
             print(f"Error querying data: {str(e)}")
 
 def sync_credit_histories(cluster='default'):
-    """Sync credit histories from MFI to MongoDB"""
-    from mongo_credit.credit_utils import get_mfi_credit_data, init_mongo_connection
-    
-    init_mongo_connection()
-    
-    with connection.cursor() as cursor:
-        cursor.execute(f"SELECT national_id FROM {cluster}.borrowers LIMIT 100")
-        borrowers = cursor.fetchall()
-        
-        for borrower in borrowers:
-            national_id = borrower[0]
-            try:
-                credit_data = get_mfi_credit_data(cluster, national_id)
-                CreditHistory.objects.update_or_create(
-                    national_id=national_id,
-                    defaults=credit_data
-                )
-                print(f"Synced credit history for {national_id}")
-            except Exception as e:
-                print(f"Failed to sync {national_id}: {str(e)}")
+    """Sync credit histories from MFI to MongoDB (see the sync_mfi_credit_histories command)"""
+    from mongo_credit.sync import format_sync_stats, sync_cluster_credit_histories
+
+    stats = sync_cluster_credit_histories(cluster)
+    print(f"Synced credit histories from {cluster}: {format_sync_stats(stats)}")
+    return stats
             
 
 def test_fdw_connection(cluster_name='default'):
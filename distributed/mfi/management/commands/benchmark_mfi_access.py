@@ -0,0 +1,77 @@
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from loans.mfi_browser import open_cluster_stream
+from mfi.clusters import ACCESS_BACKENDS, active_cluster_names, make_access
+from mongo_credit.credit_utils import get_mfi_credit_data_many
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare latency and throughput of the FDW and direct access paths to '
+        'MFI clusters. Point DB_<CLUSTER>_* and the FDW servers at local '
+        'Postgres instances to measure the paths without network noise.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cluster', action='append', help='Cluster to benchmark (repeatable); defaults to every active one')
+        parser.add_argument('--iterations', type=int, default=50, help='Timed runs per query and access path')
+        parser.add_argument('--batch-size', type=int, default=100, help='Borrowers per credit data query')
+        parser.add_argument('--page-size', type=int, default=100, help='Loans per browser page')
+        parser.add_argument('--concurrency', type=int, default=1, help='Parallel clients for the throughput run')
+
+    def handle(self, *args, **options):
+        clusters = options['cluster'] or active_cluster_names()
+        if not clusters:
+            raise CommandError("No active MFI clusters")
+
+        for cluster in clusters:
+            backends = {name: make_access(cluster, name) for name in ACCESS_BACKENDS}
+            national_ids = self._national_ids(backends['direct'], options['batch_size'])
+            self.stdout.write(f"{cluster}: {len(national_ids)} borrowers per credit query")
+
+            queries = {
+                'credit': lambda access: get_mfi_credit_data_many(cluster, national_ids, access),
+                'loans': lambda access: list(open_cluster_stream(cluster, None, options['page_size'], access=access)),
+            }
+            for query, run in queries.items():
+                for name, access in backends.items():
+                    try:
+                        line = self._measure(run, access, options['iterations'], options['concurrency'])
+                    except Exception as e:
+                        line = f"failed: {str(e)}"
+                    self.stdout.write(f"  {query:<6} {name:<6} {line}")
+
+    def _national_ids(self, access, size):
+        with access.cursor() as cursor:
+            cursor.execute(f"SELECT national_id FROM {access.table('borrowers')} ORDER BY id LIMIT %s", [size])
+            return [row[0] for row in cursor.fetchall()]
+
+    def _measure(self, run, access, iterations, concurrency):
+        # Untimed run so connection setup is not counted
+        run(access)
+
+        latencies = []
+        for _ in range(iterations):
+            started = time.perf_counter()
+            run(access)
+            latencies.append(time.perf_counter() - started)
+        latencies.sort()
+        p50 = statistics.median(latencies) * 1000
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000
+
+        def client(count):
+            try:
+                for _ in range(count):
+                    run(access)
+            finally:
+                connections[access.alias].close()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(client, [iterations] * concurrency))
+        throughput = iterations * concurrency / (time.perf_counter() - started)
+
+        return f"p50 {p50:8.1f} ms  p95 {p95:8.1f} ms  {throughput:8.1f} queries/s ({concurrency} clients)"
@@ -0,0 +1,87 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from loans.mfi_browser import page_query
+from mfi.clusters import FDWAccess, registry
+from mongo_credit.credit_utils import mfi_credit_query
+from mongo_credit.scoring import late_counts_query
+
+JOIN_NODES = ('Hash Join', 'Merge Join', 'Nested Loop')
+
+
+def hot_queries(access):
+    """(name, (sql, params), pushdowns expected) for each hot FDW query"""
+    sample_ids = ['PUSHDOWN-CHECK']
+    return [
+        ('credit_batch', (mfi_credit_query(access), [sample_ids]), ('join', 'aggregate')),
+        ('late_counts', (late_counts_query(access), [sample_ids]), ('join', 'aggregate')),
+        ('loan_page', page_query(access, access.cluster, None, 101), ('join', 'order', 'limit')),
+    ]
+
+
+def _walk(node):
+    yield node
+    for child in node.get('Plans', []):
+        yield from _walk(child)
+
+
+def analyze_plan(plan):
+    """Which operations of an EXPLAIN (VERBOSE, FORMAT JSON) plan ran remotely"""
+    nodes = list(_walk(plan))
+    foreign = [node for node in nodes if node['Node Type'] == 'Foreign Scan']
+    remote_sql = ' '.join(node.get('Remote SQL', '') for node in foreign)
+    local_types = {node['Node Type'] for node in nodes}
+    return {
+        'join': bool(foreign) and not local_types & set(JOIN_NODES)
+                and any('JOIN' in node.get('Relations', '') for node in foreign),
+        'aggregate': 'Aggregate' not in local_types and 'GROUP BY' in remote_sql,
+        'order': 'Sort' not in local_types and 'ORDER BY' in remote_sql,
+        'limit': 'Limit' not in local_types and 'LIMIT' in remote_sql,
+        'remote_sql': [node.get('Remote SQL', '') for node in foreign],
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        'EXPLAIN (VERBOSE) the hot MFI queries through postgres_fdw and report '
+        'whether joins, aggregates, ordering and LIMIT run on the remote server. '
+        'Exits with an error when an expected pushdown is missing.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cluster', action='append', help='Cluster to check (repeatable); defaults to every configured one')
+        parser.add_argument('--show-sql', action='store_true', help='Print the remote SQL of each query')
+
+    def handle(self, *args, **options):
+        clusters = options['cluster'] or registry.configured()
+        regressions = []
+
+        for cluster in clusters:
+            access = FDWAccess(cluster)
+            self.stdout.write(f"{cluster}:")
+            for name, (sql, params), expected in hot_queries(access):
+                try:
+                    with access.cursor() as cursor:
+                        cursor.execute(f"EXPLAIN (VERBOSE, FORMAT JSON) {sql}", params)
+                        plan = cursor.fetchone()[0]
+                except Exception as e:
+                    regressions.append(f"{cluster}.{name}")
+                    self.stdout.write(self.style.ERROR(f"  {name}: EXPLAIN failed: {str(e)}"))
+                    continue
+
+                if isinstance(plan, str):
+                    plan = json.loads(plan)
+                result = analyze_plan(plan[0]['Plan'])
+                missing = [pushdown for pushdown in expected if not result[pushdown]]
+                pushed = ', '.join(f"{pushdown}={'remote' if result[pushdown] else 'LOCAL'}" for pushdown in expected)
+
+                if missing:
+                    regressions.append(f"{cluster}.{name}")
+                    self.stdout.write(self.style.ERROR(f"  {name}: {pushed}"))
+                else:
+                    self.stdout.write(self.style.SUCCESS(f"  {name}: {pushed}"))
+                if options['show_sql']:
+                    for remote_sql in result['remote_sql']:
+                        self.stdout.write(f"    {remote_sql}")
+
+        if regressions:
+            raise CommandError(f"Pushdown missing for: {', '.join(regressions)}")
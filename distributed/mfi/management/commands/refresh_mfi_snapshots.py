@@ -0,0 +1,58 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+from mfi.clusters import active_cluster_names
+from mfi.snapshots import create_snapshots, refresh_snapshots, snapshot_status
+
+
+class Command(BaseCommand):
+    help = 'Create or refresh the local snapshots of MFI borrowers, loans and repayments'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cluster', action='append', help='Cluster to refresh (repeatable); defaults to every active one')
+        parser.add_argument('--create', action='store_true', help='(Re)create the snapshot views and indexes first')
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=0,
+            help='Keep refreshing every this many seconds; refresh once when 0',
+        )
+
+    def handle(self, *args, **options):
+        clusters = options['cluster'] or active_cluster_names()
+
+        if options['create']:
+            for cluster in clusters:
+                create_snapshots(cluster)
+                self.stdout.write(self.style.SUCCESS(f"Created {cluster} snapshot"))
+
+        while True:
+            close_old_connections()
+            self._refresh(clusters)
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
+
+    def _refresh(self, clusters):
+        def refresh(cluster):
+            try:
+                return cluster, refresh_snapshots(cluster), None
+            except Exception as e:
+                return cluster, False, e
+            finally:
+                connection.close()
+
+        # Clusters refresh in parallel, each on its own connection
+        with ThreadPoolExecutor(max_workers=max(len(clusters), 1)) as executor:
+            for cluster, refreshed, error in executor.map(refresh, clusters):
+                if error:
+                    self.stderr.write(self.style.ERROR(f"Failed to refresh {cluster} snapshot: {str(error)}"))
+                elif not refreshed:
+                    self.stdout.write(f"{cluster} snapshot refresh already running elsewhere")
+
+        for status in snapshot_status(clusters):
+            self.stdout.write(
+                f"{status['cluster']}: age {status['age_seconds']}s, "
+                f"last refresh {status['duration_seconds']}s, serving {status['serving']}"
+            )
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from mfi.fdw_setup import tune_fdw_servers
+
+
+class Command(BaseCommand):
+    help = (
+        'Apply the FDW_SETTINGS tuning options (fetch_size, batch_size, use_remote_estimate, '
+        'async_capable, extensions) to the existing postgres_fdw servers without re-importing them'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cluster', action='append', help='Cluster to tune (repeatable); defaults to every configured one')
+
+    def handle(self, *args, **options):
+        for cluster, actions in tune_fdw_servers(options['cluster']).items():
+            if actions:
+                self.stdout.write(self.style.SUCCESS(f"{cluster}: {', '.join(actions)}"))
+            else:
+                self.stdout.write(f"{cluster}: up to date")
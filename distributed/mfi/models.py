@@ -4,10 +4,21 @@ class MicroFinanceInstitution(models.Model):
     name = models.CharField(max_length=100)
     code = models.CharField(max_length=10, unique=True)
     description = models.TextField()
-    cluster_name = models.CharField(max_length=20)  # 'mfi_a' or 'mfi_b'
+    cluster_name = models.CharField(max_length=20)  # a configured cluster, see mfi.clusters
     api_endpoint = models.URLField(blank=True, null=True)
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     
     def __str__(self):
-        return f"{self.name} ({self.code})"
\ No newline at end of file
+        return f"{self.name} ({self.code})"
+
+class MFISnapshot(models.Model):
+    """Refresh state of a cluster's local snapshot tables (see mfi.snapshots)"""
+    cluster = models.CharField(max_length=20, unique=True)
+    refreshed_at = models.DateTimeField(null=True, blank=True)  # data is at least this recent
+    duration_seconds = models.FloatField(default=0)
+    last_error = models.TextField(blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.cluster} snapshot ({self.refreshed_at})"
@@ -0,0 +1,113 @@
+"""
+Set-based provisioning of Letsema borrowers into MFI clusters.
+
+All Letsema borrowers are COPYed once per cluster into a temporary staging
+table next to the cluster's tables (on the Letsema database for FDW, on the
+cluster itself for direct access). A single INSERT ... SELECT with a NOT
+EXISTS anti-join then creates the missing ones, so the work per cluster is
+one COPY and one statement however many borrowers there are. Over FDW the
+insert is sent in batches of the server's batch_size.
+"""
+import csv
+import io
+import logging
+import time
+from django.db import transaction
+from .clusters import get_access
+
+logger = logging.getLogger(__name__)
+
+# Borrowers are created in MFI systems with this score until one is synced
+DEFAULT_CREDIT_SCORE = 650
+
+STAGING_COLUMNS = ('name', 'email', 'phone', 'national_id', 'credit_score')
+
+
+def letsema_borrowers_csv():
+    """
+    CSV (without header) of every Letsema borrower in STAGING_COLUMNS
+    order, read in one query through a server-side cursor.
+    """
+    from users.models import BorrowerProfile, User
+
+    rows = (
+        BorrowerProfile.objects
+        .filter(user__role=User.Role.BORROWER)
+        .order_by('pk')
+        .values_list('user__first_name', 'user__last_name', 'user__email', 'phone_number', 'national_id')
+        .iterator(chunk_size=5000)
+    )
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    count = 0
+    for first_name, last_name, email, phone, national_id in rows:
+        writer.writerow([f"{first_name} {last_name}".strip(), email, phone or '', national_id, DEFAULT_CREDIT_SCORE])
+        count += 1
+    return buffer.getvalue(), count
+
+
+def provision_borrowers(cluster, borrowers_csv, dry_run=False, progress=None):
+    """
+    Create the borrowers missing from a cluster, matching on email or
+    national_id as the per-borrower sync did. Staged borrowers sharing an
+    email or a national_id are created once.
+
+    Returns {'missing': n, 'created': n, 'elapsed': seconds}; nothing is
+    written when dry_run is set. progress, if given, is called with a
+    message as each step starts.
+    """
+    access = get_access(cluster)
+    borrowers = access.table('borrowers')
+    started = time.monotonic()
+    report = progress or (lambda message: None)
+
+    with transaction.atomic(using=access.alias), access.cursor() as cursor:
+        cursor.execute("""
+            CREATE TEMPORARY TABLE letsema_borrower_staging (
+                name text, email text, phone text, national_id text, credit_score integer
+            ) ON COMMIT DROP
+        """)
+        cursor.copy_expert(
+            f"COPY letsema_borrower_staging ({', '.join(STAGING_COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+            io.StringIO(borrowers_csv)
+        )
+        report("staged borrowers")
+        cursor.execute("ANALYZE letsema_borrower_staging")
+
+        # Two anti-joins rather than one with an OR, so each can be a hash
+        # anti-join over a single scan of the cluster's borrowers. The
+        # DISTINCT ONs keep one staged row per email (borrowers without one
+        # stand alone) and then per national_id, as the cluster matches on both.
+        missing = f"""
+            SELECT DISTINCT ON (e.national_id) e.name, e.email, e.phone, e.national_id, e.credit_score
+            FROM (
+                SELECT DISTINCT ON (COALESCE(s.email, s.national_id)) s.*
+                FROM letsema_borrower_staging s
+                WHERE NOT EXISTS (SELECT 1 FROM {borrowers} b WHERE b.national_id = s.national_id)
+                  AND NOT EXISTS (SELECT 1 FROM {borrowers} b WHERE b.email = s.email)
+                ORDER BY COALESCE(s.email, s.national_id), s.national_id
+            ) e
+            ORDER BY e.national_id
+        """
+
+        if dry_run:
+            cursor.execute(f"SELECT COUNT(*) FROM ({missing}) m")
+            count = cursor.fetchone()[0]
+            return {'missing': count, 'created': 0, 'elapsed': time.monotonic() - started}
+
+        report("creating missing borrowers")
+        cursor.execute(f"""
+            INSERT INTO {borrowers} (
+                name, email, phone,
+                national_id, credit_score,
+                created_at, updated_at
+            )
+            SELECT m.name, m.email, m.phone, m.national_id, m.credit_score, NOW(), NOW()
+            FROM ({missing}) m
+        """)
+        created = cursor.rowcount
+
+    elapsed = time.monotonic() - started
+    logger.info(f"Provisioned {created} borrowers in {cluster} in {elapsed:.1f}s")
+    return {'missing': created, 'created': created, 'elapsed': elapsed}
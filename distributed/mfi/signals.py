@@ -0,0 +1,10 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .clusters import registry
+from .models import MicroFinanceInstitution
+
+
+@receiver([post_save, post_delete], sender=MicroFinanceInstitution)
+def refresh_active_clusters(sender, **kwargs):
+    """Activating, moving or removing an MFI can change the active clusters"""
+    registry.invalidate()
@@ -0,0 +1,188 @@
+"""
+Local snapshots of the MFI clusters' borrowers, loans and repayments.
+
+Each cluster's foreign tables are materialized into a {cluster}_snapshot
+schema on the Letsema database, indexed for the credit queries, and
+refreshed with REFRESH MATERIALIZED VIEW CONCURRENTLY so readers are never
+blocked. The three views of a cluster are refreshed in one transaction;
+postgres_fdw reads them in a single repeatable read remote transaction, so
+a snapshot is consistent across tables.
+
+Clusters whose credit_source is 'snapshot' have the credit pipeline read
+the snapshot while it is younger than MFI_SNAPSHOT_MAX_AGE seconds, and
+fall back to the live tables otherwise.
+"""
+import logging
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.utils import timezone
+from .clusters import FDWAccess, get_cluster
+from .models import MFISnapshot
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_TABLES = ('borrowers', 'loans', 'repayments')
+
+# (index name, columns, unique) per table. REFRESH ... CONCURRENTLY needs a
+# unique index on every view.
+SNAPSHOT_INDEXES = {
+    'borrowers': [
+        ('borrowers_id_uniq', 'id', True),
+        ('borrowers_national_id_idx', 'national_id', False),
+    ],
+    'loans': [
+        ('loans_id_uniq', 'id', True),
+        ('loans_borrower_id_idx', 'borrower_id', False),
+    ],
+    'repayments': [
+        ('repayments_id_uniq', 'id', True),
+        ('repayments_loan_id_idx', 'loan_id', False),
+    ],
+}
+
+# Seconds a snapshot's refresh time is cached before the credit path re-reads it
+AGE_CACHE_SECONDS = 10
+
+
+def snapshot_schema(cluster):
+    return f"{cluster}_snapshot"
+
+
+class SnapshotAccess(FDWAccess):
+    """Read a cluster's local snapshot instead of its foreign tables"""
+    name = 'snapshot'
+
+    def table(self, table):
+        return f"{snapshot_schema(self.cluster)}.{table}"
+
+
+def _refreshed_key(cluster):
+    return f"mfi_snapshot:{cluster}:refreshed_at"
+
+
+def _record(cluster, **fields):
+    MFISnapshot.objects.update_or_create(cluster=cluster, defaults=fields)
+    cache.delete(_refreshed_key(cluster))
+
+
+def create_snapshots(cluster):
+    """(Re)create and populate a cluster's snapshot views and their indexes"""
+    schema = snapshot_schema(cluster)
+    started_at = timezone.now()
+    started = time.monotonic()
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"CREATE SCHEMA IF NOT EXISTS {schema}")
+        for table in SNAPSHOT_TABLES:
+            cursor.execute(f"DROP MATERIALIZED VIEW IF EXISTS {schema}.{table}")
+            cursor.execute(f"CREATE MATERIALIZED VIEW {schema}.{table} AS SELECT * FROM {cluster}.{table}")
+            for name, columns, unique in SNAPSHOT_INDEXES[table]:
+                cursor.execute(f"CREATE {'UNIQUE ' if unique else ''}INDEX {name} ON {schema}.{table} ({columns})")
+            cursor.execute(f"ANALYZE {schema}.{table}")
+
+    _record(cluster, refreshed_at=started_at, duration_seconds=time.monotonic() - started, last_error='')
+    logger.info(f"Created {cluster} snapshot in {time.monotonic() - started:.1f}s")
+
+
+def refresh_snapshots(cluster):
+    """
+    Refresh a cluster's snapshot views concurrently.
+
+    Returns False without doing anything when another process is already
+    refreshing the cluster. Failures are recorded on the MFISnapshot row and
+    re-raised.
+    """
+    schema = snapshot_schema(cluster)
+    started_at = timezone.now()
+    started = time.monotonic()
+
+    try:
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute("SELECT pg_try_advisory_xact_lock(hashtext(%s))", [f"mfi_snapshot:{cluster}"])
+            if not cursor.fetchone()[0]:
+                logger.info(f"{cluster} snapshot refresh already running, skipping")
+                return False
+            for table in SNAPSHOT_TABLES:
+                cursor.execute(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {schema}.{table}")
+    except Exception as e:
+        _record(cluster, last_error=str(e)[:2000])
+        raise
+
+    duration = time.monotonic() - started
+    _record(cluster, refreshed_at=started_at, duration_seconds=duration, last_error='')
+    logger.info(f"Refreshed {cluster} snapshot in {duration:.1f}s")
+    return True
+
+
+def snapshot_refreshed_at(cluster):
+    """When the cluster's snapshot data was taken, None if never built"""
+    key = _refreshed_key(cluster)
+    cached = cache.get(key)
+    if cached is None:
+        refreshed_at = (
+            MFISnapshot.objects
+            .filter(cluster=cluster)
+            .values_list('refreshed_at', flat=True)
+            .first()
+        )
+        # False marks "no snapshot" so it is cached too
+        cached = refreshed_at or False
+        cache.set(key, cached, AGE_CACHE_SECONDS)
+    return cached or None
+
+
+def snapshot_age(cluster):
+    """Age of the cluster's snapshot in seconds, None if never built"""
+    refreshed_at = snapshot_refreshed_at(cluster)
+    if refreshed_at is None:
+        return None
+    return (timezone.now() - refreshed_at).total_seconds()
+
+
+def credit_access(cluster):
+    """
+    Access backend the credit pipeline reads a cluster through: the local
+    snapshot when the cluster is configured for it and the snapshot is
+    fresh enough, the cluster's live access backend otherwise.
+    """
+    mfi_cluster = get_cluster(cluster)
+    if mfi_cluster.credit_source != SnapshotAccess.name:
+        return mfi_cluster.access
+
+    age = snapshot_age(cluster)
+    max_age = getattr(settings, 'MFI_SNAPSHOT_MAX_AGE', 900)
+    if age is None or age > max_age:
+        logger.warning(f"{cluster} snapshot is missing or older than {max_age}s, reading live tables")
+        return mfi_cluster.access
+    return SnapshotAccess(cluster)
+
+
+def snapshot_status(clusters):
+    """Snapshot state per cluster, for operators and the status endpoint"""
+    max_age = getattr(settings, 'MFI_SNAPSHOT_MAX_AGE', 900)
+    snapshots = {snapshot.cluster: snapshot for snapshot in MFISnapshot.objects.filter(cluster__in=clusters)}
+    now = timezone.now()
+
+    status = []
+    for cluster in clusters:
+        snapshot = snapshots.get(cluster)
+        refreshed_at = snapshot.refreshed_at if snapshot else None
+        age = (now - refreshed_at).total_seconds() if refreshed_at else None
+        credit_source = get_cluster(cluster).credit_source
+        status.append({
+            'cluster': cluster,
+            'credit_source': credit_source,
+            'serving': (
+                SnapshotAccess.name
+                if credit_source == SnapshotAccess.name and age is not None and age <= max_age
+                else 'live'
+            ),
+            'refreshed_at': refreshed_at,
+            'age_seconds': round(age, 1) if age is not None else None,
+            'max_age_seconds': max_age,
+            'duration_seconds': round(snapshot.duration_seconds, 2) if snapshot else None,
+            'last_error': snapshot.last_error if snapshot else '',
+        })
+    return status
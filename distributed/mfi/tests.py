@@ -1,3 +1,204 @@
-from django.test import TestCase
+from unittest import mock
+from django.test import TestCase, override_settings
+from .clusters import ClusterRegistry, DirectAccess, FDWAccess, UnknownCluster, make_access
+from .models import MicroFinanceInstitution
 
-# Create your tests here.
+
+@override_settings(MFI_CLUSTER_SETTINGS={'mfi_a': {'pool_size': 2}, 'mfi_b': {'access': 'direct'}, 'mfi_c': {}})
+class ClusterRegistryTest(TestCase):
+    def setUp(self):
+        self.registry = ClusterRegistry()
+
+    def _mfi(self, code, cluster_name, is_active=True):
+        return MicroFinanceInstitution.objects.create(
+            name=f"MFI {code}", code=code, description="", cluster_name=cluster_name, is_active=is_active
+        )
+
+    def test_active_clusters_come_from_active_mfis(self):
+        self._mfi('C', 'mfi_c')
+        self._mfi('A', 'mfi_a')
+        self._mfi('A2', 'mfi_a')
+        self._mfi('B', 'mfi_b', is_active=False)
+        self._mfi('X', 'mfi_x')  # not configured
+
+        self.assertEqual(self.registry.active_names(), ['mfi_a', 'mfi_c'])
+        self.assertEqual([cluster.name for cluster in self.registry.active()], ['mfi_a', 'mfi_c'])
+
+    def test_active_set_is_cached_until_invalidated(self):
+        self._mfi('A', 'mfi_a')
+        self.assertEqual(self.registry.active_names(), ['mfi_a'])
+
+        self._mfi('B', 'mfi_b')
+        self.assertEqual(self.registry.active_names(), ['mfi_a'])
+
+        self.registry.invalidate()
+        self.assertEqual(self.registry.active_names(), ['mfi_a', 'mfi_b'])
+
+    def test_cluster_pool_settings(self):
+        self.assertEqual(self.registry.get('mfi_a').pool_size, 2)
+        self.assertIs(self.registry.get('mfi_a'), self.registry.get('mfi_a'))
+        with self.assertRaises(UnknownCluster):
+            self.registry.get('mfi_x')
+
+    def test_submit_runs_on_cluster_worker(self):
+        import threading
+
+        future = self.registry.get('mfi_b').submit(lambda: threading.current_thread().name)
+        self.assertTrue(future.result(timeout=5).startswith('mfi-mfi_b'))
+        self.registry.get('mfi_b').shutdown()
+
+    def test_worker_reuses_its_connection_across_tasks(self):
+        from django.db import connections
+
+        def backend_connection():
+            connection = connections['default']
+            connection.ensure_connection()
+            return id(connection.connection)
+
+        self.assertNotEqual(connections.settings['default']['CONN_MAX_AGE'], 0)
+        cluster = self.registry.get('mfi_c')
+        cluster.pool_size = 1
+        try:
+            first = cluster.submit(backend_connection).result(timeout=5)
+            second = cluster.submit(backend_connection).result(timeout=5)
+        finally:
+            cluster.submit(connections.close_all).result(timeout=5)
+            cluster.shutdown()
+        self.assertEqual(first, second)
+
+    def test_access_backend_per_cluster(self):
+        fdw = self.registry.get('mfi_a').access
+        direct = self.registry.get('mfi_b').access
+
+        self.assertIsInstance(fdw, FDWAccess)
+        self.assertEqual((fdw.alias, fdw.table('loans')), ('default', 'mfi_a.loans'))
+        self.assertIsInstance(direct, DirectAccess)
+        self.assertEqual((direct.alias, direct.table('loans')), ('mfi_b', 'loans'))
+        self.assertIsInstance(make_access('mfi_c', 'mfi.clusters.DirectAccess'), DirectAccess)
+
+
+@override_settings(
+    MFI_CLUSTER_SETTINGS={'mfi_a': {'credit_source': 'snapshot'}, 'mfi_b': {}},
+    MFI_SNAPSHOT_MAX_AGE=600,
+)
+class SnapshotAccessTest(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        from . import clusters
+
+        cache.clear()
+        self.registry = ClusterRegistry()
+        patcher = mock.patch.object(clusters, 'registry', self.registry)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_fresh_snapshot_is_read(self):
+        from django.utils import timezone
+        from .models import MFISnapshot
+        from .snapshots import SnapshotAccess, credit_access
+
+        MFISnapshot.objects.create(cluster='mfi_a', refreshed_at=timezone.now())
+        access = credit_access('mfi_a')
+        self.assertIsInstance(access, SnapshotAccess)
+        self.assertEqual(access.table('loans'), 'mfi_a_snapshot.loans')
+
+    def test_stale_or_missing_snapshot_falls_back_to_live(self):
+        from datetime import timedelta
+        from django.core.cache import cache
+        from django.utils import timezone
+        from .models import MFISnapshot
+        from .snapshots import SnapshotAccess, credit_access, snapshot_status
+
+        self.assertNotIsInstance(credit_access('mfi_a'), SnapshotAccess)
+
+        MFISnapshot.objects.create(cluster='mfi_a', refreshed_at=timezone.now() - timedelta(hours=1))
+        cache.clear()
+        self.assertNotIsInstance(credit_access('mfi_a'), SnapshotAccess)
+        self.assertEqual(credit_access('mfi_b'), self.registry.get('mfi_b').access)
+
+        status = {entry['cluster']: entry for entry in snapshot_status(['mfi_a', 'mfi_b'])}
+        self.assertEqual(status['mfi_a']['serving'], 'live')
+        self.assertGreater(status['mfi_a']['age_seconds'], 600)
+        self.assertIsNone(status['mfi_b']['age_seconds'])
+
+
+class PushdownAnalysisTest(TestCase):
+    def test_fully_pushed_aggregate(self):
+        from .management.commands.check_fdw_pushdown import analyze_plan
+
+        plan = {
+            'Node Type': 'Foreign Scan',
+            'Relations': 'Aggregate on ((mfi_a.borrowers b) INNER JOIN (mfi_a.loans l))',
+            'Remote SQL': 'SELECT r1.national_id, sum(...) FROM (public.borrowers r1 INNER JOIN public.loans r2 ON (...)) GROUP BY 1',
+        }
+        result = analyze_plan(plan)
+        self.assertTrue(result['join'])
+        self.assertTrue(result['aggregate'])
+        self.assertFalse(result['limit'])
+
+    def test_local_join_is_reported(self):
+        from .management.commands.check_fdw_pushdown import analyze_plan
+
+        plan = {
+            'Node Type': 'Limit',
+            'Plans': [{
+                'Node Type': 'Hash Join',
+                'Plans': [
+                    {'Node Type': 'Foreign Scan', 'Relations': '(mfi_a.loans l)', 'Remote SQL': 'SELECT ... FROM public.loans'},
+                    {'Node Type': 'Foreign Scan', 'Relations': '(mfi_a.borrowers b)', 'Remote SQL': 'SELECT ... FROM public.borrowers'},
+                ],
+            }],
+        }
+        result = analyze_plan(plan)
+        self.assertFalse(result['join'])
+        self.assertFalse(result['limit'])
+
+
+class FDWTuningTest(TestCase):
+    config = {
+        'server_name': 'mfi_a_server',
+        'options': {
+            'host': 'mfi-a', 'fetch_size': '1000', 'batch_size': '500',
+            'use_remote_estimate': 'true', 'async_capable': 'true', 'extensions': '',
+        },
+    }
+
+    def _cursor(self, current):
+        cursor = mock.Mock()
+        cursor.fetchone.return_value = (current,)
+        return cursor
+
+    def test_options_are_added_changed_and_dropped(self):
+        from .fdw_setup import tune_fdw_server
+
+        cursor = self._cursor(['host=mfi-a', 'fetch_size=100', 'use_remote_estimate=true', 'extensions=cube'])
+        actions = tune_fdw_server(cursor, self.config, version=160000)
+
+        self.assertEqual(actions, [
+            "SET fetch_size '1000'", "ADD batch_size '500'", "ADD async_capable 'true'", 'DROP extensions',
+        ])
+        cursor.execute.assert_called_with(f"ALTER SERVER mfi_a_server OPTIONS ({', '.join(actions)})")
+
+    def test_options_unsupported_before_postgres_14_are_skipped(self):
+        from .fdw_setup import supported_options, tune_fdw_server
+
+        self.assertNotIn('batch_size', supported_options(self.config['options'], 130000))
+        self.assertNotIn('async_capable', supported_options(self.config['options'], 130000))
+
+        cursor = self._cursor(['fetch_size=1000', 'use_remote_estimate=true'])
+        self.assertEqual(tune_fdw_server(cursor, self.config, version=130000), [])
+
+    def test_command_reports_each_server(self):
+        import io
+        from django.core.management import call_command
+
+        stdout = io.StringIO()
+        with mock.patch(
+            'mfi.management.commands.tune_fdw_servers.tune_fdw_servers',
+            return_value={'mfi_a': ["SET fetch_size '1000'"], 'mfi_b': []},
+        ) as tune:
+            call_command('tune_fdw_servers', '--cluster', 'mfi_a', '--cluster', 'mfi_b', stdout=stdout)
+
+        tune.assert_called_once_with(['mfi_a', 'mfi_b'])
+        self.assertIn("mfi_a: SET fetch_size '1000'", stdout.getvalue())
+        self.assertIn('mfi_b: up to date', stdout.getvalue())
@@ -6,4 +6,5 @@ urlpatterns = [
     path('', views.MFIListView.as_view(), name='mfi-list'),
     path('<int:pk>/', views.MFIDetailView.as_view(), name='mfi-detail'),
     path('test-connection/<str:cluster>/', views.TestConnectionView.as_view(), name='test-connection'),
+    path('snapshots/', views.SnapshotStatusView.as_view(), name='mfi-snapshots'),
 ]
\ No newline at end of file
@@ -1,8 +1,10 @@
 # views.py - Add filtering by cluster and more endpoints
-from rest_framework import generics, status
+from rest_framework import generics, permissions, status
 from rest_framework.response import Response
+from .clusters import registry
 from .models import MicroFinanceInstitution
 from .serializers import MicroFinanceInstitutionSerializer
+from .snapshots import snapshot_status
 
 class MFIListView(generics.ListCreateAPIView):
     queryset = MicroFinanceInstitution.objects.all()
@@ -27,4 +29,11 @@ class TestConnectionView(generics.GenericAPIView):
             'status': 'success',
             'message': f'Connection test for {cluster} cluster',
             'cluster': cluster
-        }, status=status.HTTP_200_OK)
\ No newline at end of file
+        }, status=status.HTTP_200_OK)
+
+class SnapshotStatusView(generics.GenericAPIView):
+    """Age and refresh state of each configured cluster's local snapshot"""
+    permission_classes = [permissions.IsAuthenticated, permissions.IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        return Response(snapshot_status(registry.configured()))
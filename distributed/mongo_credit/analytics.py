@@ -0,0 +1,230 @@
+"""
+Precomputed credit book analytics.
+
+Every credit history summary carries its borrower's score per source
+(source_scores) and loan book (loan_book: loan totals per source, MFI and
+status). analytics_pipeline() folds a set of summaries into score
+histograms, loan totals and portfolio-at-risk figures per scope: 'all' for
+the combined book, 'letsema' and one scope per cluster.
+
+The figures are kept in one CreditAnalytics rollup document per scope.
+Each bulk write of summaries runs the pipeline over the written borrowers
+before and after the write and $inc's the difference into the rollups, so
+keeping them current costs one indexed aggregation per chunk and a
+dashboard read is one small document per scope. Concurrent writes of the
+same borrower can double count; rebuild_rollups() (the
+rebuild_credit_analytics command) recomputes everything from scratch.
+"""
+import logging
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+from pymongo import ReplaceOne, UpdateOne
+from pymongo.errors import PyMongoError
+from .models import CreditAnalytics, CreditHistory
+
+logger = logging.getLogger(__name__)
+
+ALL = 'all'
+LETSEMA = 'letsema'
+
+SCORE_MIN = 300
+SCORE_MAX = 850
+SCORE_BIN = 50
+
+# Summed per source, MFI and status in loan_book entries and the rollups
+LOAN_FIELDS = ('count', 'amount', 'outstanding', 'at_risk', 'at_risk_count')
+
+
+def _key(value):
+    """Make value usable as a Mongo field name"""
+    return str(value).replace('.', '_').lstrip('$') or 'unknown'
+
+
+def loan_book(source, loans):
+    """
+    Collapse a borrower's (mfi, status, amount, outstanding, late) loan
+    tuples from one source into loan_book entries per MFI and status.
+
+    Outstanding loans with a late repayment count as at risk.
+    """
+    book = {}
+    for mfi, status, amount, outstanding, late in loans:
+        entry = book.get((mfi, status))
+        if entry is None:
+            entry = book[(mfi, status)] = {
+                'source': source, 'mfi': _key(mfi), 'status': _key(status),
+                **{field: 0 for field in LOAN_FIELDS},
+            }
+        entry['count'] += 1
+        entry['amount'] += amount
+        if outstanding:
+            entry['outstanding'] += amount
+            if late:
+                entry['at_risk'] += amount
+                entry['at_risk_count'] += 1
+    return list(book.values())
+
+
+def _score_bin(score):
+    offset = {'$multiply': [{'$floor': {'$divide': [{'$subtract': [score, SCORE_MIN]}, SCORE_BIN]}}, SCORE_BIN]}
+    return {'$min': [{'$max': [{'$add': [SCORE_MIN, offset]}, SCORE_MIN]}, SCORE_MAX - SCORE_BIN]}
+
+
+def analytics_pipeline(national_ids=None):
+    """
+    Aggregation pipeline totalling the summaries of the given borrowers,
+    or of every borrower, into one {'scores': [...], 'loans': [...]} document
+    """
+    pipeline = []
+    if national_ids is not None:
+        pipeline.append({'$match': {'national_id': {'$in': list(national_ids)}}})
+    pipeline.append({'$facet': {
+        'scores': [
+            {'$project': {'_id': 0, 'scores': {'$concatArrays': [
+                [{'k': ALL, 'v': '$credit_score'}],
+                {'$objectToArray': {'$ifNull': ['$source_scores', {}]}},
+            ]}}},
+            {'$unwind': '$scores'},
+            {'$match': {'scores.v': {'$type': 'number'}}},
+            {'$group': {
+                '_id': {'scope': '$scores.k', 'bin': _score_bin('$scores.v')},
+                'borrowers': {'$sum': 1},
+            }},
+        ],
+        'loans': [
+            {'$unwind': '$loan_book'},
+            {'$group': {
+                '_id': {'source': '$loan_book.source', 'mfi': '$loan_book.mfi', 'status': '$loan_book.status'},
+                **{field: {'$sum': f'$loan_book.{field}'} for field in LOAN_FIELDS},
+            }},
+        ],
+    }})
+    return pipeline
+
+
+def aggregate_totals(national_ids=None):
+    """{scope: {field path: total}} for the given borrowers, or all of them"""
+    result = next(CreditHistory._get_collection().aggregate(analytics_pipeline(national_ids)))
+
+    totals = defaultdict(lambda: defaultdict(int))
+    for row in result['scores']:
+        scope = row['_id']['scope']
+        totals[scope][f"score_histogram.{int(row['_id']['bin'])}"] += row['borrowers']
+        totals[scope]['borrowers'] += row['borrowers']
+    for row in result['loans']:
+        group = row['_id']
+        for scope in {ALL, group['source']}:
+            for field in LOAN_FIELDS:
+                totals[scope][f"totals.{field}"] += row[field]
+                totals[scope][f"by_status.{group['status']}.{field}"] += row[field]
+                totals[scope][f"by_mfi.{group['mfi']}.{field}"] += row[field]
+    return totals
+
+
+def _difference(after, before):
+    increments = {}
+    for scope in set(after) | set(before):
+        fields = {}
+        for path in set(after.get(scope, {})) | set(before.get(scope, {})):
+            delta = after.get(scope, {}).get(path, 0) - before.get(scope, {}).get(path, 0)
+            if delta:
+                fields[path] = delta
+        if fields:
+            increments[scope] = fields
+    return increments
+
+
+def apply_increments(increments):
+    """$inc {scope: {field path: delta}} into the rollup documents"""
+    if not increments:
+        return
+    now = datetime.now()
+    CreditAnalytics._get_collection().bulk_write([
+        UpdateOne({'scope': scope}, {'$inc': fields, '$set': {'updated_at': now}}, upsert=True)
+        for scope, fields in increments.items()
+    ], ordered=False)
+
+
+@contextmanager
+def track_rollups(national_ids):
+    """
+    Fold the changes made to the given borrowers' summaries inside the
+    block into the rollups. Analytics failures are logged and never fail
+    the write they accompany.
+    """
+    national_ids = list(national_ids)
+    try:
+        before = aggregate_totals(national_ids)
+    except PyMongoError as e:
+        logger.error(f"Could not read analytics before write, rollups not updated: {str(e)}")
+        yield
+        return
+
+    try:
+        yield
+    finally:
+        try:
+            apply_increments(_difference(aggregate_totals(national_ids), before))
+        except PyMongoError as e:
+            logger.error(f"Could not update analytics rollups for {len(national_ids)} borrowers: {str(e)}")
+
+
+def _nest(fields):
+    document = {}
+    for path, value in fields.items():
+        *parents, leaf = path.split('.')
+        target = document
+        for parent in parents:
+            target = target.setdefault(parent, {})
+        target[leaf] = value
+    return document
+
+
+def rebuild_rollups():
+    """Recompute every rollup from all summaries; returns the scopes written"""
+    totals = aggregate_totals()
+    now = datetime.now()
+    collection = CreditAnalytics._get_collection()
+    if totals:
+        collection.bulk_write([
+            ReplaceOne({'scope': scope}, {'scope': scope, **_nest(fields), 'updated_at': now}, upsert=True)
+            for scope, fields in totals.items()
+        ], ordered=False)
+    collection.delete_many({'scope': {'$nin': list(totals)}})
+    return sorted(totals)
+
+
+def _with_par(figures):
+    figures = {field: figures.get(field, 0) for field in LOAN_FIELDS}
+    outstanding = figures['outstanding']
+    figures['portfolio_at_risk'] = round(figures['at_risk'] / outstanding, 4) if outstanding else 0.0
+    return figures
+
+
+def format_rollup(document):
+    """API representation of a rollup document"""
+    histogram = document.get('score_histogram', {})
+    return {
+        'scope': document['scope'],
+        'borrowers': document.get('borrowers', 0),
+        'score_histogram': [
+            {
+                'min': low,
+                'max': SCORE_MAX if low == SCORE_MAX - SCORE_BIN else low + SCORE_BIN - 1,
+                'borrowers': histogram.get(str(low), 0),
+            }
+            for low in range(SCORE_MIN, SCORE_MAX, SCORE_BIN)
+        ],
+        'totals': _with_par(document.get('totals', {})),
+        'by_status': {status: _with_par(figures) for status, figures in sorted(document.get('by_status', {}).items())},
+        'by_mfi': {mfi: _with_par(figures) for mfi, figures in sorted(document.get('by_mfi', {}).items())},
+        'updated_at': document.get('updated_at'),
+    }
+
+
+def get_rollups(scopes=None):
+    """Formatted rollups of the given scopes, or all, keyed by scope"""
+    query = {'scope': {'$in': list(scopes)}} if scopes else {}
+    documents = CreditAnalytics._get_collection().find(query, {'_id': 0})
+    return {document['scope']: format_rollup(document) for document in documents}
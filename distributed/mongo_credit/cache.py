@@ -0,0 +1,89 @@
+import logging
+from django.conf import settings
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+CACHE_ALIAS = 'credit_history'
+HITS_KEY = 'credit_history:stats:hits'
+MISSES_KEY = 'credit_history:stats:misses'
+
+# Fields cached for each credit history, matching CreditHistorySerializer
+CACHED_FIELDS = (
+    'national_id', 'credit_score', 'active_loans', 'total_debt',
+    'payment_count', 'inquiry_count', 'created_at', 'updated_at',
+)
+
+
+def _cache():
+    return caches[CACHE_ALIAS]
+
+
+def _key(national_id):
+    return f"credit_history:{national_id}"
+
+
+def _count(key):
+    cache = _cache()
+    try:
+        cache.incr(key)
+    except ValueError:
+        # First event since the counter expired or was evicted
+        if not cache.add(key, 1, timeout=None):
+            cache.incr(key)
+
+
+def get_credit_history(national_id, loader):
+    """
+    Read-through lookup of a credit history by national_id.
+
+    loader is called on a miss and must return a CreditHistory document (or
+    None). The serializer fields of the document are cached as a dict for
+    CREDIT_HISTORY_CACHE_TTL seconds; both hits and misses return that dict.
+    """
+    cache = _cache()
+    key = _key(national_id)
+
+    cached = cache.get(key)
+    if cached is not None:
+        _count(HITS_KEY)
+        return cached
+
+    _count(MISSES_KEY)
+    document = loader()
+    if document is None:
+        return None
+
+    data = {field: getattr(document, field) for field in CACHED_FIELDS}
+    cache.set(key, data, timeout=getattr(settings, 'CREDIT_HISTORY_CACHE_TTL', 300))
+    return data
+
+
+def invalidate_credit_history(*national_ids):
+    """Drop cached credit histories after their documents were rewritten"""
+    if not national_ids:
+        return
+    try:
+        _cache().delete_many([_key(national_id) for national_id in national_ids])
+    except Exception as e:
+        # A stale entry expires with its TTL; never fail the write over it
+        logger.warning(f"Could not invalidate cached credit histories: {str(e)}")
+
+
+def cache_stats():
+    """Hit and miss counters shared by every worker using the cache"""
+    counters = _cache().get_many([HITS_KEY, MISSES_KEY])
+    hits = counters.get(HITS_KEY, 0)
+    misses = counters.get(MISSES_KEY, 0)
+    lookups = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': round(hits / lookups, 4) if lookups else None,
+        'ttl_seconds': getattr(settings, 'CREDIT_HISTORY_CACHE_TTL', 300),
+        'backend': settings.CACHES[CACHE_ALIAS]['BACKEND'],
+    }
+
+
+def reset_cache_stats():
+    _cache().delete_many([HITS_KEY, MISSES_KEY])
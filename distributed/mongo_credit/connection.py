@@ -0,0 +1,120 @@
+import logging
+import os
+import threading
+import time
+from django.conf import settings
+from mongoengine import connect, disconnect
+from mongoengine.connection import get_connection
+from letsema.metrics import MongoCommandListener
+
+logger = logging.getLogger(__name__)
+
+# pid of the process that owns the current mongoengine client. MongoClient is
+# not fork-safe, so a child inheriting a parent's client must reconnect.
+_connected_pid = None
+_lock = threading.Lock()
+
+
+def _pool_options():
+    pool = getattr(settings, 'MONGO_POOL', {})
+    return {
+        'maxPoolSize': pool.get('max_pool_size', 50),
+        'minPoolSize': pool.get('min_pool_size', 0),
+        'maxIdleTimeMS': pool.get('max_idle_time_ms', 300000),
+        'waitQueueTimeoutMS': pool.get('wait_queue_timeout_ms', 2000),
+    }
+
+
+def get_mongo_client():
+    """
+    Return the process-wide MongoDB client, connecting on first use.
+
+    The client is created once per process; after a fork (gunicorn preload)
+    the child creates its own instead of reusing the parent's sockets.
+    """
+    global _connected_pid
+
+    pid = os.getpid()
+    if _connected_pid == pid:
+        return get_connection()
+
+    with _lock:
+        if _connected_pid != pid:
+            if _connected_pid is not None:
+                # Inherited from the parent process, never use its pool
+                disconnect(alias='default')
+            try:
+                connect(
+                    db=settings.MONGO_DBNAME,
+                    host=settings.MONGO_HOST,
+                    username=settings.MONGO_USER,
+                    password=settings.MONGO_PASS,
+                    alias='default',
+                    connectTimeoutMS=5000,
+                    serverSelectionTimeoutMS=5000,
+                    retryWrites=True,
+                    event_listeners=[MongoCommandListener()],
+                    **_pool_options()
+                )
+            except Exception as e:
+                logger.error(f"Failed to connect to MongoDB: {str(e)}")
+                raise
+            _connected_pid = pid
+            logger.info(f"MongoDB connection initialized for process {pid}")
+
+    return get_connection()
+
+
+def mongo_health():
+    """Ping MongoDB and report status, round trip time and pool settings"""
+    started = time.monotonic()
+    try:
+        get_mongo_client().admin.command('ping')
+        return {
+            'status': 'ok',
+            'latency_ms': round((time.monotonic() - started) * 1000, 2),
+            'pid': os.getpid(),
+            'pool': _pool_options(),
+        }
+    except Exception as e:
+        return {
+            'status': 'error',
+            'error': str(e),
+            'latency_ms': round((time.monotonic() - started) * 1000, 2),
+            'pid': os.getpid(),
+        }
+
+
+def warm_up():
+    """
+    Connect and ping in a background thread so the first request does not
+    pay for the TLS and auth handshake. Failures are only logged.
+    """
+    def _run():
+        health = mongo_health()
+        if health['status'] == 'ok':
+            logger.info(f"MongoDB pool warmed in {health['latency_ms']} ms")
+        else:
+            logger.warning(f"MongoDB warm-up failed: {health['error']}")
+
+    threading.Thread(target=_run, name='mongo-warm-up', daemon=True).start()
+
+
+def warm_up_worker():
+    """
+    Warm the pool of a server worker once it has loaded the application
+    (gunicorn's post_worker_init, see gunicorn.conf.py). Not done on app
+    load, so the preload master and management commands never connect.
+    """
+    if getattr(settings, 'MONGO_WARM_UP', True):
+        warm_up()
+
+
+def _after_fork_in_child():
+    # The lock may have been held by another thread at fork time
+    global _lock
+    _lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
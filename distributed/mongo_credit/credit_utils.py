@@ -1,14 +1,26 @@
 import logging
+import time
+from collections import defaultdict
+from concurrent.futures import TimeoutError as FuturesTimeoutError
 from datetime import datetime, timedelta
 from random import randint
-from django.db import connection
-from mongoengine import connect
+from django.db import transaction
+from django.db.models import Count, Q
+from .analytics import LETSEMA, loan_book
+from .connection import get_mongo_client
 from .models import CreditHistory
+from .scoring import letsema_score, mfi_score, combine_scores
 from django.conf import settings
 from loans.models import LoanApplication, LoanStatusUpdate
+from mfi.clusters import active_cluster_names, get_cluster
+from mfi.snapshots import credit_access
 
 logger = logging.getLogger(__name__)
 
+# LoanStatusUpdate.new_status values that feed the repayment counters
+PAYMENT_LATE = 'PAYMENT_LATE'
+PAYMENT_RECEIVED = 'PAYMENT_RECEIVED'
+
 def test_mongo_connection():
     """Test MongoDB connection and return status"""
     try:
@@ -22,25 +34,13 @@ def test_mongo_connection():
         return False, str(e)
 
 def init_mongo_connection():
-    """Initialize MongoDB connection with better error handling"""
-    try:
-        
-        print(f"Connecting to MongoDB with: host={settings.MONGO_HOST}, db={settings.MONGO_DBNAME}")
-        
-        connect(
-            db=settings.MONGO_DBNAME,
-            host=settings.MONGO_HOST,
-            username=settings.MONGO_USER,
-            password=settings.MONGO_PASS,
-            alias='default',  # Using default instead of 'mongo'
-            connectTimeoutMS=5000,  
-            serverSelectionTimeoutMS=5000,
-            retryWrites=True,
-        )
-        logger.info("MongoDB connection initialized successfully")
-    except Exception as e:
-        logger.error(f"Failed to connect to MongoDB: {str(e)}")
-        raise
+    """
+    Make sure this process has a MongoDB connection.
+
+    Cheap to call on every request: the client is created once per process
+    by mongo_credit.connection and reused afterwards.
+    """
+    get_mongo_client()
 
 def generate_test_credit_history(national_id):
     """Generate random test data for development"""
@@ -69,205 +69,351 @@ def generate_inquiries():
         'purpose': 'loan' if i % 2 else 'credit'
     } for i in range(1, 6)]
 
-def get_mfi_credit_data(cluster, national_id):
-    """Pull real credit data from MFI via FDW"""
-    with connection.cursor() as cursor:
+def _build_mfi_credit_data(cluster, national_id, loans):
+    """Build an MFI credit record from a borrower's aggregated loan rows"""
+    payment_history = []
+    book = []
+    active_loans = 0
+    total_debt = 0
+    late_payments_count = 0
+
+    for loan in loans:
+        if loan[2] == 'active':
+            active_loans += 1
+            total_debt += float(loan[1])
+
+        late_payments_count += loan[6]
+        # Cluster loans are not attributed to an MFI, so the cluster stands in
+        book.append((cluster, loan[2], float(loan[1]), loan[2] == 'active', loan[6] > 0))
+
+        payment_history.append({
+            'loan_id': loan[0],
+            'amount': float(loan[1]),
+            'status': loan[2],
+            'application_date': loan[3].isoformat() if loan[3] else None,
+            'approval_date': loan[4].isoformat() if loan[4] else None,
+            'repayments_count': loan[5],
+            'late_payments': loan[6]
+        })
+
+    # Simple credit score calculation (simplified)
+    credit_score = mfi_score(late_payments_count)
+
+    return {
+        'national_id': national_id,
+        'credit_score': credit_score,
+        'active_loans': active_loans,
+        'total_debt': total_debt,
+        'payment_history': payment_history,
+        'inquiries': [],  # MFI systems typically don't store inquiries
+        'source_scores': {cluster: credit_score} if loans else {},
+        'loan_book': loan_book(cluster, book),
+        'created_at': datetime.now(),
+        'updated_at': datetime.now()
+    }
+
+def mfi_credit_query(access):
+    """Batched MFI credit query, taking the national IDs as one array parameter"""
+    return f"""
+        SELECT 
+            b.national_id,
+            l.id, l.amount, l.status, 
+            l.application_date, l.approval_date,
+            COUNT(r.id) as repayments_count,
+            SUM(CASE WHEN r.status = 'late' THEN 1 ELSE 0 END) as late_count
+        FROM {access.table('borrowers')} b
+        JOIN {access.table('loans')} l ON l.borrower_id = b.id
+        LEFT JOIN {access.table('repayments')} r ON l.id = r.loan_id
+        WHERE b.national_id = ANY(%s)
+        GROUP BY b.national_id, l.id, l.amount, l.status,
+                 l.application_date, l.approval_date
+        ORDER BY b.national_id, l.id
+    """
+
+def get_mfi_credit_data_many(cluster, national_ids, access=None):
+    """
+    Pull real credit data for a batch of borrowers from an MFI cluster.
+
+    Issues a single query with the IDs bound as one array parameter, through
+    mfi.snapshots.credit_access (the cluster's snapshot or live tables)
+    unless access is given.
+    Over FDW the borrowers/loans/repayments join and the GROUP BY only
+    reference foreign tables of the same server and plain columns, so
+    postgres_fdw can ship the whole aggregate to the MFI cluster. Returns a
+    dict with an entry for every requested national ID; borrowers unknown
+    to the cluster get an empty history, as with get_mfi_credit_data.
+    """
+    national_ids = list(dict.fromkeys(national_ids))
+    if not national_ids:
+        return {}
+
+    access = access or credit_access(cluster)
+    with access.cursor() as cursor:
         try:
-            # Get loan history from MFI cluster
-            cursor.execute(f"""
-                SELECT 
-                    l.id, l.amount, l.status, 
-                    l.application_date, l.approval_date,
-                    COUNT(r.id) as repayments_count,
-                    SUM(CASE WHEN r.status = 'late' THEN 1 ELSE 0 END) as late_count
-                FROM {cluster}.loans l
-                LEFT JOIN {cluster}.repayments r ON l.id = r.loan_id
-                WHERE l.borrower_id IN (
-                    SELECT id FROM {cluster}.borrowers 
-                    WHERE national_id = %s
-                )
-                GROUP BY l.id
-            """, [national_id])
-            
-            loans = cursor.fetchall()
-            
-            # Transform into credit history format
-            payment_history = []
-            active_loans = 0
-            total_debt = 0
-            
-            for loan in loans:
-                if loan[2] == 'active':
-                    active_loans += 1
-                    total_debt += float(loan[1])
-                
-                payment_history.append({
-                    'loan_id': loan[0],
-                    'amount': float(loan[1]),
-                    'status': loan[2],
-                    'application_date': loan[3].isoformat() if loan[3] else None,
-                    'approval_date': loan[4].isoformat() if loan[4] else None,
-                    'repayments_count': loan[5],
-                    'late_payments': loan[6]
-                })
-            
-            # Simple credit score calculation (simplified)
-            credit_score = max(300, min(850, 750 - (sum(l[6] for l in loans) * 20)))
-            
+            cursor.execute(mfi_credit_query(access), [national_ids])
+
+            loans_by_borrower = defaultdict(list)
+            for row in cursor.fetchall():
+                loans_by_borrower[row[0]].append(row[1:])
+
             return {
-                'national_id': national_id,
-                'credit_score': credit_score,
-                'active_loans': active_loans,
-                'total_debt': total_debt,
-                'payment_history': payment_history,
-                'inquiries': [],  # MFI systems typically don't store inquiries
-                'created_at': datetime.now(),
-                'updated_at': datetime.now()
+                national_id: _build_mfi_credit_data(cluster, national_id, loans_by_borrower.get(national_id, []))
+                for national_id in national_ids
             }
-            
+
         except Exception as e:
             logger.error(f"Error fetching MFI credit data: {str(e)}")
             raise
 
-def get_letsema_credit_data(national_id):
-    """Pull credit data from Letsema database (default)"""
+def get_mfi_credit_data(cluster, national_id, access=None):
+    """Pull real credit data from an MFI cluster"""
+    return get_mfi_credit_data_many(cluster, [national_id], access)[national_id]
+
+def _build_letsema_credit_data(national_id, loans):
+    """Build a Letsema credit record from a borrower's pre-aggregated loan rows"""
+    payment_history = []
+    book = []
+    active_loans = 0
+    total_debt = 0.0
+    late_payments_count = 0
+    approved_count = 0
+    rejected_count = 0
+
+    for loan in loans:
+        if loan['status'] == LoanApplication.Status.APPROVED:
+            approved_count += 1
+            active_loans += 1
+            total_debt += float(loan['amount'])
+        elif loan['status'] == LoanApplication.Status.REJECTED:
+            rejected_count += 1
+
+        late_payments_count += loan['late_payments']
+        book.append((
+            loan['mfi__code'], loan['status'], float(loan['amount']),
+            loan['status'] == LoanApplication.Status.APPROVED, loan['late_payments'] > 0
+        ))
+
+        payment_history.append({
+            'loan_id': loan['id'],
+            'amount': float(loan['amount']),
+            'status': loan['status'],
+            'application_date': loan['application_date'].isoformat() if loan['application_date'] else None,
+            'approval_date': loan['decision_date'].isoformat() if loan['decision_date'] else None,
+            'repayments_count': loan['repayments_count'],
+            'late_payments': loan['late_payments']
+        })
+
+    # Simple credit score calculation (modified for Letsema)
+    # Higher score for more approved loans, lower for rejections and late payments
+    credit_score = letsema_score(approved_count, rejected_count, late_payments_count)
+
+    # Gather inquiries - when other MFI employees viewed this credit record
+    inquiries = []
+
+    return {
+        'national_id': national_id,
+        'credit_score': credit_score,
+        'active_loans': active_loans,
+        'total_debt': total_debt,
+        'payment_history': payment_history,
+        'inquiries': inquiries,
+        'source_scores': {LETSEMA: credit_score} if loans else {},
+        'loan_book': loan_book(LETSEMA, book),
+        'created_at': datetime.now(),
+        'updated_at': datetime.now()
+    }
+
+def get_letsema_credit_data_many(national_ids):
+    """
+    Pull credit data for a batch of borrowers from Letsema (default).
+
+    Runs two queries regardless of batch size or loan count: one for the
+    borrower profiles and one for their loans with the late and received
+    status update counts aggregated in the database. Borrowers without a
+    profile are left out of the returned dict.
+    """
+    from users.models import BorrowerProfile
+
+    national_ids = list(national_ids)
+    if not national_ids:
+        return {}
+
     try:
-        from users.models import BorrowerProfile
-        
-        # Get borrower profile
-        try:
-            borrower = BorrowerProfile.objects.get(national_id=national_id)
-        except BorrowerProfile.DoesNotExist:
-            logger.error(f"Borrower with national_id {national_id} not found")
-            return None
-            
-        # Get loan applications for this borrower
-        loan_applications = LoanApplication.objects.filter(borrower=borrower.user)
-        
-        # Transform into credit history format
-        payment_history = []
-        active_loans = 0
-        total_debt = 0
-        late_payments_count = 0
-        
-        for loan in loan_applications:
-            # Count active loans and total debt
-            if loan.status == LoanApplication.Status.APPROVED:
-                # Check if loan is closed based on status rather than an attribute
-                is_closed = loan.status in [LoanApplication.Status.REPAID, LoanApplication.Status.DEFAULTED]
-                
-                if not is_closed:
-                    active_loans += 1
-                    total_debt += loan.amount
-            
-            # Get status updates to track payment history
-            status_updates = LoanStatusUpdate.objects.filter(loan=loan)
-            late_updates = status_updates.filter(status='PAYMENT_LATE').count()
-            late_payments_count += late_updates
-            
-            payment_history.append({
-                'loan_id': loan.id,
-                'amount': float(loan.amount),
-                'status': loan.status,
-                'application_date': loan.application_date.isoformat() if loan.application_date else None,
-                'approval_date': loan.decision_date.isoformat() if loan.decision_date else None,
-                'repayments_count': status_updates.filter(status='PAYMENT_RECEIVED').count(),
-                'late_payments': late_updates
-            })
-        
-        # Simple credit score calculation (modified for Letsema)
-        # Higher score for more approved loans, lower for rejections and late payments
-        base_score = 600
-        approved_bonus = sum(30 for la in loan_applications if la.status == LoanApplication.Status.APPROVED)
-        rejected_penalty = sum(50 for la in loan_applications if la.status == LoanApplication.Status.REJECTED)
-        late_penalty = late_payments_count * 20
-        
-        credit_score = max(300, min(850, base_score + approved_bonus - rejected_penalty - late_penalty))
-        
-        # Gather inquiries - when other MFI employees viewed this credit record
-        inquiries = []
-        
+        profiles = dict(
+            BorrowerProfile.objects
+            .filter(national_id__in=national_ids)
+            .values_list('user_id', 'national_id')
+        )
+        if not profiles:
+            return {}
+
+        loans = (
+            LoanApplication.objects
+            .filter(borrower_id__in=profiles.keys())
+            .annotate(
+                late_payments=Count(
+                    'status_updates',
+                    filter=Q(status_updates__new_status=PAYMENT_LATE)
+                ),
+                repayments_count=Count(
+                    'status_updates',
+                    filter=Q(status_updates__new_status=PAYMENT_RECEIVED)
+                ),
+            )
+            .values(
+                'id', 'borrower_id', 'mfi__code', 'amount', 'status',
+                'application_date', 'decision_date',
+                'late_payments', 'repayments_count'
+            )
+            .order_by('borrower_id', '-application_date')
+        )
+
+        loans_by_borrower = defaultdict(list)
+        for loan in loans:
+            loans_by_borrower[loan['borrower_id']].append(loan)
+
         return {
-            'national_id': national_id,
-            'credit_score': credit_score,
-            'active_loans': active_loans, 
-            'total_debt': total_debt,
-            'payment_history': payment_history,
-            'inquiries': inquiries,
-            'created_at': datetime.now(),
-            'updated_at': datetime.now()
+            national_id: _build_letsema_credit_data(national_id, loans_by_borrower[user_id])
+            for user_id, national_id in profiles.items()
         }
-            
+
     except Exception as e:
         logger.error(f"Error fetching Letsema credit data: {str(e)}")
         raise
 
-def sync_letsema_credit_histories():
+def get_letsema_credit_data(national_id):
+    """Pull credit data from Letsema database (default)"""
+    credit_data = get_letsema_credit_data_many([national_id]).get(national_id)
+    if credit_data is None:
+        logger.error(f"Borrower with national_id {national_id} not found")
+    return credit_data
+
+def sync_letsema_credit_histories(chunk_size=None):
     """Sync credit histories from Letsema database to MongoDB"""
-    from users.models import BorrowerProfile
-    
-    init_mongo_connection()
-    
+    from .sync import DEFAULT_CHUNK_SIZE, iter_borrower_chunks, run_credit_sync, format_sync_stats
+
     try:
-        # Get all borrowers
-        borrowers = BorrowerProfile.objects.all()
-        success_count = 0
-        error_count = 0
-        
-        for borrower in borrowers:
-            try:
-                credit_data = get_letsema_credit_data(borrower.national_id)
-                if credit_data:
-                    # Create a new CreditHistory object and save it
-                    credit_history = CreditHistory(**credit_data)
-                    credit_history.save()
-                    success_count += 1
-                    logger.info(f"Synced credit history for {borrower.national_id}")
-            except Exception as e:
-                error_count += 1
-                logger.error(f"Failed to sync {borrower.national_id}: {str(e)}")
-        
-        return f"Sync completed. {success_count} records synced, {error_count} errors."
+        stats = run_credit_sync(
+            iter_borrower_chunks(chunk_size or DEFAULT_CHUNK_SIZE),
+            get_letsema_credit_data_many
+        )
+        return f"Sync completed. {format_sync_stats(stats)}."
     except Exception as e:
         logger.error(f"Error in sync_letsema_credit_histories: {str(e)}")
         return f"Sync failed: {str(e)}"
 
+def _get_source_timeout(source):
+    timeouts = getattr(settings, 'CREDIT_SOURCE_TIMEOUTS', {})
+    return timeouts.get(source, timeouts.get('default', 5.0))
+
+def _fetch_mfi_credit_data(cluster, national_id, timeout):
+    """Run get_mfi_credit_data on a cluster worker, bounded by a statement timeout"""
+    access = credit_access(cluster)
+    # SET LOCAL, so the timeout ends with this transaction instead of staying
+    # on the worker's persistent connection for whatever it runs next
+    with transaction.atomic(using=access.alias):
+        with access.cursor() as cursor:
+            # Cancels the query server-side once the caller has given up on it
+            cursor.execute("SELECT set_config('statement_timeout', %s, true)", [str(int(timeout * 1000))])
+        return get_mfi_credit_data(cluster, national_id, access)
+
+def _merge_mfi_credit_data(credit_data, mfi_data):
+    # Combine payment histories
+    credit_data['payment_history'].extend(mfi_data['payment_history'])
+    credit_data.setdefault('loan_book', []).extend(mfi_data.get('loan_book', []))
+    credit_data.setdefault('source_scores', {}).update(mfi_data.get('source_scores', {}))
+    # Update counts
+    credit_data['active_loans'] += mfi_data['active_loans']
+    credit_data['total_debt'] += mfi_data['total_debt']
+    # Adjust credit score (simple average)
+    credit_data['credit_score'] = combine_scores(credit_data['credit_score'], mfi_data['credit_score'])
+
 def get_combined_credit_data(national_id):
-    """Get combined credit data from Letsema and MFI sources"""
+    """
+    Get combined credit data from Letsema and MFI sources.
+
+    The active MFI clusters are queried in parallel, each on its own bounded
+    pool, while Letsema is read on the calling thread, and each cluster is
+    given its own deadline from CREDIT_SOURCE_TIMEOUTS. Results are merged
+    in cluster name order so
+    the outcome does not depend on which cluster answers first. The returned
+    dict carries a 'sources' entry mapping each source to 'ok', 'timeout' or
+    'error', and 'partial' is True when any MFI source did not answer.
+    """
     try:
-        # First get Letsema data
+        clusters = active_cluster_names()
+        started = time.monotonic()
+        futures = {
+            cluster: get_cluster(cluster).submit(
+                _fetch_mfi_credit_data, cluster, national_id, _get_source_timeout(cluster)
+            )
+            for cluster in clusters
+        }
+
         credit_data = get_letsema_credit_data(national_id)
         if not credit_data:
+            for future in futures.values():
+                future.cancel()
             return None
-            
-        # Try to get MFI data from each cluster
-        try:
-            mfi_a_data = get_mfi_credit_data('mfi_a', national_id)
-            if mfi_a_data:
-                # Combine payment histories
-                credit_data['payment_history'].extend(mfi_a_data['payment_history'])
-                # Update counts
-                credit_data['active_loans'] += mfi_a_data['active_loans']
-                credit_data['total_debt'] += mfi_a_data['total_debt']
-                # Adjust credit score (simple average)
-                credit_data['credit_score'] = (credit_data['credit_score'] + mfi_a_data['credit_score']) // 2
-        except Exception as e:
-            logger.warning(f"Could not get MFI-A data for {national_id}: {str(e)}")
-        
-        try:
-            mfi_b_data = get_mfi_credit_data('mfi_b', national_id)
-            if mfi_b_data:
-                # Combine payment histories
-                credit_data['payment_history'].extend(mfi_b_data['payment_history'])
-                # Update counts
-                credit_data['active_loans'] += mfi_b_data['active_loans']
-                credit_data['total_debt'] += mfi_b_data['total_debt']
-                # Adjust credit score (simple average)
-                credit_data['credit_score'] = (credit_data['credit_score'] + mfi_b_data['credit_score']) // 2
-        except Exception as e:
-            logger.warning(f"Could not get MFI-B data for {national_id}: {str(e)}")
-            
+
+        sources = {'letsema': 'ok'}
+        for cluster in clusters:
+            future = futures[cluster]
+            remaining = started + _get_source_timeout(cluster) - time.monotonic()
+            try:
+                mfi_data = future.result(timeout=max(remaining, 0))
+            except FuturesTimeoutError:
+                future.cancel()
+                sources[cluster] = 'timeout'
+                logger.warning(f"Timed out getting {cluster} data for {national_id}")
+                continue
+            except Exception as e:
+                sources[cluster] = 'error'
+                logger.warning(f"Could not get {cluster} data for {national_id}: {str(e)}")
+                continue
+
+            sources[cluster] = 'ok'
+            if mfi_data:
+                _merge_mfi_credit_data(credit_data, mfi_data)
+
+        credit_data['sources'] = sources
+        credit_data['partial'] = any(state != 'ok' for state in sources.values())
         return credit_data
     except Exception as e:
         logger.error(f"Error in get_combined_credit_data: {str(e)}")
-        return None
\ No newline at end of file
+        return None
+
+def get_combined_credit_data_many(national_ids, clusters=None, include_unknown=False):
+    """
+    Batch counterpart of get_combined_credit_data for sync jobs.
+
+    Runs one Letsema batch and one FDW batch per cluster (all active
+    clusters unless given), merging in cluster order. Returns a (credit_data, failed_clusters) tuple; borrowers are
+    still returned when a cluster fails, without that cluster's data.
+    Borrowers without a Letsema profile are left out unless include_unknown
+    is set, in which case those with loans in a cluster get a record built
+    from the clusters alone.
+    """
+    clusters = active_cluster_names() if clusters is None else clusters
+    national_ids = list(national_ids)
+    credit_data = get_letsema_credit_data_many(national_ids)
+    failed_clusters = set()
+    requested = national_ids if include_unknown else list(credit_data)
+    if not requested:
+        return credit_data, failed_clusters
+
+    for cluster in clusters:
+        try:
+            mfi_data = get_mfi_credit_data_many(cluster, requested)
+        except Exception as e:
+            failed_clusters.add(cluster)
+            logger.warning(f"Could not get {cluster} data for batch of {len(requested)}: {str(e)}")
+            continue
+
+        for national_id, data in mfi_data.items():
+            if national_id in credit_data:
+                _merge_mfi_credit_data(credit_data[national_id], data)
+            elif data['source_scores']:
+                credit_data[national_id] = data
+
+    return credit_data, failed_clusters
@@ -0,0 +1,43 @@
+from .credit_utils import init_mongo_connection
+from .models import CreditHistory, CreditHistoryBucket
+
+CREDIT_HISTORY_COLUMNS = [
+    'national_id', 'credit_score', 'active_loans', 'total_debt',
+    'payment_count', 'inquiry_count', 'created_at', 'updated_at',
+]
+
+CREDIT_HISTORY_ENTRY_COLUMNS = ['national_id', 'kind', 'entry']
+
+DEFAULT_BATCH_SIZE = 1000
+
+
+def iter_credit_histories(batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Credit history summaries as plain dicts, read from a Mongo cursor in
+    batches of batch_size and skipping mongoengine document construction.
+    """
+    init_mongo_connection()
+    projection = {column: 1 for column in CREDIT_HISTORY_COLUMNS}
+    projection['_id'] = 0
+    cursor = CreditHistory._get_collection().find({}, projection).sort('national_id', 1).batch_size(batch_size)
+    try:
+        yield from cursor
+    finally:
+        cursor.close()
+
+
+def iter_credit_history_entries(batch_size=DEFAULT_BATCH_SIZE):
+    """Every payment and inquiry entry, one row each, streamed bucket by bucket"""
+    init_mongo_connection()
+    cursor = (
+        CreditHistoryBucket._get_collection()
+        .find({}, {'_id': 0, 'national_id': 1, 'kind': 1, 'entries': 1})
+        .sort([('national_id', 1), ('kind', 1), ('bucket', -1)])
+        .batch_size(batch_size)
+    )
+    try:
+        for bucket in cursor:
+            for entry in bucket['entries']:
+                yield {'national_id': bucket['national_id'], 'kind': bucket['kind'], 'entry': entry}
+    finally:
+        cursor.close()
@@ -0,0 +1,134 @@
+"""
+Bucketed storage of credit history entries.
+
+A CreditHistory document only holds the summary of a borrower's credit
+record. Its payment and inquiry entries live in CreditHistoryBucket
+documents of at most BUCKET_SIZE entries, grouped by calendar month, so no
+document grows with a borrower's history and summary reads never decode it.
+
+Within a month entries are chunked oldest first, so appending new entries
+only touches the newest bucket. Rewriting a borrower's history upserts each
+bucket in place: buckets whose entries did not change are no-op updates,
+and buckets that no longer exist are deleted.
+"""
+import base64
+import json
+from collections import defaultdict
+from pymongo import DeleteMany, UpdateOne
+from .models import CreditHistoryBucket
+
+BUCKET_SIZE = 200
+
+# Credit record key holding each kind of entry
+HISTORY_KINDS = {
+    'payment': 'payment_history',
+    'inquiry': 'inquiries',
+}
+
+# Month key of entries without a date, sorted after every real month
+UNDATED = '0000-00'
+
+
+def entry_date(entry):
+    """ISO date string an entry is ordered by, '' when it has none"""
+    return entry.get('date') or entry.get('application_date') or ''
+
+
+def split_credit_record(record):
+    """
+    Split a computed credit record into its summary fields and its history
+    entries, as ({field: value}, {kind: entries}).
+    """
+    summary = dict(record)
+    history = {kind: summary.pop(field, None) or [] for kind, field in HISTORY_KINDS.items()}
+    summary['payment_count'] = len(history['payment'])
+    summary['inquiry_count'] = len(history['inquiry'])
+    return summary, history
+
+
+def bucket_entries(entries):
+    """Group entries into {bucket key: entries, newest first}"""
+    by_month = defaultdict(list)
+    for entry in entries:
+        date = entry_date(entry)
+        by_month[date[:7] if date else UNDATED].append(entry)
+
+    buckets = {}
+    for month, month_entries in by_month.items():
+        month_entries.sort(key=entry_date)
+        for start in range(0, len(month_entries), BUCKET_SIZE):
+            chunk = month_entries[start:start + BUCKET_SIZE]
+            buckets[f"{month}:{start // BUCKET_SIZE:04d}"] = chunk[::-1]
+    return buckets
+
+
+def history_operations(national_id, history):
+    """Bulk write operations replacing a borrower's stored history entries"""
+    operations = []
+    for kind, entries in history.items():
+        buckets = bucket_entries(entries)
+        for key, bucket in buckets.items():
+            operations.append(UpdateOne(
+                {'national_id': national_id, 'kind': kind, 'bucket': key},
+                {'$set': {
+                    'entries': bucket,
+                    'count': len(bucket),
+                    'first_date': entry_date(bucket[-1]),
+                    'last_date': entry_date(bucket[0]),
+                }},
+                upsert=True
+            ))
+        operations.append(DeleteMany({'national_id': national_id, 'kind': kind, 'bucket': {'$nin': list(buckets)}}))
+    return operations
+
+
+def encode_history_cursor(bucket, offset):
+    return base64.urlsafe_b64encode(json.dumps([bucket, offset]).encode()).decode()
+
+
+def decode_history_cursor(cursor):
+    """Return (bucket, offset) or raise ValueError"""
+    try:
+        bucket, offset = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return str(bucket), int(offset)
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+
+def page_history(national_id, kind, cursor=None, limit=50):
+    """
+    One page of a borrower's entries of one kind, newest first.
+
+    Returns (entries, next_cursor). Only the buckets overlapping the page
+    are read, through the (national_id, kind, bucket) index.
+    """
+    query = {'national_id': national_id, 'kind': kind}
+    offset = 0
+    if cursor:
+        bucket, offset = decode_history_cursor(cursor)
+        query['bucket'] = {'$lte': bucket}
+
+    collection = CreditHistoryBucket._get_collection()
+    buckets = collection.find(query, {'_id': 0, 'bucket': 1, 'entries': 1}).sort('bucket', -1)
+
+    entries = []
+    try:
+        for document in buckets:
+            remaining = document['entries'][offset:]
+            room = limit - len(entries)
+            if len(remaining) > room:
+                entries.extend(remaining[:room])
+                return entries, encode_history_cursor(document['bucket'], offset + room)
+            entries.extend(remaining)
+            offset = 0
+            if len(entries) == limit:
+                # The page ends on a bucket boundary; resume at the next one
+                following = collection.find_one(
+                    {'national_id': national_id, 'kind': kind, 'bucket': {'$lt': document['bucket']}},
+                    {'_id': 0, 'bucket': 1},
+                    sort=[('bucket', -1)]
+                )
+                return entries, encode_history_cursor(following['bucket'], 0) if following else None
+    finally:
+        buckets.close()
+    return entries, None
@@ -0,0 +1,48 @@
+import time
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from mongo_credit.scoring import (
+    combine_scores,
+    combined_scores,
+    letsema_score,
+    letsema_scores,
+    mfi_score,
+)
+
+
+class Command(BaseCommand):
+    help = 'Compare vectorized and per-borrower credit scoring on synthetic features'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--borrowers', type=int, default=1_000_000, help='Population size')
+        parser.add_argument('--clusters', type=int, default=2, help='Number of MFI clusters merged')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        size = options['borrowers']
+        rng = np.random.default_rng(options['seed'])
+        approved = rng.integers(0, 10, size)
+        rejected = rng.integers(0, 5, size)
+        late = rng.integers(0, 15, size)
+        mfi_late = [rng.integers(0, 25, size) for _ in range(options['clusters'])]
+
+        started = time.perf_counter()
+        vectorized = combined_scores(letsema_scores(approved, rejected, late), mfi_late)
+        vectorized_time = time.perf_counter() - started
+
+        started = time.perf_counter()
+        columns = [column.tolist() for column in mfi_late]
+        scalar = []
+        for i, (a, r, l) in enumerate(zip(approved.tolist(), rejected.tolist(), late.tolist())):
+            score = letsema_score(a, r, l)
+            for column in columns:
+                score = combine_scores(score, mfi_score(column[i]))
+            scalar.append(score)
+        scalar_time = time.perf_counter() - started
+
+        if not np.array_equal(vectorized, np.array(scalar)):
+            raise CommandError('Vectorized scores differ from per-borrower scores')
+
+        self.stdout.write(f"{size} borrowers, {options['clusters']} clusters, results identical")
+        self.stdout.write(f"vectorized: {vectorized_time * 1000:9.1f} ms ({size / vectorized_time:12.0f} borrowers/s)")
+        self.stdout.write(f"scalar:     {scalar_time * 1000:9.1f} ms ({size / scalar_time:12.0f} borrowers/s)")
@@ -0,0 +1,62 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from mfi.clusters import active_cluster_names, get_access
+from mongo_credit.credit_utils import get_mfi_credit_data, get_mfi_credit_data_many
+
+
+class Command(BaseCommand):
+    help = 'Compare per-borrower and batched FDW credit queries against an MFI cluster'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cluster', help='FDW schema of the MFI cluster (defaults to the first active one)')
+        parser.add_argument(
+            '--sizes',
+            default='1,100,10000',
+            help='Comma separated batch sizes to benchmark',
+        )
+        parser.add_argument(
+            '--skip-single',
+            action='store_true',
+            help='Only time the batched query',
+        )
+
+    def handle(self, *args, **options):
+        cluster = options['cluster'] or next(iter(active_cluster_names()), None)
+        if not cluster:
+            raise CommandError("No active MFI clusters")
+        sizes = [int(size) for size in options['sizes'].split(',') if size]
+
+        access = get_access(cluster)
+        with access.cursor() as cursor:
+            cursor.execute(
+                f"SELECT national_id FROM {access.table('borrowers')} ORDER BY id LIMIT %s",
+                [max(sizes)]
+            )
+            available = [row[0] for row in cursor.fetchall()]
+
+        if not available:
+            raise CommandError(f"No borrowers found in {cluster}")
+
+        # Pad with unknown IDs so every size is measured even on small clusters
+        national_ids = available + [f"BENCH-{i}" for i in range(max(sizes) - len(available))]
+        self.stdout.write(f"Benchmarking {cluster} with {len(available)} real borrowers")
+
+        for size in sizes:
+            batch = national_ids[:size]
+
+            started = time.perf_counter()
+            get_mfi_credit_data_many(cluster, batch)
+            batched = time.perf_counter() - started
+            line = f"{size:>6} IDs  batched: {batched * 1000:9.1f} ms ({size / batched:9.0f} IDs/s)"
+
+            if not options['skip_single']:
+                started = time.perf_counter()
+                for national_id in batch:
+                    get_mfi_credit_data(cluster, national_id)
+                single = time.perf_counter() - started
+                line += (
+                    f"  single: {single * 1000:9.1f} ms ({size / single:9.0f} IDs/s)"
+                    f"  speedup: {single / batched:6.1f}x"
+                )
+
+            self.stdout.write(line)
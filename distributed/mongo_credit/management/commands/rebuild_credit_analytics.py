@@ -0,0 +1,19 @@
+import time
+from django.core.management.base import BaseCommand
+from mongo_credit.analytics import rebuild_rollups
+from mongo_credit.credit_utils import init_mongo_connection
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute the credit analytics rollups (score histograms, loan totals and '
+        'portfolio at risk) from every stored credit history summary'
+    )
+
+    def handle(self, *args, **options):
+        init_mongo_connection()
+        started = time.monotonic()
+        scopes = rebuild_rollups()
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt analytics for {', '.join(scopes) or 'no scopes'} in {time.monotonic() - started:.1f}s"
+        ))
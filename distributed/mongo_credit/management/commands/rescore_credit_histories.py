@@ -0,0 +1,52 @@
+import time
+from django.core.management.base import BaseCommand
+from pymongo import UpdateOne
+from mongo_credit.analytics import track_rollups
+from mongo_credit.cache import invalidate_credit_history
+from mongo_credit.credit_utils import init_mongo_connection
+from mongo_credit.models import CreditHistory
+from mongo_credit.scoring import score_population
+from mongo_credit.sync import DEFAULT_CHUNK_SIZE
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Recompute credit_score for every stored credit history with the current scoring rules'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=DEFAULT_CHUNK_SIZE,
+            help='Number of score updates per bulk write',
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        national_ids, scores, failed_clusters = score_population()
+        scored = time.monotonic() - started
+        if failed_clusters:
+            self.stdout.write(self.style.WARNING(
+                f"Scored without: {', '.join(sorted(failed_clusters))}"
+            ))
+
+        init_mongo_connection()
+        collection = CreditHistory._get_collection()
+        chunk_size = options['chunk_size']
+        updated = 0
+        for start in range(0, len(national_ids), chunk_size):
+            chunk = national_ids[start:start + chunk_size]
+            operations = [
+                UpdateOne({'national_id': national_id}, {'$set': {'credit_score': int(score)}})
+                for national_id, score in zip(chunk, scores[start:start + chunk_size])
+            ]
+            with track_rollups(chunk):
+                updated += collection.bulk_write(operations, ordered=False).modified_count
+            invalidate_credit_history(*chunk)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Scored {len(national_ids)} borrowers in {scored:.1f}s, "
+            f"updated {updated} credit histories in {time.monotonic() - started:.1f}s"
+        ))
@@ -0,0 +1,63 @@
+from django.core.management.base import BaseCommand
+from pymongo import UpdateOne
+from mongo_credit.cache import invalidate_credit_history
+from mongo_credit.credit_utils import init_mongo_connection
+from mongo_credit.history import HISTORY_KINDS, history_operations, split_credit_record
+from mongo_credit.models import CreditHistory, CreditHistoryBucket
+
+
+class Command(BaseCommand):
+    help = (
+        'Move payment and inquiry entries embedded in credit history documents '
+        'into the bucketed history collection, leaving summary documents'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Documents migrated per bulk write')
+
+    def handle(self, *args, **options):
+        init_mongo_connection()
+        summaries = CreditHistory._get_collection()
+        buckets = CreditHistoryBucket._get_collection()
+        fields = list(HISTORY_KINDS.values())
+
+        cursor = summaries.find(
+            {'$or': [{field: {'$exists': True}} for field in fields]},
+            {'_id': 1, 'national_id': 1, **{field: 1 for field in fields}}
+        ).batch_size(options['batch_size'])
+
+        migrated = 0
+        batch = []
+        try:
+            for document in cursor:
+                batch.append(document)
+                if len(batch) >= options['batch_size']:
+                    migrated += self._migrate(batch, summaries, buckets, fields)
+                    batch = []
+            if batch:
+                migrated += self._migrate(batch, summaries, buckets, fields)
+        finally:
+            cursor.close()
+
+        self.stdout.write(self.style.SUCCESS(f"Split {migrated} credit histories"))
+
+    def _migrate(self, documents, summaries, buckets, fields):
+        history_ops = []
+        summary_ops = []
+        for document in documents:
+            summary, history = split_credit_record(document)
+            history_ops.extend(history_operations(document['national_id'], history))
+            summary_ops.append(UpdateOne(
+                {'_id': document['_id']},
+                {
+                    '$set': {'payment_count': summary['payment_count'], 'inquiry_count': summary['inquiry_count']},
+                    '$unset': {field: '' for field in fields},
+                }
+            ))
+
+        # Buckets first, so an interrupted run leaves the embedded entries to retry from
+        buckets.bulk_write(history_ops, ordered=False)
+        summaries.bulk_write(summary_ops, ordered=False)
+        invalidate_credit_history(*(document['national_id'] for document in documents))
+        self.stdout.write(f"Migrated batch of {len(documents)}")
+        return len(documents)
@@ -1,15 +1,29 @@
 # Create this file at mongo_credit/management/commands/sync_credit_histories.py
 
 from django.core.management.base import BaseCommand
-from mongo_credit.credit_utils import get_letsema_credit_data, init_mongo_connection
-from mongo_credit.models import CreditHistory
-from users.models import BorrowerProfile
+from mfi.clusters import active_cluster_names
+from mongo_credit.sync import (
+    DEFAULT_CHUNK_SIZE,
+    NO_DATA_WATERMARK,
+    capture_watermarks,
+    changed_borrowers,
+    fetch_combined_credit_data,
+    format_sync_stats,
+    get_watermarks,
+    iter_borrower_chunks,
+    run_credit_sync,
+    set_watermark,
+)
 import logging
 
 logger = logging.getLogger(__name__)
 
 class Command(BaseCommand):
-    help = 'Sync credit histories from Letsema database to MongoDB'
+    help = (
+        'Sync credit histories from Letsema and MFI clusters to MongoDB. '
+        'Only borrowers whose loans changed since the last run are recomputed '
+        'unless --force is given.'
+    )
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -17,48 +31,66 @@ class Command(BaseCommand):
             action='store_true',
             help='Force update all credit histories',
         )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=DEFAULT_CHUNK_SIZE,
+            help='Number of borrowers computed and written per bulk upsert',
+        )
 
     def handle(self, *args, **options):
         try:
             self.stdout.write(self.style.SUCCESS('Starting credit history sync...'))
-            
-            # Initialize MongoDB connection
-            init_mongo_connection()
-            
-            # Get all borrowers
-            borrowers = BorrowerProfile.objects.all()
-            success_count = 0
-            error_count = 0
-            
-            for borrower in borrowers:
-                try:
-                    credit_data = get_letsema_credit_data(borrower.national_id)
-                    if credit_data:
-                        # Save directly to MongoDB
-                        try:
-                            # Check if record exists
-                            existing = CreditHistory.objects.filter(national_id=borrower.national_id).first()
-                            if existing:
-                                # Update existing record
-                                for key, value in credit_data.items():
-                                    setattr(existing, key, value)
-                                existing.save()
-                            else:
-                                # Create new record
-                                credit_obj = CreditHistory(**credit_data)
-                                credit_obj.save()
-                                
-                            success_count += 1
-                            self.stdout.write(self.style.SUCCESS(f"Synced credit history for {borrower.national_id}"))
-                        except Exception as e:
-                            error_count += 1
-                            self.stdout.write(self.style.ERROR(f"MongoDB error for {borrower.national_id}: {str(e)}"))
-                except Exception as e:
-                    error_count += 1
-                    self.stdout.write(self.style.ERROR(f"Failed to sync {borrower.national_id}: {str(e)}"))
-            
-            self.stdout.write(self.style.SUCCESS(f'Sync completed: {success_count} records synced, {error_count} errors.'))
+
+            clusters = active_cluster_names()
+            sources = ['letsema'] + clusters
+            previous = get_watermarks(sources)
+            # Captured before reading so changes made during the run are seen next time
+            current = capture_watermarks(clusters)
+            failed_sources = {source for source, mark in current.items() if mark is None}
+
+            if options['force'] or previous['letsema'] is None:
+                self.stdout.write('Running full rebuild')
+                borrowers = None
+            else:
+                # A cluster never synced before contributes all of its borrowers
+                previous = {source: mark or NO_DATA_WATERMARK for source, mark in previous.items()}
+                borrowers, unreadable = changed_borrowers(previous, clusters)
+                failed_sources |= unreadable
+                self.stdout.write(
+                    'Running incremental sync since ' +
+                    ', '.join(f"{source}={mark.isoformat()}" for source, mark in previous.items())
+                )
+
+            def fetch(national_ids):
+                # A chunk missing a cluster counts as errors, so no watermark
+                # moves and its borrowers are selected again next run
+                return fetch_combined_credit_data(national_ids, clusters)
+
+            def report(stats):
+                self.stdout.write(
+                    f"Synced {stats['synced']} records ({stats['docs_per_second']:.0f} docs/s)"
+                )
+
+            stats = run_credit_sync(
+                iter_borrower_chunks(options['chunk_size'], queryset=borrowers),
+                fetch,
+                progress=report
+            )
+
+            if stats['errors']:
+                self.stdout.write(self.style.WARNING('Sync had errors, watermarks not advanced'))
+            else:
+                for source, mark in current.items():
+                    if source not in failed_sources:
+                        set_watermark(source, mark)
+                if failed_sources:
+                    self.stdout.write(self.style.WARNING(
+                        f"Watermarks not advanced for: {', '.join(sorted(failed_sources))}"
+                    ))
+
+            self.stdout.write(self.style.SUCCESS(f'Sync completed: {format_sync_stats(stats)}.'))
             
         except Exception as e:
             self.stdout.write(self.style.ERROR(f'Error during sync: {str(e)}'))
-            logger.error(f"Command error: {str(e)}")
\ No newline at end of file
+            logger.error(f"Command error: {str(e)}")
@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand
+from mfi.clusters import active_cluster_names
+from mongo_credit.sync import DEFAULT_CHUNK_SIZE, format_sync_stats, sync_cluster_credit_histories
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        'Sync credit histories of every borrower in the MFI clusters to MongoDB, '
+        'streaming borrowers through server-side cursors in fixed-size chunks'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--cluster',
+            action='append',
+            help='Cluster to sync (repeatable); defaults to every active cluster',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=DEFAULT_CHUNK_SIZE,
+            help='Borrowers fetched, computed and written per batch',
+        )
+
+    def handle(self, *args, **options):
+        clusters = options['cluster'] or active_cluster_names()
+        failed = []
+
+        for cluster in clusters:
+            self.stdout.write(f"Syncing credit histories from {cluster}...")
+
+            def report(stats):
+                self.stdout.write(f"  {stats['synced']} records ({stats['docs_per_second']:.0f} docs/s)")
+
+            try:
+                stats = sync_cluster_credit_histories(cluster, options['chunk_size'], progress=report)
+            except Exception as e:
+                failed.append(cluster)
+                logger.error(f"Credit sync from {cluster} failed: {str(e)}")
+                self.stdout.write(self.style.ERROR(f"Sync from {cluster} failed: {str(e)}"))
+                continue
+
+            style = self.style.WARNING if stats['errors'] else self.style.SUCCESS
+            self.stdout.write(style(f"{cluster}: {format_sync_stats(stats)}"))
+
+        if failed:
+            self.stdout.write(self.style.ERROR(f"Failed clusters: {', '.join(failed)}"))
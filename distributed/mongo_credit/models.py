@@ -3,20 +3,37 @@ from datetime import datetime
 
 class CreditHistory(mongoengine.Document):
     """
-    MongoDB model for credit history data
+    MongoDB model for credit history data.
+
+    Holds the summary only; payment and inquiry entries are stored in
+    CreditHistoryBucket documents (see mongo_credit.history).
     """
     national_id = mongoengine.StringField(required=True, unique=True)
     credit_score = mongoengine.IntField(min_value=300, max_value=850)
     active_loans = mongoengine.IntField(default=0)
     total_debt = mongoengine.FloatField(default=0)
-    payment_history = mongoengine.ListField(mongoengine.DictField())
-    inquiries = mongoengine.ListField(mongoengine.DictField())
+    payment_count = mongoengine.IntField(default=0)
+    inquiry_count = mongoengine.IntField(default=0)
+    # Per-source scores and loan totals feeding mongo_credit.analytics
+    source_scores = mongoengine.DictField()
+    loan_book = mongoengine.ListField(mongoengine.DictField())
     created_at = mongoengine.DateTimeField(default=datetime.now)
     updated_at = mongoengine.DateTimeField(default=datetime.now)
     
     meta = {
         'collection': 'credit_histories',
-        'indexes': ['national_id']
+        'indexes': [
+            'national_id',
+            # One per search filter and sort order (see mongo_credit.search);
+            # national_id breaks ties for keyset pagination
+            {'fields': ['credit_score', 'national_id']},
+            {'fields': ['updated_at', 'national_id']},
+            {'fields': ['active_loans', 'national_id']},
+            {'fields': ['total_debt', 'national_id']},
+        ],
+        # Documents written before the history split still embed
+        # payment_history/inquiries until split_credit_histories runs
+        'strict': False,
     }
     
     @classmethod
@@ -40,4 +57,59 @@ class CreditHistory(mongoengine.Document):
             defaults['national_id'] = national_id
             obj = cls(**defaults)
             obj.save()
-            return obj, True  # True indicates it was created, not updated
\ No newline at end of file
+            return obj, True  # True indicates it was created, not updated
+
+
+class CreditHistoryBucket(mongoengine.Document):
+    """
+    Up to BUCKET_SIZE payment or inquiry entries of one borrower from one
+    calendar month, newest first (see mongo_credit.history)
+    """
+    national_id = mongoengine.StringField(required=True)
+    kind = mongoengine.StringField(required=True, choices=('payment', 'inquiry'))
+    bucket = mongoengine.StringField(required=True)  # 'YYYY-MM:nnnn', sorts by time
+    first_date = mongoengine.StringField()
+    last_date = mongoengine.StringField()
+    count = mongoengine.IntField(default=0)
+    entries = mongoengine.ListField(mongoengine.DictField())
+
+    meta = {
+        'collection': 'credit_history_buckets',
+        'indexes': [
+            {'fields': ['national_id', 'kind', '-bucket'], 'unique': True},
+        ]
+    }
+
+
+class CreditAnalytics(mongoengine.Document):
+    """
+    Rollup of the credit book for one scope: 'all', 'letsema' or a cluster
+    (see mongo_credit.analytics)
+    """
+    scope = mongoengine.StringField(required=True, unique=True)
+    borrowers = mongoengine.IntField(default=0)
+    score_histogram = mongoengine.DictField()  # lower bound of the bin: borrowers
+    totals = mongoengine.DictField()
+    by_status = mongoengine.DictField()
+    by_mfi = mongoengine.DictField()
+    updated_at = mongoengine.DateTimeField(default=datetime.now)
+
+    meta = {
+        'collection': 'credit_analytics',
+        'indexes': ['scope']
+    }
+
+
+class SyncWatermark(mongoengine.Document):
+    """
+    High-water mark of the newest change seen by the last successful
+    credit history sync, one document per source ('letsema' or a cluster)
+    """
+    source = mongoengine.StringField(required=True, unique=True)
+    watermark = mongoengine.DateTimeField()
+    updated_at = mongoengine.DateTimeField(default=datetime.now)
+
+    meta = {
+        'collection': 'sync_watermarks',
+        'indexes': ['source']
+    }
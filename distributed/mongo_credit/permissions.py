@@ -4,6 +4,10 @@ class IsBorrower(BasePermission):
     def has_permission(self, request, view):
         return hasattr(request.user, 'is_borrower') and request.user.is_borrower()
 
+class IsAdmin(BasePermission):
+    def has_permission(self, request, view):
+        return hasattr(request.user, 'is_admin') and request.user.is_admin()
+
 class IsAdminOrMFIEmployee(BasePermission):
     def has_permission(self, request, view):
         return (hasattr(request.user, 'is_admin') and request.user.is_admin()) or \
@@ -0,0 +1,177 @@
+"""
+Credit scoring rules.
+
+The scalar functions are used by the per-borrower credit builders in
+credit_utils; the vectorized functions apply the same rules to whole
+populations held in NumPy arrays, so the book can be rescored in one pass
+after a rule change.
+"""
+import logging
+import numpy as np
+from django.db.models import Count, Q
+
+logger = logging.getLogger(__name__)
+
+MIN_SCORE = 300
+MAX_SCORE = 850
+
+LETSEMA_BASE_SCORE = 600
+APPROVED_BONUS = 30
+REJECTED_PENALTY = 50
+LATE_PENALTY = 20
+
+MFI_BASE_SCORE = 750
+
+
+def letsema_score(approved, rejected, late):
+    """Letsema score from approved/rejected loan and late payment counts"""
+    score = LETSEMA_BASE_SCORE + approved * APPROVED_BONUS - rejected * REJECTED_PENALTY - late * LATE_PENALTY
+    return max(MIN_SCORE, min(MAX_SCORE, score))
+
+
+def mfi_score(late):
+    """MFI score from the number of late repayments"""
+    return max(MIN_SCORE, min(MAX_SCORE, MFI_BASE_SCORE - late * LATE_PENALTY))
+
+
+def combine_scores(score, mfi_score):
+    """Fold one MFI score into a running combined score (simple average)"""
+    return (score + mfi_score) // 2
+
+
+def letsema_scores(approved, rejected, late):
+    """Vectorized letsema_score over equally sized integer arrays"""
+    scores = (
+        LETSEMA_BASE_SCORE
+        + np.asarray(approved, dtype=np.int64) * APPROVED_BONUS
+        - np.asarray(rejected, dtype=np.int64) * REJECTED_PENALTY
+        - np.asarray(late, dtype=np.int64) * LATE_PENALTY
+    )
+    return np.clip(scores, MIN_SCORE, MAX_SCORE)
+
+
+def mfi_scores(late):
+    """Vectorized mfi_score"""
+    return np.clip(MFI_BASE_SCORE - np.asarray(late, dtype=np.int64) * LATE_PENALTY, MIN_SCORE, MAX_SCORE)
+
+
+def combined_scores(letsema, mfi_late_columns):
+    """
+    Vectorized counterpart of get_combined_credit_data scoring.
+
+    mfi_late_columns is a sequence of late-repayment arrays, one per
+    cluster, in the order the clusters are merged.
+    """
+    scores = np.asarray(letsema, dtype=np.int64)
+    for late in mfi_late_columns:
+        scores = (scores + mfi_scores(late)) // 2
+    return scores
+
+
+def load_letsema_features(national_ids=None):
+    """
+    Load approved, rejected and late payment counts for every borrower (or
+    only the given ones) in a single aggregated query.
+
+    Returns (national_ids, approved, rejected, late) with the counts as
+    int64 arrays aligned to the national_ids list.
+    """
+    from loans.models import LoanApplication
+    from users.models import BorrowerProfile
+    from .credit_utils import PAYMENT_LATE
+
+    queryset = BorrowerProfile.objects.all()
+    if national_ids is not None:
+        queryset = queryset.filter(national_id__in=list(national_ids))
+
+    rows = (
+        queryset
+        .order_by('pk')
+        .annotate(
+            approved=Count(
+                'user__loan_applications',
+                filter=Q(user__loan_applications__status=LoanApplication.Status.APPROVED),
+                distinct=True
+            ),
+            rejected=Count(
+                'user__loan_applications',
+                filter=Q(user__loan_applications__status=LoanApplication.Status.REJECTED),
+                distinct=True
+            ),
+            late=Count(
+                'user__loan_applications__status_updates',
+                filter=Q(user__loan_applications__status_updates__new_status=PAYMENT_LATE)
+            ),
+        )
+        .values_list('national_id', 'approved', 'rejected', 'late')
+    )
+
+    ids = []
+    counts = []
+    for national_id, approved, rejected, late in rows.iterator():
+        ids.append(national_id)
+        counts.append((approved, rejected, late))
+
+    matrix = np.array(counts, dtype=np.int64).reshape(-1, 3)
+    return ids, matrix[:, 0], matrix[:, 1], matrix[:, 2]
+
+
+def late_counts_query(access):
+    """Per-borrower late repayment counts for an array of national IDs"""
+    return f"""
+        SELECT b.national_id,
+               SUM(CASE WHEN r.status = 'late' THEN 1 ELSE 0 END) as late_count
+        FROM {access.table('borrowers')} b
+        JOIN {access.table('loans')} l ON l.borrower_id = b.id
+        JOIN {access.table('repayments')} r ON l.id = r.loan_id
+        WHERE b.national_id = ANY(%s)
+        GROUP BY b.national_id
+    """
+
+
+def load_mfi_late_counts(cluster, national_ids):
+    """
+    Late repayment counts from one cluster, aligned to national_ids.
+
+    Borrowers unknown to the cluster get 0, matching get_mfi_credit_data.
+    """
+    from mfi.snapshots import credit_access
+
+    index = {national_id: i for i, national_id in enumerate(national_ids)}
+    late = np.zeros(len(national_ids), dtype=np.int64)
+
+    access = credit_access(cluster)
+    with access.cursor() as cursor:
+        cursor.execute(late_counts_query(access), [list(national_ids)])
+
+        for national_id, late_count in cursor.fetchall():
+            if national_id in index:
+                late[index[national_id]] = late_count or 0
+
+    return late
+
+
+def score_population(national_ids=None, clusters=None):
+    """
+    Compute combined credit scores for the whole population (or the given
+    borrowers) in one vectorized pass.
+
+    Returns (national_ids, scores, failed_clusters). Clusters that cannot be
+    read are left out of the merge, as get_combined_credit_data does.
+    """
+    from mfi.clusters import active_cluster_names
+
+    clusters = active_cluster_names() if clusters is None else clusters
+    ids, approved, rejected, late = load_letsema_features(national_ids)
+
+    mfi_late_columns = []
+    failed_clusters = set()
+    for cluster in clusters:
+        try:
+            mfi_late_columns.append(load_mfi_late_counts(cluster, ids))
+        except Exception as e:
+            failed_clusters.add(cluster)
+            logger.warning(f"Could not load {cluster} scoring features: {str(e)}")
+
+    scores = combined_scores(letsema_scores(approved, rejected, late), mfi_late_columns)
+    return ids, scores, failed_clusters
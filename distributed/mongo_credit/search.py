@@ -0,0 +1,136 @@
+"""
+Filtered, keyset-paginated search over credit history summaries.
+
+Every supported filter is a range on one of the indexed summary fields and
+every sort order is backed by a (field, national_id) index, so searches
+never scan the collection and pages never use skip(). Results are
+projected to the summary fields.
+"""
+import base64
+import json
+from datetime import datetime
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from .cache import CACHED_FIELDS
+from .models import CreditHistory
+
+# query parameter: (field, operator, parser)
+FILTERS = {
+    'score_min': ('credit_score', '$gte', int),
+    'score_max': ('credit_score', '$lte', int),
+    'updated_after': ('updated_at', '$gte', 'datetime'),
+    'updated_before': ('updated_at', '$lt', 'datetime'),
+    'active_loans_min': ('active_loans', '$gte', int),
+    'active_loans_max': ('active_loans', '$lte', int),
+    'total_debt_min': ('total_debt', '$gte', float),
+    'total_debt_max': ('total_debt', '$lte', float),
+}
+
+SORT_FIELDS = ('credit_score', 'updated_at', 'active_loans', 'total_debt')
+
+PROJECTION = {'_id': 0, **{field: 1 for field in CACHED_FIELDS}}
+
+
+def _parse_datetime(value):
+    parsed = parse_datetime(value)
+    if parsed is None:
+        date = parse_date(value)
+        if date is None:
+            raise ValueError(f"Invalid datetime: {value}")
+        parsed = datetime(date.year, date.month, date.day)
+    # Summaries store naive local datetimes (datetime.now()), so an offset
+    # is converted to local time before it is dropped
+    return timezone.make_naive(parsed) if timezone.is_aware(parsed) else parsed
+
+
+def parse_filters(params):
+    """Mongo query for the supported filters present in params; raises ValueError"""
+    query = {}
+    for name, (field, operator, parser) in FILTERS.items():
+        value = params.get(name)
+        if value in (None, ''):
+            continue
+        try:
+            parsed = _parse_datetime(value) if parser == 'datetime' else parser(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid {name}: {value}")
+        query.setdefault(field, {})[operator] = parsed
+    return query
+
+
+def parse_sort(value, query):
+    """
+    (field, direction) for a sort such as '-credit_score'. Without one the
+    first filtered field is used, so the range and the order share an index.
+    """
+    if not value:
+        field = next((field for field in SORT_FIELDS if field in query), 'credit_score')
+        return field, 1
+    field = value.lstrip('-')
+    if field not in SORT_FIELDS:
+        raise ValueError(f"Invalid sort: {value}")
+    return field, -1 if value.startswith('-') else 1
+
+
+def encode_search_cursor(document, field):
+    value = document[field]
+    if isinstance(value, datetime):
+        value = {'$date': value.isoformat()}
+    return base64.urlsafe_b64encode(json.dumps([value, document['national_id']]).encode()).decode()
+
+
+def decode_search_cursor(cursor):
+    """Return (sort value, national_id) or raise ValueError"""
+    try:
+        value, national_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if isinstance(value, dict):
+            value = _parse_datetime(value['$date'])
+        return value, str(national_id)
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+
+def _keyset_query(query, field, direction, cursor):
+    if not cursor:
+        return query
+    value, national_id = decode_search_cursor(cursor)
+    after = '$gt' if direction == 1 else '$lt'
+    return {'$and': [query, {'$or': [
+        {field: {after: value}},
+        {field: value, 'national_id': {after: national_id}},
+    ]}]}
+
+
+def search_cursor(query, field, direction, cursor=None):
+    """Raw pymongo cursor for one search; also used to explain the plan"""
+    return (
+        CreditHistory._get_collection()
+        .find(_keyset_query(query, field, direction, cursor), PROJECTION)
+        .sort([(field, direction), ('national_id', direction)])
+    )
+
+
+def search_credit_histories(query, field, direction, cursor=None, limit=50):
+    """One page of matching summaries as (documents, next_cursor)"""
+    documents = list(search_cursor(query, field, direction, cursor).limit(limit + 1))
+    next_cursor = None
+    if len(documents) > limit:
+        documents = documents[:limit]
+        next_cursor = encode_search_cursor(documents[-1], field)
+    return documents, next_cursor
+
+
+def plan_stages(explain):
+    """Every stage name in the winning plan of a find explain() result"""
+    stages = []
+
+    def walk(plan):
+        stages.append(plan.get('stage'))
+        for key in ('inputStage', 'queryPlan'):
+            if key in plan:
+                walk(plan[key])
+        for child in plan.get('inputStages', []):
+            walk(child)
+
+    walk(explain['queryPlanner']['winningPlan'])
+    return stages
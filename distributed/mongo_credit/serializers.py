@@ -5,7 +5,7 @@ class CreditHistorySerializer(serializers.Serializer):
     credit_score = serializers.IntegerField()
     active_loans = serializers.IntegerField()
     total_debt = serializers.DecimalField(max_digits=12, decimal_places=2)
-    payment_history = serializers.ListField(child=serializers.DictField())
-    inquiries = serializers.ListField(child=serializers.DictField())
+    payment_count = serializers.IntegerField()
+    inquiry_count = serializers.IntegerField()
     created_at = serializers.DateTimeField()
-    updated_at = serializers.DateTimeField()
\ No newline at end of file
+    updated_at = serializers.DateTimeField()
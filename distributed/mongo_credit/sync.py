@@ -0,0 +1,351 @@
+import logging
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Q
+from django.utils import timezone
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from mfi.clusters import active_cluster_names
+from mfi.snapshots import credit_access
+from .analytics import track_rollups
+from .cache import invalidate_credit_history
+from .history import HISTORY_KINDS, history_operations, split_credit_record
+from .models import CreditHistory, CreditHistoryBucket
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 1000
+
+# Watermark of a source that had no rows yet. It is stored like any other
+# mark, so an empty source (a newly onboarded cluster) does not force full
+# rebuilds, and everything it gains afterwards is newer than it.
+NO_DATA_WATERMARK = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def iter_borrower_chunks(chunk_size=DEFAULT_CHUNK_SIZE, queryset=None):
+    """
+    Stream borrower national IDs from Letsema in lists of chunk_size.
+
+    Rows are read through a server-side cursor so memory use does not grow
+    with the number of borrowers.
+    """
+    from users.models import BorrowerProfile
+
+    if queryset is None:
+        queryset = BorrowerProfile.objects.all()
+
+    national_ids = (
+        queryset
+        .order_by('pk')
+        .values_list('national_id', flat=True)
+        .iterator(chunk_size=chunk_size)
+    )
+
+    chunk = []
+    for national_id in national_ids:
+        chunk.append(national_id)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def iter_cluster_borrower_chunks(cluster, chunk_size=DEFAULT_CHUNK_SIZE, access=None):
+    """
+    Stream a cluster's borrower national IDs in lists of chunk_size through
+    a named server-side cursor.
+
+    Run it inside a transaction on access.alias: in autocommit mode the
+    cursor is declared WITH HOLD and materialized in full before the first
+    fetch.
+    """
+    access = access or credit_access(cluster)
+    with access.connection.chunked_cursor() as cursor:
+        cursor.execute(f"SELECT national_id FROM {access.table('borrowers')} ORDER BY id")
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield [row[0] for row in rows]
+
+
+class IncompleteCreditData(RuntimeError):
+    """A chunk is missing the data of clusters that could not be read"""
+
+    def __init__(self, clusters):
+        self.clusters = set(clusters)
+        super().__init__(f"Could not read {', '.join(sorted(self.clusters))}")
+
+
+def fetch_combined_credit_data(national_ids, clusters, include_unknown=False):
+    """
+    get_combined_credit_data_many for sync jobs. A chunk that is missing a
+    cluster raises IncompleteCreditData rather than being returned: writing
+    it would drop that cluster's figures from the summaries, so
+    run_credit_sync counts it as errors and it is retried on the next run.
+    """
+    from .credit_utils import get_combined_credit_data_many
+
+    credit_data, failed_clusters = get_combined_credit_data_many(national_ids, clusters, include_unknown)
+    if failed_clusters:
+        raise IncompleteCreditData(failed_clusters)
+    return credit_data
+
+
+def bulk_upsert_credit_histories(records):
+    """
+    Write credit records with one unordered bulk upsert of the summaries
+    keyed on national_id and one of their history buckets.
+
+    Returns a (written, failed) tuple counting borrowers; one whose summary
+    or any history bucket failed to write counts as failed. created_at is
+    only set when the document is inserted so that re-syncs keep the original
+    creation time. Entries embedded by documents written before the history
+    split are dropped from the summary as it is rewritten. The change to the
+    summaries is folded into the analytics rollups.
+    """
+    if not records:
+        return 0, 0
+
+    now = datetime.now()
+    operations = []
+    history_ops = []
+    history_owners = []
+    for record in records:
+        document, history = split_credit_record(record)
+        created_at = document.pop('created_at', None) or now
+        document['updated_at'] = now
+        operations.append(UpdateOne(
+            {'national_id': document['national_id']},
+            {
+                '$set': document,
+                '$setOnInsert': {'created_at': created_at},
+                '$unset': {field: '' for field in HISTORY_KINDS.values()},
+            },
+            upsert=True
+        ))
+        document_history_ops = history_operations(document['national_id'], history)
+        history_ops.extend(document_history_ops)
+        history_owners.extend([document['national_id']] * len(document_history_ops))
+
+    try:
+        history_failed = set()
+        if history_ops:
+            try:
+                CreditHistoryBucket._get_collection().bulk_write(history_ops, ordered=False)
+            except BulkWriteError as e:
+                history_failed = {history_owners[error['index']] for error in e.details.get('writeErrors', [])}
+                logger.error(f"History bucket write failed for {len(history_failed)} borrowers")
+
+        collection = CreditHistory._get_collection()
+        with track_rollups(record['national_id'] for record in records):
+            try:
+                result = collection.bulk_write(operations, ordered=False)
+                written, summary_failed = result.matched_count + result.upserted_count, set()
+            except BulkWriteError as e:
+                details = e.details
+                summary_failed = {records[error['index']]['national_id'] for error in details.get('writeErrors', [])}
+                logger.error(f"Bulk upsert finished with {len(summary_failed)} write errors")
+                written = details.get('nMatched', 0) + details.get('nUpserted', 0)
+        # A written summary whose history is incomplete still needs a re-sync
+        return written - len(history_failed - summary_failed), len(history_failed | summary_failed)
+    finally:
+        invalidate_credit_history(*(record['national_id'] for record in records))
+
+
+def run_credit_sync(chunks, fetch_credit_data, progress=None):
+    """
+    Shared credit history sync pipeline.
+
+    chunks yields lists of national IDs, fetch_credit_data maps one such list
+    to a {national_id: credit_data} dict, and each computed chunk is written
+    with bulk_upsert_credit_histories. progress, when given, is called with
+    the running stats after every chunk. Returns the final stats dict.
+    """
+    from .credit_utils import init_mongo_connection
+
+    init_mongo_connection()
+
+    stats = {'synced': 0, 'skipped': 0, 'errors': 0, 'elapsed': 0.0, 'docs_per_second': 0.0}
+    started = time.monotonic()
+
+    for national_ids in chunks:
+        try:
+            credit_data = fetch_credit_data(national_ids)
+        except Exception as e:
+            stats['errors'] += len(national_ids)
+            logger.error(f"Failed to compute credit data for chunk of {len(national_ids)}: {str(e)}")
+            continue
+
+        records = [data for data in credit_data.values() if data]
+        stats['skipped'] += len(national_ids) - len(records)
+
+        written, failed = bulk_upsert_credit_histories(records)
+        stats['synced'] += written
+        stats['errors'] += failed
+
+        stats['elapsed'] = time.monotonic() - started
+        stats['docs_per_second'] = stats['synced'] / stats['elapsed'] if stats['elapsed'] else 0.0
+        if progress:
+            progress(stats)
+
+    stats['elapsed'] = time.monotonic() - started
+    stats['docs_per_second'] = stats['synced'] / stats['elapsed'] if stats['elapsed'] else 0.0
+    logger.info(
+        f"Credit sync finished: {stats['synced']} synced, {stats['errors']} errors "
+        f"in {stats['elapsed']:.1f}s ({stats['docs_per_second']:.0f} docs/s)"
+    )
+    return stats
+
+
+def format_sync_stats(stats):
+    """Human readable summary of run_credit_sync stats"""
+    return (
+        f"{stats['synced']} records synced, {stats['errors']} errors, "
+        f"{stats['skipped']} skipped in {stats['elapsed']:.1f}s "
+        f"({stats['docs_per_second']:.0f} docs/s)"
+    )
+
+
+def sync_cluster_credit_histories(cluster, chunk_size=DEFAULT_CHUNK_SIZE, progress=None):
+    """
+    Sync the credit histories of every borrower in one MFI cluster.
+
+    Borrowers are streamed chunk by chunk from a server-side cursor, each
+    chunk is computed with the batched credit queries and written with one
+    bulk upsert, so memory use depends on chunk_size and not on the size
+    of the cluster. Summaries are written whole, so each chunk is combined
+    from Letsema and every active cluster as in sync_credit_histories.
+    Borrowers unknown to Letsema are only written when a cluster has loans
+    for them, and a chunk missing another cluster counts as errors. Returns the run_credit_sync stats.
+    """
+    access = credit_access(cluster)
+    clusters = sorted(set(active_cluster_names()) | {cluster})
+
+    def fetch(national_ids):
+        # Savepoint, so a failed chunk does not abort the cursor's transaction
+        with transaction.atomic(using=access.alias):
+            return fetch_combined_credit_data(national_ids, clusters, include_unknown=True)
+
+    with transaction.atomic(using=access.alias):
+        return run_credit_sync(
+            iter_cluster_borrower_chunks(cluster, chunk_size, access),
+            fetch,
+            progress=progress
+        )
+
+
+def get_watermarks(sources):
+    """Stored high-water marks for the given sources, None when never synced"""
+    from .models import SyncWatermark
+
+    stored = {mark.source: mark.watermark for mark in SyncWatermark.objects(source__in=list(sources))}
+    return {
+        source: timezone.make_aware(stored[source], dt_timezone.utc) if stored.get(source) else None
+        for source in sources
+    }
+
+
+def set_watermark(source, watermark):
+    from .models import SyncWatermark
+
+    SyncWatermark.objects(source=source).update_one(
+        set__watermark=watermark,
+        set__updated_at=datetime.now(),
+        upsert=True
+    )
+
+
+def _mfi_change_columns():
+    return getattr(settings, 'MFI_CHANGE_COLUMNS', {'loans': 'updated_at', 'repayments': 'updated_at'})
+
+
+def capture_watermarks(clusters):
+    """
+    Newest change timestamp currently visible in each source.
+
+    Taken before the sync reads anything so changes made during the run are
+    picked up again next time. MFI marks are read from the same tables the
+    credit data is (snapshot or live). Sources without rows map to
+    NO_DATA_WATERMARK, clusters that cannot be reached to None.
+    """
+    from loans.models import LoanApplication, LoanStatusUpdate
+
+    loan_marks = LoanApplication.objects.aggregate(
+        applied=Max('application_date'), decided=Max('decision_date')
+    )
+    update_mark = LoanStatusUpdate.objects.aggregate(updated=Max('timestamp'))['updated']
+    letsema_marks = [mark for mark in (*loan_marks.values(), update_mark) if mark]
+    watermarks = {'letsema': max(letsema_marks) if letsema_marks else NO_DATA_WATERMARK}
+
+    columns = _mfi_change_columns()
+    for cluster in clusters:
+        try:
+            access = credit_access(cluster)
+            with access.cursor() as cursor:
+                cursor.execute(f"""
+                    SELECT GREATEST(
+                        (SELECT MAX({columns['loans']}) FROM {access.table('loans')}),
+                        (SELECT MAX({columns['repayments']}) FROM {access.table('repayments')})
+                    )
+                """)
+                watermarks[cluster] = cursor.fetchone()[0] or NO_DATA_WATERMARK
+        except Exception as e:
+            logger.warning(f"Could not read change watermark for {cluster}: {str(e)}")
+            watermarks[cluster] = None
+
+    return watermarks
+
+
+def changed_borrowers(watermarks, clusters):
+    """
+    BorrowerProfile queryset of borrowers whose credit inputs changed after
+    the given watermarks, plus the set of clusters that could not be read.
+
+    Each watermark is moved back by CREDIT_SYNC_WATERMARK_OVERLAP so rows
+    committed late with an older timestamp are not missed; recomputing a
+    borrower twice is harmless.
+    """
+    from loans.models import LoanApplication, LoanStatusUpdate
+    from users.models import BorrowerProfile
+
+    overlap = getattr(settings, 'CREDIT_SYNC_WATERMARK_OVERLAP', timedelta(minutes=5))
+
+    since = watermarks['letsema'] - overlap
+    changed_loans = LoanApplication.objects.filter(
+        Q(application_date__gt=since) | Q(decision_date__gt=since)
+    ).values('borrower_id')
+    changed_updates = LoanStatusUpdate.objects.filter(timestamp__gt=since).values('loan__borrower_id')
+    condition = Q(user_id__in=changed_loans) | Q(user_id__in=changed_updates)
+
+    failed_clusters = set()
+    columns = _mfi_change_columns()
+    for cluster in clusters:
+        since = watermarks[cluster] - overlap
+        try:
+            access = credit_access(cluster)
+            with access.cursor() as cursor:
+                cursor.execute(f"""
+                    SELECT b.national_id
+                    FROM {access.table('borrowers')} b
+                    JOIN {access.table('loans')} l ON l.borrower_id = b.id
+                    WHERE l.{columns['loans']} > %s
+                    UNION
+                    SELECT b.national_id
+                    FROM {access.table('borrowers')} b
+                    JOIN {access.table('loans')} l ON l.borrower_id = b.id
+                    JOIN {access.table('repayments')} r ON r.loan_id = l.id
+                    WHERE r.{columns['repayments']} > %s
+                """, [since, since])
+                national_ids = [row[0] for row in cursor.fetchall()]
+        except Exception as e:
+            failed_clusters.add(cluster)
+            logger.warning(f"Could not read changed borrowers from {cluster}: {str(e)}")
+            continue
+        if national_ids:
+            condition |= Q(national_id__in=national_ids)
+
+    return BorrowerProfile.objects.filter(condition), failed_clusters
@@ -1,12 +1,810 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from mongo_credit.credit_utils import generate_test_credit_history
 from loans.models import CreditHistory
 
 class CreditHistoryTests(TestCase):
     def test_credit_history_creation(self):
-        test_data = generate_test_credit_history("TEST123")
+        from mongo_credit.history import split_credit_record
+
+        test_data, _ = split_credit_record(generate_test_credit_history("TEST123"))
         record = CreditHistory(**test_data)
         record.save()
         
         self.assertEqual(CreditHistory.objects.count(), 1)
-        self.assertTrue(300 <= record.credit_score <= 850)
\ No newline at end of file
+        self.assertTrue(300 <= record.credit_score <= 850)
+
+class LetsemaCreditDataQueryTests(TestCase):
+    def setUp(self):
+        from datetime import date
+        from django.contrib.auth import get_user_model
+        from mfi.models import MicroFinanceInstitution
+        from users.models import BorrowerProfile
+        from loans.models import LoanApplication, LoanStatusUpdate
+
+        User = get_user_model()
+        mfi = MicroFinanceInstitution.objects.create(
+            name="Test MFI A", code="MFI_A", description="", cluster_name="mfi_a"
+        )
+        self.national_ids = []
+        for i in range(3):
+            user = User.objects.create_user(username=f"borrower{i}", password="testpass123")
+            BorrowerProfile.objects.create(
+                user=user, national_id=f"NID{i}", phone_number="", address="",
+                date_of_birth=date(1990, 1, 1)
+            )
+            self.national_ids.append(f"NID{i}")
+            for status in (LoanApplication.Status.APPROVED, LoanApplication.Status.REJECTED):
+                loan = LoanApplication.objects.create(
+                    borrower=user, mfi=mfi, amount=1000, purpose="Test",
+                    term_months=12, interest_rate=10, status=status
+                )
+                LoanStatusUpdate.objects.create(loan=loan, old_status='', new_status='PAYMENT_LATE')
+                LoanStatusUpdate.objects.create(loan=loan, old_status='', new_status='PAYMENT_RECEIVED')
+
+    def test_batch_uses_constant_queries(self):
+        from mongo_credit.credit_utils import get_letsema_credit_data_many
+
+        with self.assertNumQueries(2):
+            results = get_letsema_credit_data_many(self.national_ids + ["MISSING"])
+
+        self.assertEqual(set(results), set(self.national_ids))
+        data = results["NID0"]
+        self.assertEqual(data['active_loans'], 1)
+        self.assertEqual(data['total_debt'], 1000.0)
+        self.assertEqual(data['credit_score'], 600 + 30 - 50 - 2 * 20)
+        self.assertEqual([loan['late_payments'] for loan in data['payment_history']], [1, 1])
+        self.assertEqual([loan['repayments_count'] for loan in data['payment_history']], [1, 1])
+
+
+class CombinedCreditDataFanOutTests(TestCase):
+    def _letsema_data(self):
+        return {
+            'national_id': 'NID0', 'credit_score': 600, 'active_loans': 1,
+            'total_debt': 1000.0, 'payment_history': [], 'inquiries': [],
+        }
+
+    def _mfi_data(self, score):
+        return {'credit_score': score, 'active_loans': 1, 'total_debt': 500.0, 'payment_history': [{}]}
+
+    def test_slow_source_is_reported_as_timeout(self):
+        import time
+        from unittest import mock
+        from django.test import override_settings
+        from mongo_credit import credit_utils
+
+        def fetch(cluster, national_id, timeout):
+            if cluster == 'mfi_b':
+                time.sleep(0.5)
+            return self._mfi_data(700)
+
+        with override_settings(CREDIT_SOURCE_TIMEOUTS={'default': 0.1}), \
+                mock.patch.object(credit_utils, 'active_cluster_names', return_value=['mfi_a', 'mfi_b']), \
+                mock.patch.object(credit_utils, 'get_letsema_credit_data', return_value=self._letsema_data()), \
+                mock.patch.object(credit_utils, '_fetch_mfi_credit_data', side_effect=fetch):
+            data = credit_utils.get_combined_credit_data('NID0')
+
+        self.assertEqual(data['sources'], {'letsema': 'ok', 'mfi_a': 'ok', 'mfi_b': 'timeout'})
+        self.assertTrue(data['partial'])
+        self.assertEqual(data['credit_score'], (600 + 700) // 2)
+        self.assertEqual(data['active_loans'], 2)
+
+    def test_merge_order_is_fixed(self):
+        from unittest import mock
+        from mongo_credit import credit_utils
+
+        scores = {'mfi_a': 700, 'mfi_b': 800}
+        with mock.patch.object(credit_utils, 'active_cluster_names', return_value=['mfi_a', 'mfi_b']), \
+                mock.patch.object(credit_utils, 'get_letsema_credit_data', return_value=self._letsema_data()), \
+                mock.patch.object(credit_utils, '_fetch_mfi_credit_data',
+                                  side_effect=lambda cluster, *args: self._mfi_data(scores[cluster])):
+            data = credit_utils.get_combined_credit_data('NID0')
+
+        self.assertFalse(data['partial'])
+        self.assertEqual(data['credit_score'], ((600 + 700) // 2 + 800) // 2)
+
+    def test_statement_timeout_is_scoped_to_the_fetch(self):
+        from unittest import mock
+        from django.db import connection
+        from mongo_credit import credit_utils
+
+        def fetch(cluster, national_id, access):
+            self.assertTrue(connection.in_atomic_block)
+            return self._mfi_data(700)
+
+        cursor = mock.MagicMock()
+        cursor.__enter__.return_value = cursor
+        access = mock.Mock(alias='default')
+        access.cursor.return_value = cursor
+        with mock.patch.object(credit_utils, 'credit_access', return_value=access), \
+                mock.patch.object(credit_utils, 'get_mfi_credit_data', side_effect=fetch):
+            credit_utils._fetch_mfi_credit_data('mfi_a', 'NID0', 2.5)
+
+        # is_local=true: SET LOCAL, reset when the fetch's transaction ends
+        cursor.execute.assert_called_once_with("SELECT set_config('statement_timeout', %s, true)", ['2500'])
+
+
+class VectorizedScoringTests(TestCase):
+    def test_matches_per_borrower_rules(self):
+        import numpy as np
+        from mongo_credit import scoring
+
+        rng = np.random.default_rng(42)
+        approved, rejected, late = (rng.integers(0, 20, 500) for _ in range(3))
+        mfi_late = [rng.integers(0, 40, 500) for _ in range(2)]
+
+        vectorized = scoring.combined_scores(scoring.letsema_scores(approved, rejected, late), mfi_late)
+
+        for i in range(500):
+            score = scoring.letsema_score(int(approved[i]), int(rejected[i]), int(late[i]))
+            for column in mfi_late:
+                score = scoring.combine_scores(score, scoring.mfi_score(int(column[i])))
+            self.assertEqual(vectorized[i], score)
+
+
+class CreditHistoryCacheTests(TestCase):
+    def setUp(self):
+        from django.core.cache import caches
+        caches['credit_history'].clear()
+
+    def test_read_through_and_invalidate(self):
+        from unittest import mock
+        from mongo_credit.cache import cache_stats, get_credit_history, invalidate_credit_history
+        from mongo_credit.models import CreditHistory
+
+        from mongo_credit.history import split_credit_record
+
+        document = CreditHistory(**split_credit_record(generate_test_credit_history("TEST123"))[0])
+        loader = mock.Mock(return_value=document)
+
+        first = get_credit_history("TEST123", loader)
+        second = get_credit_history("TEST123", loader)
+        self.assertEqual(first, second)
+        self.assertEqual(first['credit_score'], document.credit_score)
+        self.assertEqual(loader.call_count, 1)
+
+        invalidate_credit_history("TEST123")
+        get_credit_history("TEST123", loader)
+        self.assertEqual(loader.call_count, 2)
+
+        stats = cache_stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 2))
+
+
+class ClusterBorrowerStreamTests(TestCase):
+    def test_borrowers_are_fetched_in_chunks_from_a_named_cursor(self):
+        from unittest import mock
+        from mongo_credit.sync import iter_cluster_borrower_chunks
+
+        rows = [(f"NID{i}",) for i in range(5)]
+        cursor = mock.MagicMock()
+        cursor.__enter__.return_value = cursor
+        cursor.fetchmany.side_effect = lambda size: [rows.pop(0) for _ in range(min(size, len(rows)))]
+        access = mock.Mock()
+        access.table.return_value = 'mfi_a.borrowers'
+        access.connection.chunked_cursor.return_value = cursor
+
+        chunks = list(iter_cluster_borrower_chunks('mfi_a', chunk_size=2, access=access))
+
+        self.assertEqual(chunks, [['NID0', 'NID1'], ['NID2', 'NID3'], ['NID4']])
+        access.connection.chunked_cursor.assert_called_once()
+        cursor.fetchmany.assert_called_with(2)
+
+
+class CreditHistoryBucketTests(TestCase):
+    def _payments(self, count, month='2025-03'):
+        return [{'date': f"{month}-{i % 28 + 1:02d}T00:00:{i % 60:02d}", 'amount': i} for i in range(count)]
+
+    def test_split_keeps_summary_and_counts(self):
+        from mongo_credit.history import split_credit_record
+
+        summary, history = split_credit_record(generate_test_credit_history("TEST123"))
+        self.assertNotIn('payment_history', summary)
+        self.assertEqual(summary['payment_count'], 12)
+        self.assertEqual(len(history['payment']), 12)
+        self.assertEqual(summary['inquiry_count'], len(history['inquiry']))
+
+    def test_buckets_are_bounded_and_grouped_by_month(self):
+        from mongo_credit import history
+
+        entries = self._payments(history.BUCKET_SIZE + 10) + self._payments(3, month='2025-04') + [{'amount': 1}]
+        buckets = history.bucket_entries(entries)
+
+        self.assertEqual(sorted(buckets), ['0000-00:0000', '2025-03:0000', '2025-03:0001', '2025-04:0000'])
+        self.assertEqual(len(buckets['2025-03:0000']), history.BUCKET_SIZE)
+        self.assertEqual(len(buckets['2025-03:0001']), 10)
+        newest = buckets['2025-04:0000']
+        self.assertEqual([history.entry_date(e) for e in newest], sorted((history.entry_date(e) for e in newest), reverse=True))
+
+    def test_history_pages_newest_first(self):
+        from mongo_credit.credit_utils import init_mongo_connection
+        from mongo_credit.history import entry_date, history_operations, page_history
+        from mongo_credit.models import CreditHistoryBucket
+
+        init_mongo_connection()
+        CreditHistoryBucket.objects(national_id="PAGED").delete()
+        payments = self._payments(250) + self._payments(30, month='2025-04')
+        CreditHistoryBucket._get_collection().bulk_write(history_operations("PAGED", {'payment': payments}))
+
+        seen = []
+        cursor = None
+        while True:
+            page, cursor = page_history("PAGED", 'payment', cursor, limit=70)
+            seen.extend(page)
+            if not cursor:
+                break
+
+        self.assertEqual(len(seen), 280)
+        self.assertEqual([entry_date(e) for e in seen], sorted((entry_date(e) for e in payments), reverse=True))
+        CreditHistoryBucket.objects(national_id="PAGED").delete()
+
+
+class CreditHistorySearchTests(TestCase):
+    PARAMS = {
+        'score_min': '600', 'score_max': '700',
+        'updated_after': '2025-01-01', 'updated_before': '2025-02-01T00:00:00',
+        'active_loans_min': '1', 'active_loans_max': '3',
+        'total_debt_min': '100.5', 'total_debt_max': '5000',
+    }
+
+    def setUp(self):
+        from mongo_credit.credit_utils import init_mongo_connection
+        from mongo_credit.models import CreditHistory
+
+        init_mongo_connection()
+        CreditHistory.ensure_indexes()
+
+    def test_every_filter_uses_an_index(self):
+        from mongo_credit.search import FILTERS, parse_filters, parse_sort, plan_stages, search_cursor
+
+        for name in FILTERS:
+            for sort in (None, '-credit_score', 'updated_at'):
+                query = parse_filters({name: self.PARAMS[name]})
+                field, direction = parse_sort(sort, query)
+                stages = plan_stages(search_cursor(query, field, direction).limit(50).explain())
+                self.assertNotIn('COLLSCAN', stages, f"{name} sorted by {sort}: {stages}")
+
+    def test_keyset_pages_cover_every_match_once(self):
+        from mongo_credit.models import CreditHistory
+        from mongo_credit.search import parse_filters, parse_sort, search_credit_histories
+
+        CreditHistory.objects(national_id__startswith="SEARCH").delete()
+        for i in range(25):
+            CreditHistory(national_id=f"SEARCH{i:02d}", credit_score=600 + i % 3, active_loans=1).save()
+
+        query = parse_filters({'score_min': '600', 'score_max': '602'})
+        field, direction = parse_sort('-credit_score', query)
+        seen, cursor = [], None
+        while True:
+            page, cursor = search_credit_histories(query, field, direction, cursor, limit=4)
+            seen.extend(page)
+            if not cursor:
+                break
+
+        ids = [document['national_id'] for document in seen if document['national_id'].startswith("SEARCH")]
+        self.assertEqual(len(ids), 25)
+        self.assertEqual(len(set(ids)), 25)
+        self.assertNotIn('_id', seen[0])
+        CreditHistory.objects(national_id__startswith="SEARCH").delete()
+
+    def test_invalid_filter_is_rejected(self):
+        from mongo_credit.search import parse_filters, parse_sort
+
+        with self.assertRaises(ValueError):
+            parse_filters({'score_min': 'high'})
+        with self.assertRaises(ValueError):
+            parse_sort('national_id', {})
+
+    @override_settings(TIME_ZONE='Africa/Johannesburg')
+    def test_datetime_filters_convert_offsets_to_local_time(self):
+        from datetime import datetime
+        from mongo_credit.search import parse_filters
+
+        query = parse_filters({
+            'updated_after': '2025-03-01T10:00:00Z',
+            'updated_before': '2025-03-01T10:00:00+02:00',
+        })
+        self.assertEqual(query['updated_at'], {
+            '$gte': datetime(2025, 3, 1, 12, 0),
+            '$lt': datetime(2025, 3, 1, 10, 0),
+        })
+        self.assertEqual(parse_filters({'updated_after': '2025-03-01'})['updated_at']['$gte'], datetime(2025, 3, 1))
+
+
+def delete_test_credit_histories(prefix):
+    """Delete the summaries and buckets written by a test, taking them out of the rollups too"""
+    from mongo_credit.analytics import track_rollups
+    from mongo_credit.models import CreditHistory, CreditHistoryBucket
+
+    national_ids = CreditHistory.objects(national_id__startswith=prefix).distinct('national_id')
+    with track_rollups(national_ids):
+        CreditHistory.objects(national_id__startswith=prefix).delete()
+    CreditHistoryBucket.objects(national_id__startswith=prefix).delete()
+
+
+class CreditAnalyticsTests(TestCase):
+    """
+    Runs against the configured MongoDB, so it only writes ANALYTICS*
+    borrowers and checks how much the rollups moved rather than their totals.
+    """
+
+    def setUp(self):
+        from mongo_credit.credit_utils import init_mongo_connection
+
+        init_mongo_connection()
+        delete_test_credit_histories("ANALYTICS")
+        self.addCleanup(delete_test_credit_histories, "ANALYTICS")
+
+    def _record(self, national_id, letsema_score, mfi_score, late):
+        from mongo_credit.analytics import loan_book
+
+        return {
+            'national_id': national_id,
+            'credit_score': (letsema_score + mfi_score) // 2,
+            'active_loans': 2,
+            'total_debt': 1500.0,
+            'payment_history': [],
+            'inquiries': [],
+            'source_scores': {'letsema': letsema_score, 'mfi_a': mfi_score},
+            'loan_book': (
+                loan_book('letsema', [('MFI1', 'APPROVED', 1000.0, True, late), ('MFI1', 'REJECTED', 200.0, False, False)])
+                + loan_book('mfi_a', [('mfi_a', 'active', 500.0, True, False)])
+            ),
+        }
+
+    def _rollup_fields(self):
+        """{scope: {field path: value}} of the stored rollups"""
+        from mongo_credit.models import CreditAnalytics
+
+        def flatten(document, prefix=''):
+            for key, value in document.items():
+                if isinstance(value, dict):
+                    yield from flatten(value, f"{prefix}{key}.")
+                elif key not in ('scope', 'updated_at'):
+                    yield f"{prefix}{key}", value
+
+        return {
+            document['scope']: dict(flatten(document))
+            for document in CreditAnalytics._get_collection().find({}, {'_id': 0})
+        }
+
+    def _rollup_change(self, before):
+        after = self._rollup_fields()
+        change = {}
+        for scope in set(after) | set(before):
+            fields = {
+                path: after.get(scope, {}).get(path, 0) - before.get(scope, {}).get(path, 0)
+                for path in set(after.get(scope, {})) | set(before.get(scope, {}))
+            }
+            fields = {path: delta for path, delta in fields.items() if delta}
+            if fields:
+                change[scope] = fields
+        return change
+
+    def _totals(self, national_ids):
+        """What a rebuild computes for these borrowers alone"""
+        from mongo_credit.analytics import aggregate_totals
+
+        totals = {
+            scope: {path: value for path, value in fields.items() if value}
+            for scope, fields in aggregate_totals(national_ids).items()
+        }
+        return {scope: fields for scope, fields in totals.items() if fields}
+
+    def test_loan_book_totals_per_mfi_and_status(self):
+        from mongo_credit.analytics import loan_book
+
+        book = loan_book('letsema', [
+            ('MFI1', 'APPROVED', 1000.0, True, True),
+            ('MFI1', 'APPROVED', 500.0, True, False),
+            ('MFI.2', 'REPAID', 300.0, False, True),
+        ])
+        approved = next(entry for entry in book if entry['status'] == 'APPROVED')
+        self.assertEqual((approved['count'], approved['outstanding'], approved['at_risk']), (2, 1500.0, 1000.0))
+        self.assertIn('MFI_2', [entry['mfi'] for entry in book])
+        self.assertEqual(sum(entry['at_risk_count'] for entry in book), 1)
+
+    def test_rollups_follow_writes_and_match_a_rebuild(self):
+        from mongo_credit.sync import bulk_upsert_credit_histories
+
+        before = self._rollup_fields()
+        bulk_upsert_credit_histories([
+            self._record('ANALYTICS1', 610, 700, True), self._record('ANALYTICS2', 820, 850, False)
+        ])
+        bulk_upsert_credit_histories([self._record('ANALYTICS1', 610, 700, False)])
+        change = self._rollup_change(before)
+
+        self.assertEqual(change, self._totals(['ANALYTICS1', 'ANALYTICS2']))
+        letsema = change['letsema']
+        self.assertEqual(letsema['borrowers'], 2)
+        self.assertNotIn('totals.at_risk', letsema)
+        self.assertEqual(letsema['by_status.APPROVED.outstanding'], 2000.0)
+        self.assertEqual((letsema['score_histogram.600'], letsema['score_histogram.800']), (1, 1))
+        self.assertEqual(change['mfi_a']['score_histogram.800'], 1)
+        self.assertEqual(change['all']['totals.count'], 6)
+
+    def test_cluster_syncs_write_combined_records(self):
+        from datetime import datetime
+        from unittest import mock
+        from mongo_credit.credit_utils import _build_letsema_credit_data, _build_mfi_credit_data
+        from mongo_credit.models import CreditHistory, CreditHistoryBucket
+        from mongo_credit.scoring import combine_scores
+        from mongo_credit.sync import bulk_upsert_credit_histories, sync_cluster_credit_histories
+
+        national_ids = ['ANALYTICS3', 'ANALYTICS4']
+        before = self._rollup_fields()
+        bulk_upsert_credit_histories([self._record(national_id, 700, 640, False) for national_id in national_ids])
+
+        letsema_loans = [
+            {'id': 11, 'borrower_id': 1, 'mfi__code': 'MFI1', 'amount': 1000.0, 'status': 'APPROVED',
+             'application_date': datetime(2025, 2, 1), 'decision_date': None, 'late_payments': 1, 'repayments_count': 4},
+            {'id': 12, 'borrower_id': 1, 'mfi__code': 'MFI1', 'amount': 200.0, 'status': 'REJECTED',
+             'application_date': datetime(2024, 9, 1), 'decision_date': None, 'late_payments': 0, 'repayments_count': 0},
+        ]
+        # (id, amount, status, application_date, approval_date, repayments, late payments)
+        cluster_loans = {
+            'mfi_a': [(1, 900.0, 'active', datetime(2025, 1, 1), None, 3, 1)],
+            'mfi_b': [(2, 300.0, 'closed', datetime(2024, 6, 1), None, 6, 0)],
+        }
+
+        def letsema(ids):
+            return {
+                national_id: _build_letsema_credit_data(national_id, letsema_loans)
+                for national_id in ids if national_id in national_ids
+            }
+
+        def cluster_data(cluster, ids, access=None):
+            return {
+                national_id: _build_mfi_credit_data(
+                    cluster, national_id, cluster_loans[cluster] if national_id in national_ids else []
+                )
+                for national_id in ids
+            }
+
+        def sync(cluster):
+            # ANALYTICS9 is in the cluster without loans and unknown to Letsema
+            chunks = iter([national_ids + ['ANALYTICS9']])
+            with mock.patch('mongo_credit.sync.credit_access', return_value=mock.Mock(alias='default')), \
+                    mock.patch('mongo_credit.sync.active_cluster_names', return_value=['mfi_a', 'mfi_b']), \
+                    mock.patch('mongo_credit.sync.iter_cluster_borrower_chunks', return_value=chunks), \
+                    mock.patch('mongo_credit.credit_utils.get_letsema_credit_data_many', side_effect=letsema), \
+                    mock.patch('mongo_credit.credit_utils.get_mfi_credit_data_many', side_effect=cluster_data):
+                return sync_cluster_credit_histories(cluster)
+
+        self.assertEqual(sync('mfi_a')['synced'], 2)
+        cluster_loans['mfi_b'].append((3, 400.0, 'active', datetime(2025, 3, 1), None, 2, 0))
+        stats = sync('mfi_b')
+        self.assertEqual((stats['synced'], stats['skipped']), (2, 1))
+
+        # letsema 600 + 30 - 50 - 20, mfi_a 750 - 20, mfi_b 750
+        score = combine_scores(combine_scores(560, 730), 750)
+        summary = CreditHistory._get_collection().find_one({'national_id': 'ANALYTICS3'})
+        self.assertEqual(summary['source_scores'], {'letsema': 560, 'mfi_a': 730, 'mfi_b': 750})
+        self.assertEqual(
+            (summary['credit_score'], summary['active_loans'], summary['total_debt']),
+            (score, 3, 2300.0)
+        )
+        self.assertEqual((summary['payment_count'], summary['inquiry_count']), (5, 0))
+        self.assertEqual(
+            sorted((entry['source'], entry['status'], entry['amount']) for entry in summary['loan_book']),
+            [('letsema', 'APPROVED', 1000.0), ('letsema', 'REJECTED', 200.0),
+             ('mfi_a', 'active', 900.0), ('mfi_b', 'active', 400.0), ('mfi_b', 'closed', 300.0)]
+        )
+        buckets = CreditHistoryBucket._get_collection().find({'national_id': 'ANALYTICS3', 'kind': 'payment'})
+        self.assertEqual(sorted(entry['loan_id'] for bucket in buckets for entry in bucket['entries']), [1, 2, 3, 11, 12])
+        self.assertIsNone(CreditHistory._get_collection().find_one({'national_id': 'ANALYTICS9'}))
+
+        change = self._rollup_change(before)
+        self.assertEqual(change, self._totals(national_ids))
+        self.assertEqual(change['letsema']['borrowers'], 2)
+        self.assertEqual(change['letsema']['totals.amount'], 2400.0)
+        self.assertEqual(change['mfi_a']['totals.at_risk'], 1800.0)
+        self.assertEqual(change['mfi_b']['totals.count'], 4)
+        # The combined score is histogrammed, not the last synced cluster's
+        self.assertEqual(
+            {path: count for path, count in change['all'].items() if path.startswith('score_histogram.')},
+            {'score_histogram.650': 2}
+        )
+        self.assertEqual(change['all']['borrowers'], 2)
+
+
+class CreditSyncPipelineTests(TestCase):
+    def setUp(self):
+        from mongo_credit.credit_utils import init_mongo_connection
+
+        init_mongo_connection()
+        delete_test_credit_histories("SYNCTEST")
+        self.addCleanup(delete_test_credit_histories, "SYNCTEST")
+
+    def test_resync_keeps_created_at(self):
+        from datetime import datetime
+        from mongo_credit.models import CreditHistory
+        from mongo_credit.sync import bulk_upsert_credit_histories
+
+        first = generate_test_credit_history("SYNCTEST1")
+        first['created_at'] = datetime(2024, 1, 1)
+        self.assertEqual(bulk_upsert_credit_histories([first]), (1, 0))
+
+        second = generate_test_credit_history("SYNCTEST1")
+        second['created_at'] = datetime(2025, 6, 1)
+        self.assertEqual(bulk_upsert_credit_histories([second]), (1, 0))
+
+        stored = CreditHistory.objects.get(national_id="SYNCTEST1")
+        self.assertEqual(stored.created_at, datetime(2024, 1, 1))
+        self.assertEqual(stored.credit_score, second['credit_score'])
+
+    def test_bulk_write_error_is_a_partial_failure(self):
+        from contextlib import nullcontext
+        from unittest import mock
+        from pymongo.errors import BulkWriteError
+        from mongo_credit import sync
+
+        collection = mock.Mock()
+        collection.bulk_write.side_effect = BulkWriteError({
+            'writeErrors': [{'index': 1, 'code': 11000, 'errmsg': 'duplicate'}],
+            'nMatched': 1, 'nUpserted': 1,
+        })
+        records = [generate_test_credit_history(f"SYNCTEST{i}") for i in range(3)]
+
+        with mock.patch.object(sync.CreditHistory, '_get_collection', return_value=collection), \
+                mock.patch.object(sync.CreditHistoryBucket, '_get_collection', return_value=mock.Mock()), \
+                mock.patch.object(sync, 'track_rollups', side_effect=lambda ids: nullcontext()):
+            self.assertEqual(sync.bulk_upsert_credit_histories(records), (2, 1))
+
+    def test_history_bucket_errors_fail_their_borrowers(self):
+        from contextlib import nullcontext
+        from unittest import mock
+        from pymongo.errors import BulkWriteError
+        from mongo_credit import sync
+
+        records = [generate_test_credit_history(f"SYNCTEST{i}") for i in range(3)]
+        owners = [
+            record['national_id'] for record in records
+            for _ in sync.history_operations(record['national_id'], sync.split_credit_record(dict(record))[1])
+        ]
+        buckets = mock.Mock()
+        buckets.bulk_write.side_effect = BulkWriteError({'writeErrors': [
+            {'index': owners.index('SYNCTEST1'), 'code': 2, 'errmsg': 'too large'},
+            {'index': owners.index('SYNCTEST2'), 'code': 2, 'errmsg': 'too large'},
+        ]})
+        summaries = mock.Mock()
+        summaries.bulk_write.side_effect = BulkWriteError({
+            'writeErrors': [{'index': 2, 'code': 11000, 'errmsg': 'duplicate'}],
+            'nMatched': 0, 'nUpserted': 2,
+        })
+
+        with mock.patch.object(sync.CreditHistory, '_get_collection', return_value=summaries), \
+                mock.patch.object(sync.CreditHistoryBucket, '_get_collection', return_value=buckets), \
+                mock.patch.object(sync, 'track_rollups', side_effect=lambda ids: nullcontext()):
+            # SYNCTEST1 lost history, SYNCTEST2 both; only SYNCTEST0 is complete
+            self.assertEqual(sync.bulk_upsert_credit_histories(records), (1, 2))
+
+    def test_failed_chunk_counts_as_errors(self):
+        from unittest import mock
+        from mongo_credit import sync
+
+        def fetch(national_ids):
+            if 'B1' in national_ids:
+                raise RuntimeError("cluster down")
+            return {national_id: {'national_id': national_id} for national_id in national_ids}
+
+        written = []
+        with mock.patch('mongo_credit.credit_utils.init_mongo_connection'), \
+                mock.patch.object(sync, 'bulk_upsert_credit_histories',
+                                  side_effect=lambda records: written.extend(records) or (len(records), 0)):
+            stats = sync.run_credit_sync(iter([['A1', 'A2'], ['B1', 'B2', 'B3'], ['C1']]), fetch)
+
+        self.assertEqual((stats['synced'], stats['errors'], stats['skipped']), (3, 3, 0))
+        self.assertEqual([record['national_id'] for record in written], ['A1', 'A2', 'C1'])
+
+
+class MFICreditDataBatchTests(TestCase):
+    def test_every_requested_id_gets_an_entry(self):
+        from datetime import datetime
+        from unittest import mock
+        from mongo_credit.credit_utils import get_mfi_credit_data_many
+
+        cursor = mock.MagicMock()
+        cursor.__enter__.return_value = cursor
+        cursor.fetchall.return_value = [
+            ('NID1', 10, 1000, 'active', datetime(2025, 1, 1), datetime(2025, 1, 5), 3, 1),
+            ('NID1', 11, 400, 'closed', datetime(2024, 1, 1), None, 6, 0),
+            ('NID2', 12, 250, 'active', None, None, 0, 0),
+        ]
+        access = mock.Mock()
+        access.table.side_effect = lambda table: f"mfi_a.{table}"
+        access.cursor.return_value = cursor
+
+        data = get_mfi_credit_data_many('mfi_a', ['NID1', 'NID2', 'UNKNOWN', 'NID1'], access)
+
+        cursor.execute.assert_called_once()
+        self.assertEqual(cursor.execute.call_args[0][1], [['NID1', 'NID2', 'UNKNOWN']])
+        self.assertEqual(set(data), {'NID1', 'NID2', 'UNKNOWN'})
+        self.assertEqual((data['NID1']['active_loans'], data['NID1']['total_debt']), (1, 1000.0))
+        self.assertEqual(len(data['NID1']['payment_history']), 2)
+        self.assertIsNone(data['NID2']['payment_history'][0]['application_date'])
+        self.assertEqual(data['UNKNOWN']['payment_history'], [])
+        self.assertEqual(data['UNKNOWN']['active_loans'], 0)
+
+    def test_empty_batch_skips_the_query(self):
+        from unittest import mock
+        from mongo_credit.credit_utils import get_mfi_credit_data_many
+
+        access = mock.Mock()
+        self.assertEqual(get_mfi_credit_data_many('mfi_a', [], access), {})
+        access.cursor.assert_not_called()
+
+
+class IncrementalSyncCommandTests(TestCase):
+    MODULE = 'mongo_credit.management.commands.sync_credit_histories'
+
+    def _run(self, previous, current, force=False, changed_unreadable=(), **overrides):
+        from io import StringIO
+        from unittest import mock
+        from django.core.management import call_command
+
+        marks = {}
+        patches = {
+            'active_cluster_names': mock.Mock(return_value=['mfi_a', 'mfi_b']),
+            'get_watermarks': mock.Mock(return_value=dict(previous)),
+            'capture_watermarks': mock.Mock(return_value=dict(current)),
+            'changed_borrowers': mock.Mock(return_value=('CHANGED', set(changed_unreadable))),
+            'iter_borrower_chunks': mock.Mock(return_value=iter([])),
+            'run_credit_sync': mock.Mock(return_value={
+                'synced': 0, 'skipped': 0, 'errors': 0, 'elapsed': 0.0, 'docs_per_second': 0.0,
+            }),
+            'set_watermark': mock.Mock(side_effect=lambda source, mark: marks.__setitem__(source, mark)),
+            **overrides,
+        }
+        with mock.patch.multiple(self.MODULE, **patches):
+            call_command('sync_credit_histories', force=force, stdout=StringIO())
+        return patches, marks
+
+    def _marks(self, day):
+        from datetime import datetime, timezone
+        return {source: datetime(2025, 1, day, tzinfo=timezone.utc) for source in ('letsema', 'mfi_a', 'mfi_b')}
+
+    def test_incremental_run_selects_changed_borrowers_and_advances(self):
+        patches, marks = self._run(self._marks(1), self._marks(2))
+
+        patches['changed_borrowers'].assert_called_once_with(self._marks(1), ['mfi_a', 'mfi_b'])
+        self.assertEqual(patches['iter_borrower_chunks'].call_args.kwargs['queryset'], 'CHANGED')
+        self.assertEqual(marks, self._marks(2))
+
+    def test_force_rebuilds_everyone(self):
+        patches, marks = self._run(self._marks(1), self._marks(2), force=True)
+
+        patches['changed_borrowers'].assert_not_called()
+        self.assertIsNone(patches['iter_borrower_chunks'].call_args.kwargs['queryset'])
+        self.assertEqual(marks, self._marks(2))
+
+    def test_empty_cluster_keeps_incremental_mode(self):
+        from mongo_credit.sync import NO_DATA_WATERMARK
+
+        current = {**self._marks(2), 'mfi_b': NO_DATA_WATERMARK}
+        _, marks = self._run(self._marks(1), current)
+        self.assertEqual(marks['mfi_b'], NO_DATA_WATERMARK)
+
+        # A stored "no data" mark and a cluster never synced both stay incremental
+        for previous_mark in (NO_DATA_WATERMARK, None):
+            previous = {**self._marks(2), 'mfi_b': previous_mark}
+            patches, _ = self._run(previous, self._marks(3))
+            patches['changed_borrowers'].assert_called_once()
+            self.assertEqual(patches['changed_borrowers'].call_args[0][0]['mfi_b'], NO_DATA_WATERMARK)
+
+    def test_unreachable_cluster_is_not_advanced(self):
+        current = {**self._marks(2), 'mfi_a': None}
+        _, marks = self._run(self._marks(1), current, changed_unreadable={'mfi_b'})
+        self.assertEqual(set(marks), {'letsema'})
+
+    def test_cluster_failing_mid_run_is_repaired_by_the_next_run(self):
+        from unittest import mock
+        from mongo_credit import sync
+
+        stored = self._marks(1)
+        letsema = {'national_id': 'NID1', 'source_scores': {'letsema': 600}}
+        combined = {'national_id': 'NID1', 'source_scores': {'letsema': 600, 'mfi_a': 750}}
+        fetches = mock.Mock(side_effect=[
+            ({'NID1': letsema}, {'mfi_a'}),
+            ({'NID1': combined}, set()),
+        ])
+        written = []
+        overrides = {
+            'get_watermarks': mock.Mock(side_effect=lambda sources: {source: stored[source] for source in sources}),
+            'set_watermark': mock.Mock(side_effect=stored.__setitem__),
+            'iter_borrower_chunks': mock.Mock(side_effect=lambda *args, **kwargs: iter([['NID1']])),
+            'run_credit_sync': sync.run_credit_sync,
+        }
+
+        with mock.patch('mongo_credit.credit_utils.get_combined_credit_data_many', fetches), \
+                mock.patch('mongo_credit.credit_utils.init_mongo_connection'), \
+                mock.patch.object(sync, 'bulk_upsert_credit_histories',
+                                  side_effect=lambda records: written.extend(records) or (len(records), 0)):
+            self._run(stored, self._marks(2), **overrides)
+            self.assertEqual(written, [])
+            self.assertEqual(stored, self._marks(1))
+
+            second, _ = self._run(stored, self._marks(3), **overrides)
+
+        # The second run still looks back to the first run's starting marks
+        second['changed_borrowers'].assert_called_once_with(self._marks(1), ['mfi_a', 'mfi_b'])
+        self.assertEqual(written, [combined])
+        self.assertEqual(stored, self._marks(3))
+
+    def test_capture_maps_empty_sources_to_no_data(self):
+        from unittest import mock
+        from mongo_credit import sync
+
+        cursor = mock.MagicMock()
+        cursor.__enter__.return_value = cursor
+        cursor.fetchone.return_value = (None,)
+        access = mock.Mock()
+        access.table.side_effect = lambda table: f"mfi_a.{table}"
+        access.cursor.return_value = cursor
+
+        with mock.patch.object(sync, 'credit_access', return_value=access):
+            marks = sync.capture_watermarks(['mfi_a'])
+
+        self.assertEqual(marks, {'letsema': sync.NO_DATA_WATERMARK, 'mfi_a': sync.NO_DATA_WATERMARK})
+
+
+class MongoConnectionManagerTests(TestCase):
+    def setUp(self):
+        from mongo_credit import connection
+        self._pid = connection._connected_pid
+        self.addCleanup(setattr, connection, '_connected_pid', self._pid)
+
+    def test_connects_once_per_process_and_after_fork(self):
+        from unittest import mock
+        from mongo_credit import connection
+
+        connection._connected_pid = None
+        with mock.patch.object(connection, 'connect') as connect, \
+                mock.patch.object(connection, 'disconnect') as disconnect, \
+                mock.patch.object(connection, 'get_connection', return_value='client'), \
+                mock.patch.object(connection.os, 'getpid', return_value=100):
+            self.assertEqual(connection.get_mongo_client(), 'client')
+            connection.get_mongo_client()
+            self.assertEqual(connect.call_count, 1)
+            disconnect.assert_not_called()
+            self.assertIn('maxPoolSize', connect.call_args.kwargs)
+
+            # A forked child drops the inherited client and opens its own
+            connection.os.getpid.return_value = 101
+            connection.get_mongo_client()
+            self.assertEqual(connect.call_count, 2)
+            disconnect.assert_called_once_with(alias='default')
+
+    def test_health_reports_errors(self):
+        from unittest import mock
+        from mongo_credit import connection
+
+        with mock.patch.object(connection, 'get_mongo_client', side_effect=RuntimeError('no route')):
+            health = connection.mongo_health()
+        self.assertEqual((health['status'], health['error']), ('error', 'no route'))
+
+    def test_warm_up_only_when_enabled(self):
+        from unittest import mock
+        from django.test import override_settings
+        from mongo_credit import connection
+
+        with mock.patch.object(connection, 'warm_up') as warm_up:
+            with override_settings(MONGO_WARM_UP=False):
+                connection.warm_up_worker()
+            warm_up.assert_not_called()
+            with override_settings(MONGO_WARM_UP=True):
+                connection.warm_up_worker()
+            warm_up.assert_called_once()
+
+    def test_public_health_only_shows_status(self):
+        from unittest import mock
+        from django.contrib.auth import get_user_model
+
+        health = {'status': 'error', 'error': 'auth failed for user x', 'latency_ms': 1.0, 'pid': 1}
+        with mock.patch('mongo_credit.views.mongo_health', return_value=dict(health)):
+            response = self.client.get('/api/credit/health/')
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response.json(), {'status': 'error'})
+
+            admin = get_user_model().objects.create_user(username='health-admin', password='pw', role='ADMIN')
+            self.client.force_login(admin)
+            self.assertEqual(self.client.get('/api/credit/health/').json()['error'], 'auth failed for user x')
@@ -1,10 +1,27 @@
 # urls.py - Add these new routes
 
 from django.urls import path
-from .views import CreditHistoryView, BorrowerCreditHistoryView
+from .views import (
+    BorrowerCreditHistoryEntriesView,
+    BorrowerCreditHistoryView,
+    CreditAnalyticsView,
+    CreditHistoryCacheStatsView,
+    CreditHistoryEntriesView,
+    CreditHistoryExportView,
+    CreditHistorySearchView,
+    CreditHistoryView,
+    MongoHealthView,
+)
 
 urlpatterns = [
     # ... existing routes ...
+    path('search/', CreditHistorySearchView.as_view(), name='credit-history-search'),
     path('credit-history/<str:national_id>/', CreditHistoryView.as_view(), name='credit-history'),
+    path('credit-history/<str:national_id>/<str:kind>/', CreditHistoryEntriesView.as_view(), name='credit-history-entries'),
     path('my-credit-history/', BorrowerCreditHistoryView.as_view(), name='borrower-credit-history'),
+    path('my-credit-history/<str:kind>/', BorrowerCreditHistoryEntriesView.as_view(), name='borrower-credit-history-entries'),
+    path('health/', MongoHealthView.as_view(), name='mongo-health'),
+    path('cache-stats/', CreditHistoryCacheStatsView.as_view(), name='credit-history-cache-stats'),
+    path('analytics/', CreditAnalyticsView.as_view(), name='credit-analytics'),
+    path('export/<str:fmt>/', CreditHistoryExportView.as_view(), name='credit-history-export'),
 ]
\ No newline at end of file
@@ -1,83 +1,187 @@
 from rest_framework import generics, status
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.views import APIView
 from rest_framework.exceptions import NotFound, PermissionDenied
 from django.http import Http404
+from rest_framework.utils.urls import replace_query_param
 from .models import CreditHistory
 from .serializers import CreditHistorySerializer
-from .permissions import IsBorrower, IsAdminOrMFIEmployee
+from .permissions import IsAdmin, IsBorrower, IsAdminOrMFIEmployee
+from .analytics import get_rollups
 from .credit_utils import get_letsema_credit_data, get_combined_credit_data, init_mongo_connection
+from .connection import mongo_health
+from .cache import cache_stats, get_credit_history, reset_cache_stats
+from .exports import CREDIT_HISTORY_COLUMNS, iter_credit_histories
+from .history import HISTORY_KINDS, page_history
+from .search import parse_filters, parse_sort, search_credit_histories
+from .sync import bulk_upsert_credit_histories
+from loans.exports import EXPORT_FORMATS, export_response
 import logging
 
 logger = logging.getLogger(__name__)
 
+def load_credit_history(national_id):
+    """Fetch a credit history from MongoDB, generating and saving it if missing"""
+    # Try to get from MongoDB first
+    try:
+        init_mongo_connection()
+        return CreditHistory.objects.get(national_id=national_id)
+    except CreditHistory.DoesNotExist:
+        logger.info(f"Credit history not found in MongoDB for {national_id}, generating from Letsema")
+        
+        # Generate data from Letsema (and MFIs if available)
+        try:
+            # First try combined data (Letsema + MFIs)
+            credit_data = get_combined_credit_data(national_id)
+            if not credit_data:
+                # Fallback to just Letsema data
+                credit_data = get_letsema_credit_data(national_id)
+            
+            if not credit_data:
+                logger.error(f"No credit data found for {national_id}")
+                raise Http404("Credit history not found")
+                
+            # Source metadata describes this lookup only and is not persisted
+            credit_data.pop('sources', None)
+            if credit_data.pop('partial', False):
+                logger.warning(f"Saving partial credit history for {national_id}")
+
+            # Save the summary and history buckets, then return the summary
+            bulk_upsert_credit_histories([credit_data])
+            return CreditHistory.objects.get(national_id=national_id)
+            
+        except Exception as e:
+            logger.error(f"Failed to generate credit history: {str(e)}")
+            raise Http404("Credit history not found or could not be generated")
+
 class CreditHistoryView(generics.RetrieveAPIView):
     serializer_class = CreditHistorySerializer
     permission_classes = [IsAuthenticated, IsAdminOrMFIEmployee]
     
     def get_object(self):
         national_id = self.kwargs['national_id']
-        
-        # Try to get from MongoDB first
-        try:
-            init_mongo_connection()
-            return CreditHistory.objects.get(national_id=national_id)
-        except CreditHistory.DoesNotExist:
-            logger.info(f"Credit history not found in MongoDB for {national_id}, generating from Letsema")
-            
-            # Generate data from Letsema (and MFIs if available)
-            try:
-                # First try combined data (Letsema + MFIs)
-                credit_data = get_combined_credit_data(national_id)
-                if not credit_data:
-                    # Fallback to just Letsema data
-                    credit_data = get_letsema_credit_data(national_id)
-                
-                if not credit_data:
-                    logger.error(f"No credit data found for {national_id}")
-                    raise Http404("Credit history not found")
-                    
-                # Save to MongoDB and return
-                credit_history = CreditHistory(**credit_data)
-                credit_history.save()
-                return credit_history
-                
-            except Exception as e:
-                logger.error(f"Failed to generate credit history: {str(e)}")
-                raise Http404("Credit history not found or could not be generated")
+        return get_credit_history(national_id, lambda: load_credit_history(national_id))
 
 class BorrowerCreditHistoryView(generics.RetrieveAPIView):
     serializer_class = CreditHistorySerializer
     permission_classes = [IsAuthenticated, IsBorrower]
     
     def get_object(self):
-        user = self.request.user
-        national_id = user.borrower_profile.national_id
-        
-        # Try to get from MongoDB first
+        national_id = self.request.user.borrower_profile.national_id
+        return get_credit_history(national_id, lambda: load_credit_history(national_id))
+
+class CreditHistoryEntriesView(APIView):
+    """
+    Page through a borrower's payment or inquiry entries, newest first:
+    {"results": [...], "next": url}. ?limit= sets the page size.
+    """
+    permission_classes = [IsAuthenticated, IsAdminOrMFIEmployee]
+    default_limit = 50
+    max_limit = 500
+
+    def get_national_id(self):
+        return self.kwargs['national_id']
+
+    def get(self, request, kind, **kwargs):
+        if kind not in HISTORY_KINDS:
+            raise NotFound()
         try:
-            init_mongo_connection()
-            return CreditHistory.objects.get(national_id=national_id)
-        except CreditHistory.DoesNotExist:
-            logger.info(f"Credit history not found in MongoDB for user {user.id}, generating from Letsema")
-            
-            # Generate data from Letsema (and MFIs if available)
-            try:
-                # First try combined data (Letsema + MFIs)
-                credit_data = get_combined_credit_data(national_id)
-                if not credit_data:
-                    # Fallback to just Letsema data
-                    credit_data = get_letsema_credit_data(national_id)
-                
-                if not credit_data:
-                    logger.error(f"No credit data found for {national_id}")
-                    raise Http404("Credit history not found")
-                    
-                # Save to MongoDB and return
-                credit_history = CreditHistory(**credit_data)
-                credit_history.save()
-                return credit_history
-                
-            except Exception as e:
-                logger.error(f"Failed to generate credit history: {str(e)}")
-                raise Http404("Credit history not found or could not be generated")
\ No newline at end of file
+            limit = max(1, min(int(request.query_params.get('limit', self.default_limit)), self.max_limit))
+        except ValueError:
+            return Response({"error": "Invalid limit"}, status=status.HTTP_400_BAD_REQUEST)
+
+        init_mongo_connection()
+        try:
+            entries, cursor = page_history(
+                self.get_national_id(), kind, request.query_params.get('cursor'), limit
+            )
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        next_url = replace_query_param(request.build_absolute_uri(), 'cursor', cursor) if cursor else None
+        return Response({'results': entries, 'next': next_url})
+
+class CreditHistorySearchView(APIView):
+    """
+    Search credit history summaries by score, update time, active loans or
+    total debt ranges, keyset paginated: {"results": [...], "next": url}.
+    ?sort= orders by one of the filter fields, '-' prefixed for descending.
+    """
+    permission_classes = [IsAuthenticated, IsAdminOrMFIEmployee]
+    default_limit = 50
+    max_limit = 500
+
+    def get(self, request):
+        params = request.query_params
+        try:
+            limit = max(1, min(int(params.get('limit', self.default_limit)), self.max_limit))
+            query = parse_filters(params)
+            field, direction = parse_sort(params.get('sort'), query)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        init_mongo_connection()
+        try:
+            documents, cursor = search_credit_histories(query, field, direction, params.get('cursor'), limit)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        next_url = replace_query_param(request.build_absolute_uri(), 'cursor', cursor) if cursor else None
+        return Response({
+            'results': CreditHistorySerializer(documents, many=True).data,
+            'next': next_url,
+        })
+
+class BorrowerCreditHistoryEntriesView(CreditHistoryEntriesView):
+    permission_classes = [IsAuthenticated, IsBorrower]
+
+    def get_national_id(self):
+        return self.request.user.borrower_profile.national_id
+
+class CreditHistoryCacheStatsView(APIView):
+    """Hit/miss counters of the credit history cache"""
+    permission_classes = [IsAuthenticated, IsAdmin]
+
+    def get(self, request):
+        return Response(cache_stats())
+
+    def delete(self, request):
+        reset_cache_stats()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+class MongoHealthView(APIView):
+    """
+    Health probe for the process' MongoDB connection. Anonymous callers only
+    get the status; latency, pool settings and errors are for admins.
+    """
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        health = mongo_health()
+        code = status.HTTP_200_OK if health['status'] == 'ok' else status.HTTP_503_SERVICE_UNAVAILABLE
+        if not IsAdmin().has_permission(request, self):
+            health = {'status': health['status']}
+        return Response(health, status=code)
+
+class CreditAnalyticsView(APIView):
+    """
+    Precomputed score histograms, loan totals per status and MFI, and
+    portfolio at risk, keyed by scope ('all', 'letsema' and each cluster).
+    ?scope= narrows to one or more comma separated scopes.
+    """
+    permission_classes = [IsAuthenticated, IsAdmin]
+
+    def get(self, request):
+        scopes = [scope for scope in request.query_params.get('scope', '').split(',') if scope]
+        init_mongo_connection()
+        return Response(get_rollups(scopes))
+
+class CreditHistoryExportView(APIView):
+    """Stream all credit histories as NDJSON or CSV"""
+    permission_classes = [IsAuthenticated, IsAdmin]
+
+    def get(self, request, fmt):
+        if fmt not in EXPORT_FORMATS:
+            return Response({"error": "Invalid format"}, status=status.HTTP_400_BAD_REQUEST)
+        return export_response(iter_credit_histories(), CREDIT_HISTORY_COLUMNS, fmt, 'credit_histories')
@@ -232,8 +232,8 @@ const Dashboard = () => {
 
     const fetchLoanApplications = async () => {
       try {
-        const response = await apiClient.get("loans/")
-        const data = response
+        // The list endpoint is paginated: { next, results }
+        const data = await apiClient.getAll("loans/", { expand: "borrower", page_size: 200 })
         if (Array.isArray(data)) {
           setLoanApplications(data)
           setLoansData(data)
@@ -342,8 +342,7 @@ const Dashboard = () => {
 
   const refreshLoansData = async () => {
     try {
-      const response = await apiClient.get("loans/")
-      const data = response
+      const data = await apiClient.getAll("loans/", { expand: "borrower", page_size: 200 })
       if (Array.isArray(data)) {
         setLoanApplications(data)
         setLoansData(data)
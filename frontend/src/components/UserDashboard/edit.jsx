@@ -82,7 +82,7 @@ const UserDashboard = () => {
 
       try {
         setLoanLoading(true);
-        const data = await apiClient.get("loans/");
+        const data = await apiClient.getAll("loans/", { expand: "mfi", page_size: 200 });
         setLoanApplications(data);
       } catch (err) {
         setLoanError(err.message);
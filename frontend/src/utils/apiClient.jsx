@@ -128,6 +128,20 @@ const apiClient = {
     return apiClient.request(url, { method: "GET" });
   },
 
+  // Follow the `next` links of a paginated ({ next, results }) list
+  getAll: async (endpoint, params = {}) => {
+    let page = await apiClient.get(endpoint, params);
+    if (!page || !Array.isArray(page.results)) {
+      return page;
+    }
+    const results = [...page.results];
+    while (page.next) {
+      page = await apiClient.get(page.next);
+      results.push(...page.results);
+    }
+    return results;
+  },
+
   post: (endpoint, data) =>
     apiClient.request(endpoint, {
       method: "POST",